@@ -13,4 +13,16 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported after Django is set up, it loads models
+from backend.push import notification_stream  # noqa: E402
+
+EVENT_STREAM_PATH = '/events/notifications/'
+
+
+async def application(scope, receive, send):
+    """Serves the notification event stream natively, everything else through Django."""
+    if scope['type'] == 'http' and scope['path'] == EVENT_STREAM_PATH:
+        return await notification_stream(scope, receive, send)
+    return await django_application(scope, receive, send)
@@ -18,10 +18,26 @@ app.autodiscover_tasks()
 def debug_task(self):
     print(f'Request: {self.request!r}')
 
-# Define a periodic task to print something every minute
+# Periodic tasks
 app.conf.beat_schedule = {
-    'print-every-minute': {
-        'task': 'users.tasks.simple_print_task',  # This refers to the task defined in tasks.py
-        'schedule': crontab(minute='*'),  # Run the task every minute
+    'sweep-expired-records': {
+        'task': 'orders.tasks.sweep_expired_records',
+        'schedule': crontab(minute='*/5'),  # Expire payment windows, stale orders and links every 5 minutes
     },
-}
\ No newline at end of file
+    'archive-closed-orders': {
+        'task': 'orders.tasks.archive_orders',
+        'schedule': crontab(hour=3, minute=0),  # Nightly, outside business hours
+    },
+    'snapshot-stock': {
+        'task': 'stocks.tasks.snapshot_stock',
+        'schedule': crontab(hour=0, minute=30),  # Balances as of midnight
+    },
+    'requeue-expired-qc-leases': {
+        'task': 'stocks.tasks.requeue_expired_qc_leases',
+        'schedule': crontab(minute='*/2'),  # Abandoned claims are back in the queue within minutes
+    },
+    'analyze-stock-health': {
+        'task': 'stocks.tasks.analyze_stock_health',
+        'schedule': crontab(hour=6, minute=0),  # Daily digest before the working day
+    },
+}
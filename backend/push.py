@@ -0,0 +1,219 @@
+"""
+Server-sent events endpoint for notification pushes.
+
+Every ASGI process keeps one Redis subscription to `settings.EVENTS_CHANNEL`
+and fans incoming events out to the in-process queues of the connected users,
+so an idle client costs a coroutine and a small queue, not a Redis connection.
+"""
+import asyncio
+import json
+import logging
+import re
+from urllib.parse import parse_qs
+
+import redis.asyncio as aioredis
+from asgiref.sync import sync_to_async
+from corsheaders.defaults import default_headers
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from orders.events import stream_ticket_key
+from orders.inbox import unread_count
+from users.models import User
+
+logger = logging.getLogger(__name__)
+
+# Events kept for a client that is not reading, older ones are dropped
+CLIENT_QUEUE_SIZE = 100
+
+# Seconds browsers may reuse the answer to a CORS preflight
+PREFLIGHT_MAX_AGE = 86400
+
+
+class EventBroker:
+    """Process-wide Redis subscriber dispatching events to per-user queues."""
+
+    def __init__(self):
+        self.queues = {}
+        self.listener = None
+
+    def subscribe(self, user_id):
+        queue = asyncio.Queue(maxsize=CLIENT_QUEUE_SIZE)
+        self.queues.setdefault(user_id, set()).add(queue)
+        if self.listener is None or self.listener.done():
+            self.listener = asyncio.get_running_loop().create_task(self.listen())
+        return queue
+
+    def unsubscribe(self, user_id, queue):
+        queues = self.queues.get(user_id, set())
+        queues.discard(queue)
+        if not queues:
+            self.queues.pop(user_id, None)
+
+    def dispatch(self, message):
+        payload = json.loads(message)
+        event = {'event': payload['event'], 'data': payload['data']}
+        for user_id in payload['users']:
+            for queue in self.queues.get(user_id, ()):
+                if queue.full():
+                    queue.get_nowait()
+                queue.put_nowait(event)
+
+    async def listen(self):
+        delay = 1
+        while self.queues:
+            client = aioredis.Redis.from_url(settings.REDIS_URL)
+            try:
+                async with client.pubsub() as pubsub:
+                    await pubsub.subscribe(settings.EVENTS_CHANNEL)
+                    delay = 1
+                    async for message in pubsub.listen():
+                        if message['type'] == 'message':
+                            self.dispatch(message['data'])
+                        if not self.queues:
+                            break
+            except (aioredis.RedisError, OSError) as e:
+                logger.warning("Notification event subscription lost, retrying in %ss: %s", delay, e)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30)
+            finally:
+                await client.aclose()
+
+
+broker = EventBroker()
+
+
+def get_header(scope, name):
+    for key, value in scope.get('headers', []):
+        if key == name:
+            return value.decode('latin1')
+    return None
+
+
+def get_token(scope):
+    parts = (get_header(scope, b'authorization') or '').split()
+    if len(parts) == 2 and parts[0] in jwt_settings.AUTH_HEADER_TYPES:
+        return parts[1]
+    return None
+
+
+async def redeem_ticket(scope):
+    """User ID of the one-time ticket in ?ticket=, EventSource cannot set headers. A ticket opens one stream."""
+    ticket = parse_qs(scope.get('query_string', b'').decode('latin1')).get('ticket', [None])[0]
+    if not ticket:
+        return None
+    user_id = await cache.aget(stream_ticket_key(ticket))
+    # Of concurrent redemptions only the one that deletes the ticket gets through
+    if user_id is None or not await cache.adelete(stream_ticket_key(ticket)):
+        return None
+    return user_id
+
+
+async def authenticate(scope):
+    token = get_token(scope)
+    if token:
+        try:
+            user_id = AccessToken(token)[jwt_settings.USER_ID_CLAIM]
+        except (TokenError, KeyError):
+            return None
+        return await User.objects.filter(**{jwt_settings.USER_ID_FIELD: user_id, 'is_active': True}).afirst()
+
+    user_id = await redeem_ticket(scope)
+    if user_id is None:
+        return None
+    return await User.objects.filter(pk=user_id, is_active=True).afirst()
+
+
+def cors_headers(scope):
+    """
+    CORS headers for the request's Origin. The stream is served on its own
+    port, so it is cross-origin for the web app and follows the same
+    CORS_* settings django-cors-headers applies to the API.
+    """
+    origin = get_header(scope, b'origin')
+    if origin is None:
+        return []
+    allowed = (
+        getattr(settings, 'CORS_ALLOW_ALL_ORIGINS', False)
+        or origin in getattr(settings, 'CORS_ALLOWED_ORIGINS', ())
+        or any(re.match(pattern, origin) for pattern in getattr(settings, 'CORS_ALLOWED_ORIGIN_REGEXES', ()))
+    )
+    if not allowed:
+        return [(b'vary', b'origin')]
+    return [(b'access-control-allow-origin', origin.encode('latin1')), (b'vary', b'origin')]
+
+
+async def preflight(scope, send):
+    headers = cors_headers(scope)
+    if any(name == b'access-control-allow-origin' for name, _ in headers):
+        allow_headers = list(getattr(settings, 'CORS_ALLOW_HEADERS', default_headers)) + ['last-event-id', 'cache-control']
+        headers += [
+            (b'access-control-allow-methods', b'GET, OPTIONS'),
+            (b'access-control-allow-headers', ', '.join(allow_headers).encode('latin1')),
+            (b'access-control-max-age', str(PREFLIGHT_MAX_AGE).encode('latin1')),
+        ]
+    await send({'type': 'http.response.start', 'status': 200, 'headers': headers + [(b'content-length', b'0')]})
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+def format_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n".encode('utf-8')
+
+
+async def notification_stream(scope, receive, send):
+    """ASGI app streaming the authenticated user's notification events."""
+    if scope.get('method') == 'OPTIONS':
+        return await preflight(scope, send)
+
+    user = await authenticate(scope)
+    if user is None:
+        await send({'type': 'http.response.start', 'status': 401, 'headers': [(b'content-type', b'application/json')] + cors_headers(scope)})
+        await send({'type': 'http.response.body', 'body': b'{"error": "Authentication credentials were not provided."}'})
+        return
+
+    queue = broker.subscribe(user.pk)
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream'),
+                (b'cache-control', b'no-cache'),
+                # Stop nginx from buffering the stream
+                (b'x-accel-buffering', b'no'),
+            ] + cors_headers(scope),
+        })
+        # Current count first, so a reconnecting client does not have to poll
+        count = await sync_to_async(unread_count)(user)
+        await send({'type': 'http.response.body', 'body': format_event('unread_count', {'count': count}), 'more_body': True})
+
+        disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+        try:
+            while not disconnected.done():
+                next_event = asyncio.ensure_future(queue.get())
+                done, _ = await asyncio.wait(
+                    {next_event, disconnected}, timeout=settings.EVENTS_HEARTBEAT_INTERVAL, return_when=asyncio.FIRST_COMPLETED
+                )
+                if next_event in done:
+                    event = next_event.result()
+                    body = format_event(event['event'], event['data'])
+                else:
+                    next_event.cancel()
+                    # Keep-alive comment so proxies do not close an idle stream
+                    body = b": ping\n\n"
+                if not disconnected.done():
+                    await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+        finally:
+            disconnected.cancel()
+    finally:
+        broker.unsubscribe(user.pk, queue)
+
+
+async def wait_for_disconnect(receive):
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
@@ -193,13 +193,32 @@ SESSION_SAVE_EVERY_REQUEST = True
 
 PASSWORD_RESET_TIMEOUT = 86400  # 24 hours
 
-CELERY_BROKER_URL = 'redis://redis:6379/0'
-CELERY_RESULT_BACKEND = 'redis://redis:6379/0'
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
+
+CELERY_BROKER_URL = REDIS_URL
+CELERY_RESULT_BACKEND = REDIS_URL
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'UTC'
 
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.getenv("CACHE_URL", "redis://redis:6379/1"),
+    }
+}
+
+# Redis pub/sub channel carrying notification events to the ASGI push endpoint
+EVENTS_CHANNEL = os.getenv("EVENTS_CHANNEL", "notification-events")
+# Seconds between keep-alive comments on idle event streams
+EVENTS_HEARTBEAT_INTERVAL = int(os.getenv("EVENTS_HEARTBEAT_INTERVAL", 15))
+# Seconds a one-time event stream ticket can be used to open the stream
+EVENTS_TICKET_TIMEOUT = int(os.getenv("EVENTS_TICKET_TIMEOUT", 30))
+
+# Seconds an analytics response stays cached for the same query
+ANALYTICS_CACHE_TIMEOUT = int(os.getenv("ANALYTICS_CACHE_TIMEOUT", 300))
+
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
         "rest_framework_simplejwt.authentication.JWTAuthentication",
@@ -223,8 +242,54 @@ NUMBER_OF_IMAGE_PER_PRODUCT = 6
 
 PAGE_LIMIT = 10
 
+# Rows changed per UPDATE by the expiry sweep
+SWEEP_BATCH_SIZE = int(os.getenv("SWEEP_BATCH_SIZE", 1000))
+# Unapproved, unpaid orders older than this many days are canceled by the sweep
+STALE_ORDER_DAYS = int(os.getenv("STALE_ORDER_DAYS", 30))
+
+# Closed orders without activity for this many months are moved to the archive tables
+ARCHIVE_AFTER_MONTHS = int(os.getenv("ARCHIVE_AFTER_MONTHS", 12))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", 500))
+
+# Days of sales the stock velocity is averaged over
+STOCK_VELOCITY_DAYS = int(os.getenv("STOCK_VELOCITY_DAYS", 30))
+# Variants selling out within this many days are flagged as low stock
+LOW_STOCK_COVER_DAYS = int(os.getenv("LOW_STOCK_COVER_DAYS", 14))
+# Variants held without a sale for this many days are flagged as dead stock
+DEAD_STOCK_DAYS = int(os.getenv("DEAD_STOCK_DAYS", 90))
+
+# Seconds an inspector holds claimed QC checks before they return to the queue
+QC_LEASE_SECONDS = int(os.getenv("QC_LEASE_SECONDS", 1800))
+# Most QC checks claimed in one request
+QC_CLAIM_MAX = int(os.getenv("QC_CLAIM_MAX", 50))
+
+# Most scanned codes accepted in one stock take upload
+STOCK_TAKE_BATCH_LIMIT = int(os.getenv("STOCK_TAKE_BATCH_LIMIT", 5000))
+
+# Seconds proxies and browsers may reuse the public in-stock listing
+STOCK_LISTING_MAX_AGE = int(os.getenv("STOCK_LISTING_MAX_AGE", 60))
+# Seconds a stock change waits before the listing is re-rendered, changes in between render once
+STOCK_LISTING_REFRESH_DELAY = int(os.getenv("STOCK_LISTING_REFRESH_DELAY", 5))
+# Seconds a listing page rendered by a request, while the published one was missing, is kept
+STOCK_LISTING_CACHE_TIMEOUT = int(os.getenv("STOCK_LISTING_CACHE_TIMEOUT", 3600))
+
+# Worker processes the export_invoices command renders invoices with
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", os.cpu_count() or 2))
+
 RAZORPAY_KEY_ID = os.getenv("RAZORPAY_KEY_ID")
 RAZORPAY_KEY_SECRET = os.getenv("RAZORPAY_KEY_SECRET")
+RAZORPAY_WEBHOOK_SECRET = os.getenv("RAZORPAY_WEBHOOK_SECRET")
+# Point at the local fake gateway (python manage.py fake_razorpay) to test payments offline
+RAZORPAY_BASE_URL = os.getenv("RAZORPAY_BASE_URL", "https://api.razorpay.com")
+# Use "orders.gateway.StubRazorpayGateway" to run without any network calls
+RAZORPAY_GATEWAY_CLASS = os.getenv("RAZORPAY_GATEWAY_CLASS", "orders.gateway.RazorpayGateway")
+RAZORPAY_CONNECT_TIMEOUT = float(os.getenv("RAZORPAY_CONNECT_TIMEOUT", 3))
+RAZORPAY_READ_TIMEOUT = float(os.getenv("RAZORPAY_READ_TIMEOUT", 10))
+RAZORPAY_POOL_SIZE = int(os.getenv("RAZORPAY_POOL_SIZE", 10))
+RAZORPAY_MAX_RETRIES = int(os.getenv("RAZORPAY_MAX_RETRIES", 2))
+RAZORPAY_RETRY_BACKOFF = float(os.getenv("RAZORPAY_RETRY_BACKOFF", 0.5))
+RAZORPAY_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("RAZORPAY_CIRCUIT_FAILURE_THRESHOLD", 5))
+RAZORPAY_CIRCUIT_RESET_TIMEOUT = float(os.getenv("RAZORPAY_CIRCUIT_RESET_TIMEOUT", 30))
 
 # Google login
 SOCIAL_SECRET = os.getenv("SOCIAL_SECRET")
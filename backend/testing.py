@@ -0,0 +1,61 @@
+import shutil
+import tempfile
+from django.test import TestCase, override_settings
+from product.models import BrandType, Employee, Product, ProductStyle, ProductType, ProductVariant
+from stocks.models import Stock
+from users.models import User
+
+
+def create_employees(count):
+    return [
+        Employee.objects.create(first_name=f"Inspector {i}", email=f"inspector{i}@example.com", phone_number=f"+1212555240{i}", job_title=f"Inspector {i}")
+        for i in range(count)
+    ]
+
+
+class CatalogTestCase(TestCase):
+    """
+    Test case with an admin, a customer and `variant_count` variants, each of
+    its own active product, created once for the whole class. Variants in
+    stock hold `variant_quantity` units, received into their Stock rows;
+    the others wait for quality check with those units QC pending.
+    """
+    variant_count = 1
+    variant_quantity = 1
+    in_stock = True
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(email="admin@example.com", password="password", phone_number="+12125552368")
+        cls.buyer = User.objects.create_user(email="buyer@example.com", password="password", phone_number="+12125552369")
+        product_type = ProductType.objects.create(name="Ring")
+        product_brand = BrandType.objects.create(name="Classic")
+        product_style = ProductStyle.objects.create(name="Solitaire")
+        cls.variants = [
+            ProductVariant.objects.create(
+                product=Product.objects.create(
+                    code=f"R{i}", product_type=product_type, product_brand=product_brand,
+                    product_style=product_style, image="product.png", status=Product.ACTIVE,
+                ),
+                image="variant.png", carat=18, price=100.0 * (i + 1), quantity=cls.variant_quantity, weight=2.5, is_stock=cls.in_stock,
+            )
+            for i in range(cls.variant_count)
+        ]
+        cls.variant = cls.variants[0]
+        if cls.in_stock:
+            # As the stock ledger would have projected the received units
+            Stock.objects.filter(product_variant__in=cls.variants).update(on_hand=cls.variant_quantity, available=cls.variant_quantity)
+        else:
+            Stock.objects.filter(product_variant__in=cls.variants).update(qc_pending=cls.variant_quantity)
+
+
+class TemporaryMediaMixin:
+    """Stores the files written by each test in an empty MEDIA_ROOT removed afterwards."""
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
@@ -8,7 +8,7 @@ from django.views.static import serve
 from drf_yasg import openapi
 from drf_yasg.views import get_schema_view
 from rest_framework import permissions
-from orders.views import SendPaymentRequest, DeleteNotification, ApproveNotificationAPIView, NotificationCountAPIView
+from orders.views import SendPaymentRequest, DeleteNotification, ApproveNotificationAPIView, NotificationCountAPIView, EventStreamTicketAPIView
 from users.views import GoogleSocialAuthView, ContactUsAPIView
 
 schema_view = get_schema_view(
@@ -30,6 +30,7 @@ urlpatterns = [
     path('approve-order-payment-notification/<int:id>/', ApproveNotificationAPIView.as_view(), name='notification-list-create'),
     path('notifications/<int:notification_id>/', DeleteNotification.as_view(), name='delete-notification'),
     path('notifications/count/', NotificationCountAPIView.as_view(), name='notification-count'),
+    path('notifications/stream-ticket/', EventStreamTicketAPIView.as_view(), name='notification-stream-ticket'),
     path('login-with-google/', GoogleSocialAuthView.as_view(), name="login-with-google"),
     path('contact-us/', ContactUsAPIView.as_view(), name="contact-us"),
     re_path(r"^media/(?P<path>.*)$", serve, {"document_root": settings.MEDIA_ROOT}),
@@ -1,7 +1,9 @@
 import os
 import uuid
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from django.conf import settings
+from django.db import connection, connections
 from django.core.exceptions import ValidationError
 from functools import wraps
 from rest_framework.response import Response
@@ -67,3 +69,44 @@ def superuser_required(func):
         return func(self, request, *args, **kwargs)
 
     return wrapped_view
+
+
+def _setup_django_worker():
+    import django
+    django.setup()
+
+
+def django_process_pool(max_workers=None):
+    """
+    Process pool for CPU-bound rendering. Database connections are closed
+    before the workers start so that no process shares a connection socket,
+    each worker opens its own on first query.
+    """
+    connections.close_all()
+    return ProcessPoolExecutor(max_workers=max_workers or settings.RENDER_WORKERS, initializer=_setup_django_worker)
+
+
+def bulk_increment(model, rows, unique_fields, increment_fields):
+    """
+    Upserts `rows` (dicts of field name -> value) into `model`. Rows whose
+    `unique_fields` already exist get `increment_fields` added to the stored
+    values in the same statement, so concurrent writers never lose counts.
+    """
+    if not rows:
+        return
+
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    fields = list(rows[0].keys())
+    columns = [quote(model._meta.get_field(name).column) for name in fields]
+    conflict = [quote(model._meta.get_field(name).column) for name in unique_fields]
+    updates = [
+        f"{column} = {table}.{column} + EXCLUDED.{column}"
+        for column in (quote(model._meta.get_field(name).column) for name in increment_fields)
+    ]
+    sql = (
+        f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))}) "
+        f"ON CONFLICT ({', '.join(conflict)}) DO UPDATE SET {', '.join(updates)}"
+    )
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, [[row[name] for name in fields] for row in rows])
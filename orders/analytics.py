@@ -0,0 +1,136 @@
+import hashlib
+import json
+from datetime import timedelta
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Sum
+from django.db.models.functions import Trunc
+from .models import DailySalesRollup, SALES_CUBE_VERSION_KEY
+
+GRANULARITIES = ('day', 'week', 'month')
+
+# Query parameter -> rollup column the series are split by
+SPLIT_FIELDS = {
+    'product_type': 'product_type__name',
+    'product_brand': 'product_brand__name',
+    'product_category': 'product_category',
+    'carat': 'carat',
+}
+
+
+def bucket_start(day, granularity):
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    if granularity == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def bucket_periods(start_date, end_date, granularity):
+    """Every bucket between the two dates, so periods without sales show up as zeros."""
+    periods = []
+    current = bucket_start(start_date, granularity)
+    while current <= end_date:
+        periods.append(current)
+        if granularity == 'month':
+            current = (current.replace(day=28) + timedelta(days=4)).replace(day=1)
+        else:
+            current += timedelta(days=7 if granularity == 'week' else 1)
+    return periods
+
+
+def _to_list(values):
+    # JSON has no NaN, undefined changes (no previous sales) become null
+    return np.where(np.isnan(values), None, np.round(values, 2)).tolist()
+
+
+def build_time_series(rows, periods, window):
+    """
+    Turns (period, key, units, revenue) rows into dense per-series arrays and
+    computes period-over-period changes and trailing moving averages.
+    """
+    keys = sorted({row[1] for row in rows}, key=str)
+    period_index = {period: index for index, period in enumerate(periods)}
+    key_index = {key: index for index, key in enumerate(keys)}
+
+    shape = (len(keys), len(periods))
+    units = np.zeros(shape)
+    revenue = np.zeros(shape)
+    if rows:
+        rows_key = np.fromiter((key_index[row[1]] for row in rows), dtype=np.intp, count=len(rows))
+        rows_period = np.fromiter((period_index[row[0]] for row in rows), dtype=np.intp, count=len(rows))
+        np.add.at(units, (rows_key, rows_period), np.fromiter((row[2] for row in rows), dtype=float, count=len(rows)))
+        np.add.at(revenue, (rows_key, rows_period), np.fromiter((row[3] for row in rows), dtype=float, count=len(rows)))
+
+    def change(values):
+        previous = np.concatenate([np.full((len(keys), 1), np.nan), values[:, :-1]], axis=1)
+        delta = values - previous
+        with np.errstate(divide='ignore', invalid='ignore'):
+            percent = np.where(previous > 0, delta / previous * 100, np.nan)
+        return delta, percent
+
+    def moving_average(values):
+        cumulative = np.cumsum(values, axis=1)
+        shifted = np.zeros_like(cumulative)
+        shifted[:, window:] = cumulative[:, :-window]
+        counts = np.minimum(np.arange(1, len(periods) + 1), window)
+        return (cumulative - shifted) / counts
+
+    units_change, units_change_percent = change(units)
+    revenue_change, revenue_change_percent = change(revenue)
+    units_average = moving_average(units)
+    revenue_average = moving_average(revenue)
+
+    return [
+        {
+            'key': key,
+            'units': _to_list(units[index]),
+            'revenue': _to_list(revenue[index]),
+            'units_total': float(units[index].sum()),
+            'revenue_total': round(float(revenue[index].sum()), 2),
+            'units_change': _to_list(units_change[index]),
+            'units_change_percent': _to_list(units_change_percent[index]),
+            'revenue_change': _to_list(revenue_change[index]),
+            'revenue_change_percent': _to_list(revenue_change_percent[index]),
+            'units_moving_average': _to_list(units_average[index]),
+            'revenue_moving_average': _to_list(revenue_average[index]),
+        }
+        for key, index in key_index.items()
+    ]
+
+
+def sales_time_series(start_date, end_date, granularity='day', split_by=None, window=7):
+    """
+    Units and revenue per period from the daily sales rollup, optionally split
+    by one dimension. Cached per query shape until new sales are recorded.
+    """
+    version = cache.get_or_set(SALES_CUBE_VERSION_KEY, 1, timeout=None)
+    shape = json.dumps([str(start_date), str(end_date), granularity, split_by, window])
+    cache_key = f"sales-timeseries:{version}:{hashlib.md5(shape.encode('utf-8')).hexdigest()}"
+
+    data = cache.get(cache_key)
+    if data is not None:
+        return data
+
+    key_field = SPLIT_FIELDS.get(split_by)
+    rollups = DailySalesRollup.objects.filter(date__range=[start_date, end_date]) \
+        .annotate(period=Trunc('date', granularity)) \
+        .values('period', *([key_field] if key_field else [])) \
+        .annotate(units=Sum('quantity'), sales=Sum('revenue')) \
+        .order_by()
+    rows = [
+        (row['period'], row[key_field] if key_field else 'total', row['units'], row['sales'])
+        for row in rollups
+    ]
+
+    periods = bucket_periods(start_date, end_date, granularity)
+    data = {
+        'granularity': granularity,
+        'split_by': split_by,
+        'window': window,
+        'periods': [period.isoformat() for period in periods],
+        'series': build_time_series(rows, periods, window),
+    }
+    cache.set(cache_key, data, timeout=settings.ANALYTICS_CACHE_TIMEOUT)
+    return data
@@ -0,0 +1,150 @@
+import heapq
+import logging
+from itertools import islice
+from operator import attrgetter
+from dateutil.relativedelta import relativedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from .inbox import unread_key
+from .models import (
+    Order, OrderItem, Selling, Notification, NotificationRecipient,
+    ArchivedOrder, ArchivedOrderItem, ArchivedSelling, ArchivedNotification,
+)
+
+logger = logging.getLogger(__name__)
+
+# Live model -> archive table it is moved to, children before their order when deleting
+ARCHIVED_CHILDREN = (
+    (OrderItem, ArchivedOrderItem),
+    (Selling, ArchivedSelling),
+    (Notification, ArchivedNotification),
+)
+
+
+def month_start(moment):
+    return timezone.localtime(moment).date().replace(day=1)
+
+
+def _copy(instance, archive_model, archive_month):
+    values = {
+        field.attname: getattr(instance, field.attname)
+        for field in archive_model._meta.concrete_fields
+        if hasattr(instance, field.attname)
+    }
+    return archive_model(archive_month=archive_month, **values)
+
+
+def closed_orders(months=None):
+    """Delivered, canceled or deleted orders without any activity for `months` months."""
+    months = months if months is not None else settings.ARCHIVE_AFTER_MONTHS
+    cutoff = timezone.now() - relativedelta(months=months)
+    return Order.all_objects.filter(
+        Q(status__in=[Order.DELIVERED, Order.CANCELED]) | Q(is_deleted=True),
+        updated_at__lt=cutoff,
+    )
+
+
+def archive_batch(orders):
+    """
+    Copies one batch of orders with their items, sellings and notifications
+    into the archive tables and deletes them from the live tables, atomically.
+    """
+    order_ids = [order.pk for order in orders]
+    months = {order.pk: month_start(order.created_at or timezone.now()) for order in orders}
+
+    ArchivedOrder.objects.bulk_create([_copy(order, ArchivedOrder, months[order.pk]) for order in orders], ignore_conflicts=True)
+    for model, archive_model in ARCHIVED_CHILDREN:
+        rows = model.objects.filter(order_id__in=order_ids)
+        archive_model.objects.bulk_create(
+            [_copy(row, archive_model, months[row.order_id]) for row in rows],
+            ignore_conflicts=True,
+        )
+
+    # Inbox entries are not archived, the counters of users who had them unread are reloaded
+    recipients = NotificationRecipient.objects.filter(notification__order_id__in=order_ids)
+    unread_users = set(recipients.filter(is_read=False).values_list('user_id', flat=True))
+    recipients.delete()
+    for model, _ in ARCHIVED_CHILDREN:
+        model.objects.filter(order_id__in=order_ids).delete()
+    Order.all_objects.filter(pk__in=order_ids).delete()
+
+    if unread_users:
+        transaction.on_commit(lambda: cache.delete_many([unread_key(user_id) for user_id in unread_users]))
+    return len(order_ids)
+
+
+def archive_closed_orders(months=None, batch_size=None):
+    """Moves every closed order older than `months` to the archive, one batch per transaction."""
+    batch_size = batch_size or settings.ARCHIVE_BATCH_SIZE
+    candidates = closed_orders(months).order_by('pk')
+
+    archived = 0
+    while True:
+        with transaction.atomic():
+            # Rows locked by a request in flight are picked up by the next run
+            orders = list(candidates.select_for_update(skip_locked=True)[:batch_size])
+            if not orders:
+                break
+            archived += archive_batch(orders)
+        logger.info("Archived %s closed orders so far", archived)
+    return archived
+
+
+class LiveAndArchivedOrders:
+    """
+    Live orders and archived ones read as one list. Filters are applied to
+    both tables; a slice reads each table up to its end, in the same order,
+    and merges the rows, so the keyset pagination still runs on the indexes
+    of both tables. Archived orders keep their IDs, no order is in both.
+    """
+
+    def __init__(self, *querysets, ordering=('-created_at', '-id')):
+        self.querysets = querysets
+        self.ordering = ordering
+
+    def filter(self, *args, **kwargs):
+        return LiveAndArchivedOrders(*(queryset.filter(*args, **kwargs) for queryset in self.querysets), ordering=self.ordering)
+
+    def select_related(self, *fields):
+        return LiveAndArchivedOrders(*(queryset.select_related(*fields) for queryset in self.querysets), ordering=self.ordering)
+
+    def order_by(self, *ordering):
+        return LiveAndArchivedOrders(*(queryset.order_by(*ordering) for queryset in self.querysets), ordering=ordering)
+
+    def values_list(self, *fields):
+        """The rows of both tables as one UNION ALL queryset."""
+        first, *rest = [queryset.values_list(*fields) for queryset in self.querysets]
+        return first.union(*rest, all=True)
+
+    def first(self):
+        # An order is either live or archived, the live table is looked at first
+        for queryset in self.querysets:
+            order = queryset.first()
+            if order is not None:
+                return order
+        return None
+
+    def __getitem__(self, page):
+        if not isinstance(page, slice):
+            raise TypeError("Live and archived orders can only be sliced.")
+        # Every field of the cursor orderings runs in the same direction
+        merged = heapq.merge(
+            *(queryset.order_by(*self.ordering)[:page.stop] for queryset in self.querysets),
+            key=attrgetter(*(field.lstrip('-') for field in self.ordering)),
+            reverse=self.ordering[0].startswith('-'),
+        )
+        return list(islice(merged, page.start, page.stop))
+
+
+def customer_orders(user):
+    """The user's live and archived orders, the ones they deleted left out."""
+    return LiveAndArchivedOrders(Order.objects.filter(user=user), ArchivedOrder.objects.filter(user=user, is_deleted=False))
+
+
+def finance_orders():
+    """Live and archived orders the finance listings and exports cover, deleted ones too once paid."""
+    kept = Q(is_deleted=False) | Q(is_paid=True)
+    return LiveAndArchivedOrders(Order.all_objects.filter(kept), ArchivedOrder.objects.filter(kept))
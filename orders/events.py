@@ -0,0 +1,68 @@
+import json
+import logging
+import secrets
+import threading
+
+import redis
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+PAYMENT_REQUESTED = 'payment_request.created'
+PAYMENT_APPROVED = 'payment_request.approved'
+PAYMENT_DECLINED = 'payment_request.declined'
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_redis():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = redis.Redis.from_url(settings.REDIS_URL)
+    return _client
+
+
+def _send(message):
+    try:
+        get_redis().publish(settings.EVENTS_CHANNEL, message)
+    except redis.RedisError as e:
+        # Clients still see the change on their next fetch, a lost push is not fatal
+        logger.warning("Could not publish notification event: %s", e)
+
+
+def publish(user_ids, event, data):
+    """
+    Pushes `event` to the connected clients of the given users once the current
+    transaction commits, so nobody is told about a change that rolled back.
+    """
+    message = json.dumps({'users': sorted(set(user_ids)), 'event': event, 'data': data}, default=str)
+    transaction.on_commit(lambda: _send(message))
+
+
+def stream_ticket_key(ticket):
+    return f"event-stream-ticket:{ticket}"
+
+
+def issue_stream_ticket(user):
+    """
+    One-time ticket the user opens the event stream with. EventSource cannot
+    send the access token in a header, and a ticket in the URL expires
+    within seconds instead of lasting as long as the token.
+    """
+    ticket = secrets.token_urlsafe(32)
+    cache.set(stream_ticket_key(ticket), user.pk, timeout=settings.EVENTS_TICKET_TIMEOUT)
+    return ticket
+
+
+def notification_event_data(notification):
+    return {
+        'notification': notification.id,
+        'order': notification.order_id,
+        'status': notification.status,
+        'token_payment': notification.token_payment,
+    }
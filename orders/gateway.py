@@ -0,0 +1,222 @@
+import hashlib
+import hmac
+import logging
+import random
+import threading
+import time
+import uuid
+
+import razorpay
+import requests
+from django.conf import settings
+from django.utils.module_loading import import_string
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """Raised when the payment gateway is failing and calls are being short-circuited."""
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and rejects calls for
+    `reset_timeout` seconds, then lets a single trial call through (half-open).
+    """
+    CLOSED = 'CLOSED'
+    OPEN = 'OPEN'
+    HALF_OPEN = 'HALF_OPEN'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class GatewayMetrics:
+    """In-process call counters and latencies, keyed by gateway call name."""
+
+    def __init__(self):
+        self.calls = {}
+        self.lock = threading.Lock()
+
+    def record(self, name, latency, error=None):
+        with self.lock:
+            stats = self.calls.setdefault(name, {'count': 0, 'errors': 0, 'total_latency': 0.0, 'max_latency': 0.0})
+            stats['count'] += 1
+            stats['total_latency'] += latency
+            stats['max_latency'] = max(stats['max_latency'], latency)
+            if error is not None:
+                stats['errors'] += 1
+
+        if error is not None:
+            logger.warning("razorpay.%s failed in %.1fms: %s", name, latency * 1000, error)
+        else:
+            logger.info("razorpay.%s succeeded in %.1fms", name, latency * 1000)
+
+    def snapshot(self):
+        with self.lock:
+            return {name: dict(stats) for name, stats in self.calls.items()}
+
+
+class TimeoutSession(requests.Session):
+    """Keep-alive session with a bounded connection pool and a default timeout on every request."""
+
+    def __init__(self, timeout, pool_size):
+        super().__init__()
+        self.timeout = timeout
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return super().request(method, url, **kwargs)
+
+
+class RazorpayGateway:
+    """
+    Process-wide Razorpay client. Reuses one pooled session, bounds every call
+    with connect/read timeouts, retries transient failures with jittered
+    backoff and stops calling a failing gateway through a circuit breaker.
+    """
+    # Nothing reached Razorpay, so any call can be retried safely
+    CONNECTION_ERRORS = (requests.ConnectionError,)
+    # The request may have been processed, only retried for idempotent calls
+    TRANSIENT_ERRORS = (requests.Timeout, razorpay.errors.ServerError, razorpay.errors.GatewayError)
+
+    def __init__(self):
+        self.key_secret = settings.RAZORPAY_KEY_SECRET
+        self.max_retries = settings.RAZORPAY_MAX_RETRIES
+        self.backoff = settings.RAZORPAY_RETRY_BACKOFF
+        self.session = TimeoutSession(
+            timeout=(settings.RAZORPAY_CONNECT_TIMEOUT, settings.RAZORPAY_READ_TIMEOUT),
+            pool_size=settings.RAZORPAY_POOL_SIZE,
+        )
+        self.client = razorpay.Client(
+            session=self.session,
+            auth=(settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_SECRET),
+            base_url=settings.RAZORPAY_BASE_URL,
+        )
+        self.breaker = CircuitBreaker(
+            failure_threshold=settings.RAZORPAY_CIRCUIT_FAILURE_THRESHOLD,
+            reset_timeout=settings.RAZORPAY_CIRCUIT_RESET_TIMEOUT,
+        )
+        self.metrics = GatewayMetrics()
+
+    def create_order(self, data):
+        return self.call('order.create', self.client.order.create, data=data)
+
+    def fetch_payment(self, payment_id):
+        return self.call('payment.fetch', self.client.payment.fetch, payment_id, idempotent=True)
+
+    def verify_payment_signature(self, params):
+        # Signature checks are local HMACs and never touch the network
+        return self.client.utility.verify_payment_signature(params)
+
+    def verify_webhook_signature(self, body, signature):
+        return self.client.utility.verify_webhook_signature(body, signature, settings.RAZORPAY_WEBHOOK_SECRET)
+
+    def call(self, name, func, *args, idempotent=False, **kwargs):
+        retryable = self.CONNECTION_ERRORS + (self.TRANSIENT_ERRORS if idempotent else ())
+
+        for attempt in range(self.max_retries + 1):
+            if not self.breaker.allow():
+                self.metrics.record(name, 0.0, error="circuit open")
+                raise CircuitOpenError("Payment gateway is unavailable, please try again shortly.")
+
+            start = time.monotonic()
+            try:
+                result = func(*args, **kwargs)
+            except razorpay.errors.BadRequestError as e:
+                # The gateway answered, so it is healthy even though it rejected the call
+                self.metrics.record(name, time.monotonic() - start, error=e)
+                self.breaker.record_success()
+                raise
+            except Exception as e:
+                self.metrics.record(name, time.monotonic() - start, error=e)
+                self.breaker.record_failure()
+                if not isinstance(e, retryable) or attempt == self.max_retries:
+                    raise
+                # Exponential backoff with full jitter so workers do not retry in lockstep
+                time.sleep(random.uniform(0, self.backoff * (2 ** attempt)))
+            else:
+                self.metrics.record(name, time.monotonic() - start)
+                self.breaker.record_success()
+                return result
+
+
+class StubRazorpayGateway:
+    """
+    Offline stand-in for tests and local development. Creates orders in memory
+    and signs/verifies exactly like Razorpay, without any network calls.
+    """
+
+    def __init__(self):
+        self.orders = {}
+        self.metrics = GatewayMetrics()
+
+    def create_order(self, data):
+        order = dict(data, id=f"order_{uuid.uuid4().hex[:14]}", entity="order", status="created")
+        self.orders[order['id']] = order
+        self.metrics.record('order.create', 0.0)
+        return order
+
+    def fetch_payment(self, payment_id):
+        return {"id": payment_id, "entity": "payment", "status": "captured"}
+
+    def sign(self, message, secret):
+        return hmac.new(secret.encode('utf-8'), message.encode('utf-8'), hashlib.sha256).hexdigest()
+
+    def verify_payment_signature(self, params):
+        message = f"{params['razorpay_order_id']}|{params['razorpay_payment_id']}"
+        return razorpay.Utility().verify_signature(message, str(params['razorpay_signature']), settings.RAZORPAY_KEY_SECRET)
+
+    def verify_webhook_signature(self, body, signature):
+        return razorpay.Utility().verify_webhook_signature(body, signature, settings.RAZORPAY_WEBHOOK_SECRET)
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway():
+    """Returns the process-wide gateway, built from `settings.RAZORPAY_GATEWAY_CLASS` on first use."""
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                _gateway = import_string(settings.RAZORPAY_GATEWAY_CLASS)()
+    return _gateway
+
+
+def reset_gateway():
+    """Drops the cached gateway so the next call picks up changed settings (used by tests)."""
+    global _gateway
+    with _gateway_lock:
+        _gateway = None
@@ -0,0 +1,86 @@
+from collections import Counter
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from .models import NotificationRecipient
+
+# Counters expire now and then so any drift is corrected from the database
+UNREAD_COUNTER_TIMEOUT = 60 * 60
+
+
+def unread_key(user_id):
+    return f"inbox:unread:{user_id}"
+
+
+def unread_count(user):
+    """
+    Unread inbox entries of `user`. Served from the cache; the database is only
+    counted (on the partial unread index) when the counter is missing.
+    """
+    count = cache.get(unread_key(user.pk))
+    if count is None:
+        count = NotificationRecipient.objects.filter(user=user, is_read=False).count()
+        # add() so a counter incremented meanwhile is not overwritten
+        cache.add(unread_key(user.pk), count, timeout=UNREAD_COUNTER_TIMEOUT)
+    return max(count, 0)
+
+
+def _adjust_counters(deltas):
+    for user_id, delta in deltas.items():
+        key = unread_key(user_id)
+        try:
+            if cache.incr(key, delta) < 0:
+                cache.delete(key)
+        except ValueError:
+            # No counter yet, it is loaded from the database on the next read
+            pass
+
+
+def deliver(notification, users, created_by=None):
+    """
+    Puts `notification` into the inbox of each user and bumps their counters
+    once committed. Users who already read it get it back as unread.
+    """
+    user_ids = {user.pk for user in users}
+    existing = dict(
+        NotificationRecipient.objects.filter(notification=notification, user_id__in=user_ids).values_list('user_id', 'is_read')
+    )
+
+    reopened = [user_id for user_id, is_read in existing.items() if is_read]
+    if reopened:
+        NotificationRecipient.objects.filter(notification=notification, user_id__in=reopened).update(
+            is_read=False, read_at=None, updated_by=created_by, updated_at=timezone.now()
+        )
+
+    new = [user_id for user_id in user_ids if user_id not in existing]
+    NotificationRecipient.objects.bulk_create(
+        [
+            NotificationRecipient(notification=notification, user_id=user_id, created_by=created_by, updated_by=created_by)
+            for user_id in new
+        ],
+        ignore_conflicts=True,
+    )
+
+    deltas = Counter(reopened + new)
+    transaction.on_commit(lambda: _adjust_counters(deltas))
+    return len(deltas)
+
+
+def mark_read(recipients, user=None):
+    """
+    Marks the unread entries of the `recipients` queryset as read and lowers
+    the counters of their users. Returns the number of entries marked.
+    """
+    with transaction.atomic():
+        # Locking the rows keeps two concurrent readers from decrementing twice
+        unread = list(recipients.filter(is_read=False).select_for_update().values_list('id', 'user_id'))
+        if not unread:
+            return 0
+        NotificationRecipient.objects.filter(id__in=[row_id for row_id, _ in unread]).update(
+            is_read=True, read_at=timezone.now(), updated_by=user, updated_at=timezone.now()
+        )
+        deltas = Counter()
+        for _, user_id in unread:
+            deltas[user_id] -= 1
+        transaction.on_commit(lambda: _adjust_counters(deltas))
+    return len(unread)
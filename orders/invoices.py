@@ -0,0 +1,202 @@
+import hashlib
+import json
+import logging
+import zipfile
+from collections import defaultdict
+from concurrent.futures import as_completed
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from backend.utils import django_process_pool
+from .models import ArchivedOrder, ArchivedOrderItem, Order, OrderItem
+
+logger = logging.getLogger(__name__)
+
+INVOICE_DIR = "invoices"
+
+# Seconds the progress of a background invoice export is kept
+EXPORT_PROGRESS_TIMEOUT = 3600
+
+# Items table of each order table, archived orders keep their invoices
+INVOICE_ITEMS = {Order: OrderItem, ArchivedOrder: ArchivedOrderItem}
+
+INVOICE_ITEM_FIELDS = ('product_variant_id', 'product_variant__product__product_type__name', 'quantity', 'product_variant__price')
+
+
+def invoice_fingerprint(order, items=None):
+    """
+    Hash of everything printed on the invoice. It only changes when the order
+    does, so it doubles as the storage key of the rendered PDF.
+    """
+    if items is None:
+        items = order.items.order_by('id').values_list(*INVOICE_ITEM_FIELDS)
+    content = {
+        'order_number': order.order_number,
+        'customer': order.user.email,
+        'total_price': order.total_price,
+        'status': order.status,
+        'items': [list(item) for item in items],
+    }
+    return hashlib.sha256(json.dumps(content, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def invoice_path(fingerprint):
+    return f"{INVOICE_DIR}/{fingerprint[:2]}/{fingerprint}.pdf"
+
+
+def has_current_invoice(order, fingerprint=None):
+    if not order.invoice_hash or not order.invoice_file:
+        return False
+    fingerprint = fingerprint or invoice_fingerprint(order)
+    return order.invoice_hash == fingerprint and default_storage.exists(order.invoice_file.name)
+
+
+def ensure_invoice(order):
+    """
+    Makes sure the stored invoice matches the order, rendering it only when the
+    order changed or the file is missing. Returns True if a PDF was rendered.
+    """
+    fingerprint = invoice_fingerprint(order)
+    if has_current_invoice(order, fingerprint):
+        return False
+
+    name = invoice_path(fingerprint)
+    rendered = not default_storage.exists(name)
+    if rendered:
+        name = default_storage.save(name, ContentFile(order.generate_invoice().getvalue()))
+
+    # Queryset update so the payment window (based on updated_at) is not touched
+    type(order)._base_manager.filter(pk=order.pk).update(invoice_file=name, invoice_hash=fingerprint)
+    order.invoice_file.name = name
+    order.invoice_hash = fingerprint
+    return rendered
+
+
+def stale_invoice_ids(orders):
+    """
+    Returns the IDs of orders whose stored invoice is missing or outdated.
+    Items are loaded with a single query for the whole batch.
+    """
+    orders = list(orders)
+    if not orders:
+        return []
+    items = defaultdict(list)
+    for order_id, *item in INVOICE_ITEMS[type(orders[0])].objects.filter(order__in=orders).order_by('id').values_list('order_id', *INVOICE_ITEM_FIELDS):
+        items[order_id].append(tuple(item))
+    return [order.pk for order in orders if not has_current_invoice(order, invoice_fingerprint(order, items[order.pk]))]
+
+
+def invoice_order(order_id):
+    """The order, live (deleted ones included) or archived, or None."""
+    order = Order.all_objects.select_related('user').filter(pk=order_id).first()
+    if order is None:
+        order = ArchivedOrder.objects.select_related('user').filter(pk=order_id).first()
+    return order
+
+
+def _render_invoice_worker(order_id):
+    order = invoice_order(order_id)
+    return order_id, order is not None and ensure_invoice(order)
+
+
+def render_invoices(order_ids, workers=None, progress=None):
+    """
+    Renders the given invoices in parallel worker processes. `progress` is
+    called with (done, total) after each invoice. Returns the rendered count.
+    Only for management commands, Celery's prefork workers are daemonic and
+    cannot start processes, tasks use render_invoices_in_order.
+    """
+    total = len(order_ids)
+    if not total:
+        return 0
+
+    rendered = 0
+    with django_process_pool(workers) as pool:
+        futures = [pool.submit(_render_invoice_worker, order_id) for order_id in order_ids]
+        for done, future in enumerate(as_completed(futures), start=1):
+            order_id, was_rendered = future.result()
+            rendered += was_rendered
+            if progress:
+                progress(done, total)
+    return rendered
+
+
+def render_invoices_in_order(order_ids, progress=None):
+    """
+    Renders the given invoices one after the other in this process, the
+    Celery task counterpart of render_invoices. Returns the rendered count.
+    """
+    total = len(order_ids)
+    rendered = 0
+    for done, order_id in enumerate(order_ids, start=1):
+        _, was_rendered = _render_invoice_worker(order_id)
+        rendered += was_rendered
+        if progress:
+            progress(done, total)
+    return rendered
+
+
+def find_stale_invoices(orders, batch_size=500):
+    """IDs of the orders among `orders` whose invoice is missing or outdated, read in batches."""
+    stale, batch = [], []
+    for order in orders.select_related('user').iterator(chunk_size=batch_size):
+        batch.append(order)
+        if len(batch) == batch_size:
+            stale += stale_invoice_ids(batch)
+            batch = []
+    stale += stale_invoice_ids(batch)
+    return stale
+
+
+def prepare_invoices(orders, workers=None, progress=None, batch_size=500):
+    """
+    Renders every missing or outdated invoice among `orders` in the process
+    pool. Returns (stale, rendered) counts.
+    """
+    stale = find_stale_invoices(orders, batch_size=batch_size)
+    return len(stale), render_invoices(stale, workers=workers, progress=progress)
+
+
+def export_progress_key(order_ids):
+    """Cache key of the progress of rendering exactly these invoices."""
+    return f"invoice-export:{hashlib.md5(','.join(map(str, sorted(order_ids))).encode('utf-8')).hexdigest()}"
+
+
+def log_progress(done, total):
+    if done == total or done % 50 == 0:
+        logger.info("Rendered %s of %s invoices", done, total)
+
+
+class _ZipStream:
+    """Write-only file object that collects what zipfile writes until the generator yields it."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def stream_invoice_zip(orders, chunk_size=64 * 1024):
+    """
+    Yields a ZIP archive of the stored invoices piece by piece, so only one
+    chunk of one PDF is held in memory at a time.
+    """
+    stream = _ZipStream()
+    with zipfile.ZipFile(stream, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for order in orders:
+            with default_storage.open(order.invoice_file.name, 'rb') as source, \
+                    archive.open(f"invoice_{order.order_number}.pdf", 'w') as target:
+                for chunk in iter(lambda: source.read(chunk_size), b""):
+                    target.write(chunk)
+                    yield stream.pop()
+            yield stream.pop()
+    yield stream.pop()
@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from orders.archive import archive_closed_orders, closed_orders
+
+
+class Command(BaseCommand):
+    help = "Move closed orders, with their items, sellings and notifications, into the archive tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months', type=int, default=settings.ARCHIVE_AFTER_MONTHS)
+        parser.add_argument('--batch-size', type=int, default=settings.ARCHIVE_BATCH_SIZE)
+        parser.add_argument('--dry-run', action='store_true', help="Only count the orders that would be archived.")
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            count = closed_orders(options['months']).count()
+            self.stdout.write(f"{count} orders would be archived.")
+            return
+
+        archived = archive_closed_orders(months=options['months'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Archived {archived} orders."))
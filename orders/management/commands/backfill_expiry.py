@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F
+from orders.models import Order
+from product.models import SharableCollection
+
+
+class Command(BaseCommand):
+    help = "Fill the expiry timestamps of open payment windows and sharable links created before they were stored."
+
+    def handle(self, *args, **options):
+        orders = Order.objects.filter(
+            is_approved=True, is_paid=False, payment_expires_at__isnull=True, time_duration__isnull=False,
+        ).update(payment_expires_at=F('updated_at') + F('time_duration'))
+
+        links = SharableCollection.objects.filter(
+            expires_at__isnull=True, time_duration__isnull=False,
+        ).update(expires_at=F('updated_at') + F('time_duration'))
+
+        self.stdout.write(self.style.SUCCESS(f"Filled {orders} payment windows and {links} sharable links."))
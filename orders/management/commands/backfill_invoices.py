@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from orders.invoices import ensure_invoice
+from orders.models import Order
+from orders.tasks import generate_order_invoice
+
+
+class Command(BaseCommand):
+    help = "Render and store invoices for paid orders that do not have an up-to-date one yet."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--all', action='store_true', help="Check every paid order, not only those without an invoice.")
+        parser.add_argument('--async', dest='run_async', action='store_true', help="Queue Celery tasks instead of rendering inline.")
+
+    def handle(self, *args, **options):
+        orders = Order.all_objects.filter(is_paid=True).select_related('user').order_by('id')
+        if not options['all']:
+            orders = orders.filter(invoice_hash="")
+
+        checked = rendered = 0
+        for order in orders.iterator(chunk_size=options['batch_size']):
+            checked += 1
+            if options['run_async']:
+                generate_order_invoice.delay(order.pk)
+            elif ensure_invoice(order):
+                rendered += 1
+
+            if checked % options['batch_size'] == 0:
+                self.stdout.write(f"{checked} orders checked")
+
+        if options['run_async']:
+            self.stdout.write(self.style.SUCCESS(f"Queued {checked} invoices."))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Checked {checked} orders, rendered {rendered} invoices."))
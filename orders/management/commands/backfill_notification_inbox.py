@@ -0,0 +1,44 @@
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from orders.inbox import unread_key
+from orders.models import Notification, NotificationRecipient
+
+
+class Command(BaseCommand):
+    help = "Create inbox entries for notifications stored before the per-recipient inbox existed."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        notifications = Notification.objects.filter(recipients__isnull=True).order_by('id')
+
+        created = 0
+        user_ids = set()
+        batch = []
+        with transaction.atomic():
+            for notification in notifications.iterator(chunk_size=options['batch_size']):
+                # Admin recipients were stored as a comma-joined list of IDs
+                for receiver_id in filter(None, notification.receiver.split(',')):
+                    batch.append(NotificationRecipient(
+                        notification=notification, user_id=int(receiver_id), is_read=notification.is_admin_read,
+                    ))
+                # Approved and declined requests were also delivered to the buyer
+                if notification.status != Notification.PENDING and notification.sender_id:
+                    batch.append(NotificationRecipient(
+                        notification=notification, user_id=notification.sender_id, is_read=notification.is_read,
+                    ))
+
+                if len(batch) >= options['batch_size']:
+                    NotificationRecipient.objects.bulk_create(batch, ignore_conflicts=True)
+                    created += len(batch)
+                    user_ids.update(row.user_id for row in batch)
+                    batch = []
+            NotificationRecipient.objects.bulk_create(batch, ignore_conflicts=True)
+            created += len(batch)
+            user_ids.update(row.user_id for row in batch)
+
+        # Counters of the affected users are reloaded from the database on their next read
+        cache.delete_many([unread_key(user_id) for user_id in user_ids])
+        self.stdout.write(self.style.SUCCESS(f"Created {created} inbox entries."))
@@ -0,0 +1,54 @@
+import heapq
+from datetime import datetime
+from operator import attrgetter
+from django.core.management.base import BaseCommand, CommandError
+from orders.archive import finance_orders
+from orders.invoices import prepare_invoices, stream_invoice_zip
+from orders.models import Order
+
+
+class Command(BaseCommand):
+    help = "Render missing invoices in parallel and write the selected invoices to a ZIP file."
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help="Path of the ZIP file to write.")
+        parser.add_argument('--start-date', help="YYYY-MM-DD")
+        parser.add_argument('--end-date', help="YYYY-MM-DD")
+        parser.add_argument('--status', choices=[choice for choice, _ in Order.STATUS_CHOICES])
+        parser.add_argument('--workers', type=int, default=None)
+
+    def handle(self, *args, **options):
+        orders = finance_orders()
+        try:
+            if options['start_date']:
+                orders = orders.filter(created_at__date__gte=datetime.strptime(options['start_date'], '%Y-%m-%d').date())
+            if options['end_date']:
+                orders = orders.filter(created_at__date__lte=datetime.strptime(options['end_date'], '%Y-%m-%d').date())
+        except ValueError:
+            raise CommandError("Invalid date format. Please use YYYY-MM-DD.")
+        if options['status']:
+            orders = orders.filter(status=options['status'])
+
+        def progress(done, total):
+            self.stdout.write(f"\rRendered {done}/{total} invoices", ending="")
+            if done == total:
+                self.stdout.write("")
+
+        stale = rendered = 0
+        for queryset in orders.querysets:
+            queryset_stale, queryset_rendered = prepare_invoices(queryset, workers=options['workers'], progress=progress)
+            stale += queryset_stale
+            rendered += queryset_rendered
+
+        # Live and archived invoices, in ID order
+        invoices = heapq.merge(
+            *(queryset.only('order_number', 'invoice_file').order_by('id').iterator() for queryset in orders.querysets),
+            key=attrgetter('id'),
+        )
+        with open(options['output'], 'wb') as output:
+            for chunk in stream_invoice_zip(invoices):
+                output.write(chunk)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {sum(queryset.count() for queryset in orders.querysets)} invoices to {options['output']} ({rendered} rendered, {stale - rendered} reused)."
+        ))
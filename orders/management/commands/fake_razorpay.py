@@ -0,0 +1,170 @@
+import hashlib
+import hmac
+import json
+import threading
+import time
+import urllib.request
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+class FakeRazorpayHandler(BaseHTTPRequestHandler):
+    """
+    Minimal stand-in for the Razorpay REST API. Supports creating and fetching
+    orders, and a `/v1/simulate/pay` hook that captures a payment, returns the
+    checkout signature and delivers a signed `payment.captured` webhook.
+    """
+    orders = {}
+    payments = {}
+    lock = threading.Lock()
+
+    def do_POST(self):
+        data = self.read_json()
+        if self.path.rstrip('/') == '/v1/orders':
+            order = {
+                "id": f"order_{uuid.uuid4().hex[:14]}",
+                "entity": "order",
+                "amount": data.get("amount"),
+                "amount_paid": 0,
+                "currency": data.get("currency", "INR"),
+                "receipt": data.get("receipt"),
+                "status": "created",
+                "created_at": int(time.time()),
+            }
+            with self.lock:
+                self.orders[order["id"]] = order
+            return self.send_json(200, order)
+
+        if self.path.rstrip('/') == '/v1/simulate/pay':
+            return self.simulate_payment(data)
+
+        return self.send_json(404, {"error": {"code": "BAD_REQUEST_ERROR", "description": "Not found"}})
+
+    def do_GET(self):
+        parts = self.path.strip('/').split('/')
+        if len(parts) == 3 and parts[0] == 'v1':
+            store = {'orders': self.orders, 'payments': self.payments}.get(parts[1], {})
+            if parts[2] in store:
+                return self.send_json(200, store[parts[2]])
+        return self.send_json(404, {"error": {"code": "BAD_REQUEST_ERROR", "description": "Not found"}})
+
+    def simulate_payment(self, data):
+        order = self.orders.get(data.get("order_id"))
+        if not order:
+            return self.send_json(400, {"error": {"code": "BAD_REQUEST_ERROR", "description": "Unknown order"}})
+
+        payment = {
+            "id": f"pay_{uuid.uuid4().hex[:14]}",
+            "entity": "payment",
+            "amount": order["amount"],
+            "currency": order["currency"],
+            "status": "captured",
+            "order_id": order["id"],
+            "captured": True,
+            "created_at": int(time.time()),
+        }
+        with self.lock:
+            self.payments[payment["id"]] = payment
+            order["status"] = "paid"
+            order["amount_paid"] = order["amount"]
+
+        # Same signature the checkout widget hands to the client for verify-payment
+        signature = hmac.new(
+            settings.RAZORPAY_KEY_SECRET.encode('utf-8'),
+            f"{order['id']}|{payment['id']}".encode('utf-8'),
+            hashlib.sha256,
+        ).hexdigest()
+
+        webhook_status = None
+        if data.get("send_webhook", True):
+            webhook_status = self.server.deliver_webhook("payment.captured", {"payment": {"entity": payment}})
+
+        return self.send_json(200, {
+            "razorpay_order_id": order["id"],
+            "razorpay_payment_id": payment["id"],
+            "razorpay_signature": signature,
+            "webhook_status": webhook_status,
+        })
+
+    def read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return {}
+        try:
+            return json.loads(self.rfile.read(length))
+        except ValueError:
+            return {}
+
+    def send_json(self, status_code, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        self.server.stdout.write(f"[fake-razorpay] {format % args}\n")
+
+
+class FakeRazorpayServer(ThreadingHTTPServer):
+    def __init__(self, address, webhook_url, webhook_secret, stdout):
+        super().__init__(address, FakeRazorpayHandler)
+        self.webhook_url = webhook_url
+        self.webhook_secret = webhook_secret
+        self.stdout = stdout
+
+    def deliver_webhook(self, event, payload):
+        body = json.dumps({
+            "entity": "event",
+            "event": event,
+            "contains": list(payload.keys()),
+            "payload": payload,
+            "created_at": int(time.time()),
+        }).encode('utf-8')
+        signature = hmac.new(self.webhook_secret.encode('utf-8'), body, hashlib.sha256).hexdigest()
+        request = urllib.request.Request(self.webhook_url, data=body, method='POST', headers={
+            'Content-Type': 'application/json',
+            'X-Razorpay-Signature': signature,
+            'X-Razorpay-Event-Id': f"evt_{uuid.uuid4().hex[:14]}",
+        })
+        try:
+            with urllib.request.urlopen(request, timeout=5) as response:
+                return response.status
+        except Exception as e:
+            self.stdout.write(f"[fake-razorpay] webhook delivery failed: {e}\n")
+            return None
+
+
+class Command(BaseCommand):
+    help = "Run a local fake Razorpay gateway so checkout and webhooks can be tested offline."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=9090)
+        parser.add_argument('--webhook-url', default='http://127.0.0.1:8000/order/razorpay/webhook/')
+
+    def handle(self, *args, **options):
+        if not settings.RAZORPAY_KEY_SECRET or not settings.RAZORPAY_WEBHOOK_SECRET:
+            self.stderr.write("RAZORPAY_KEY_SECRET and RAZORPAY_WEBHOOK_SECRET must be set.")
+            return
+
+        server = FakeRazorpayServer(
+            (options['host'], options['port']),
+            options['webhook_url'],
+            settings.RAZORPAY_WEBHOOK_SECRET,
+            self.stdout,
+        )
+        self.stdout.write(
+            f"Fake Razorpay listening on http://{options['host']}:{options['port']} "
+            f"(set RAZORPAY_BASE_URL to this), webhooks -> {options['webhook_url']}"
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from orders.models import DailySalesRollup, Selling, ArchivedSelling, bump_sales_cube_version
+
+
+class Command(BaseCommand):
+    help = "Rebuild the daily sales rollup from the selling table (backfill or repair)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        # Archived sellings are part of the history too. Revenue is taken at the price each sale
+        # was made at, the current price is only a fallback for sales recorded before it was kept.
+        totals = {}
+        for model in (Selling, ArchivedSelling):
+            daily_sales = model.objects.annotate(date=TruncDate('created_at')) \
+                .values(
+                    'date',
+                    'product_variant_id',
+                    product_type_id=F('product_variant__product__product_type_id'),
+                    product_brand_id=F('product_variant__product__product_brand_id'),
+                    product_category=F('product_variant__product__product_category'),
+                    carat=F('product_variant__carat'),
+                ) \
+                .annotate(total_quantity=Sum('quantity'), total_revenue=Sum(F('quantity') * Coalesce('unit_price', 'product_variant__price'))) \
+                .order_by()
+            for row in daily_sales.iterator(chunk_size=options['batch_size']):
+                key = (row['date'], row['product_variant_id'])
+                if key in totals:
+                    totals[key]['total_quantity'] += row['total_quantity']
+                    totals[key]['total_revenue'] += row['total_revenue']
+                else:
+                    totals[key] = row
+
+        created = 0
+        with transaction.atomic():
+            DailySalesRollup.objects.all().delete()
+            batch = []
+            for key in sorted(totals):
+                row = totals[key]
+                batch.append(DailySalesRollup(
+                    date=row['date'],
+                    product_variant_id=row['product_variant_id'],
+                    product_type_id=row['product_type_id'],
+                    product_brand_id=row['product_brand_id'],
+                    product_category=row['product_category'],
+                    carat=row['carat'],
+                    quantity=row['total_quantity'],
+                    revenue=row['total_revenue'],
+                ))
+                if len(batch) == options['batch_size']:
+                    created += len(DailySalesRollup.objects.bulk_create(batch))
+                    batch = []
+            created += len(DailySalesRollup.objects.bulk_create(batch))
+
+        bump_sales_cube_version()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {created} daily sales rows."))
@@ -1,12 +1,28 @@
-from django.db import models
+from django.db import models, transaction
 from backend.models import BaseModel
 from users.models import User
-from product.models import ProductVariant
+from product.models import ProductVariant, ProductType, BrandType
+from backend.utils import bulk_increment
+from stocks.models import StockMovement
+from stocks.ledger import record_changes as record_stock_changes, stock_state
+from stocks.projection import reserve_items
 from django.utils import timezone
+from django.core.cache import cache
 from io import BytesIO
 from reportlab.pdfgen import canvas
+import logging
 import uuid
 
+logger = logging.getLogger(__name__)
+
+
+class ActiveOrderManager(models.Manager):
+    """Hides soft-deleted orders, `Order.all_objects` still returns them."""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(is_deleted=False)
+
+
 class Order(BaseModel):
     """Stores the overall order for a user."""
 
@@ -28,11 +44,20 @@ class Order(BaseModel):
     time_duration = models.DurationField(null=True, blank=True)
     is_approved = models.BooleanField(default=False)
     is_deleted = models.BooleanField(default=False)
+    # End of the approved payment window, indexed for the expiry sweep
+    payment_expires_at = models.DateTimeField(null=True, blank=True)
 
     # Razorpayment Integration
     razorpay_order_id = models.CharField(max_length=100, null=True, blank=True)
     razorpay_payment_id = models.CharField(max_length=100, null=True, blank=True)
     is_paid = models.BooleanField(default=False)
+
+    # Rendered invoice, stored under the hash of its content
+    invoice_file = models.FileField(upload_to="invoices/", null=True, blank=True)
+    invoice_hash = models.CharField(max_length=64, blank=True, default="")
+
+    objects = ActiveOrderManager()
+    all_objects = models.Manager()
     
     def save(self, *args, **kwargs):
         # Auto-generate order number if not already set
@@ -44,11 +69,27 @@ class Order(BaseModel):
     def __str__(self):
         return f"Order {self.id} by {self.user.email}"
     
+    def soft_delete(self, user=None):
+        """Hides the order everywhere while keeping it, its items and its sales for reporting."""
+        with transaction.atomic():
+            order = Order.all_objects.select_for_update().get(pk=self.pk)
+            if order.is_deleted:
+                return
+            if order.is_approved and not order.is_paid:
+                # Release what the approval reserved
+                reserve_items(order.items.values_list('product_variant_id', 'quantity'), sign=-1)
+            Order.all_objects.filter(pk=self.pk).update(is_deleted=True, updated_by=user, updated_at=timezone.now())
+        self.is_deleted = True
+
     def valid_time(self):
         """
         Validates if the current time is within the `time_duration` window since `updated_at`.
         Returns True if the payment is still valid (within time window), False if time has expired.
         """
+        # The window fixed at approval time, later saves no longer extend it
+        if self.payment_expires_at:
+            return timezone.now() <= self.payment_expires_at
+
         # Calculate the expiration time by adding the time_duration to updated_at
         if self.time_duration:
             expiration_time = self.updated_at + self.time_duration
@@ -57,6 +98,70 @@ class Order(BaseModel):
             return timezone.now() <= expiration_time
         else:
             return False
+
+    def mark_paid(self, razorpay_payment_id, user=None):
+        """
+        Marks the order as paid, takes the sold quantities out of stock and records the sale.
+        Safe to call more than once for the same order (client verification and the webhook
+        worker may race), returns False if the order had already been marked as paid.
+        """
+        with transaction.atomic():
+            order = Order.all_objects.select_for_update().get(pk=self.pk)
+            if order.is_paid:
+                return False
+
+            order.razorpay_payment_id = razorpay_payment_id
+            order.is_paid = True
+            order.updated_by = user
+            order.save()
+
+            # Decrease stock quantity and log the sold variants
+            order_items = list(order.items.select_related('product_variant__product'))
+            if order.is_approved:
+                # The approval reserved the items, they are now sold instead
+                reserve_items([(item.product_variant_id, item.quantity) for item in order_items], sign=-1)
+            # The money is already captured, so the sale stands even when the units are gone.
+            # Only what is left is taken out of stock and the rest is recorded as oversold.
+            variants = ProductVariant.objects.select_for_update().order_by('id') \
+                .in_bulk({order_item.product_variant_id for order_item in order_items})
+            before = {product_variant.pk: stock_state(product_variant) for product_variant in variants.values()}
+            taken = {}
+            for order_item in order_items:
+                product_variant = variants[order_item.product_variant_id]
+                taken[order_item.pk] = min(order_item.quantity, max(product_variant.quantity, 0))
+                product_variant.quantity -= taken[order_item.pk]
+                order_item.oversold_quantity = order_item.quantity - taken[order_item.pk]
+                if order_item.oversold_quantity:
+                    logger.warning(
+                        "Order %s oversold %s of variant %s", order.order_number, order_item.oversold_quantity, product_variant.pk,
+                    )
+            ProductVariant.objects.bulk_update(variants.values(), ['quantity'])
+            OrderItem.objects.bulk_update([order_item for order_item in order_items if order_item.oversold_quantity], ['oversold_quantity'])
+            # Only variants assigned to stock move the ledger, units of the others are still waiting for QC
+            record_stock_changes([
+                (product_variant, before[product_variant.pk], f"order:{order.pk}")
+                for product_variant in variants.values()
+            ], StockMovement.SALE, user)
+            Selling.objects.bulk_create([
+                Selling(
+                    order=order,
+                    product_variant_id=order_item.product_variant_id,
+                    quantity=order_item.quantity,
+                    unit_price=order_item.product_variant.price,
+                    created_by=user,
+                    updated_by=user,
+                )
+                for order_item in order_items
+            ])
+            DailySalesRollup.record(order_items, timezone.localdate())
+
+            # Render the invoice once, in the background, as soon as the order is paid
+            from .tasks import generate_order_invoice
+            transaction.on_commit(lambda: generate_order_invoice.delay(order.pk))
+
+        self.razorpay_payment_id = razorpay_payment_id
+        self.is_paid = True
+        return True
     
     def generate_invoice(self):
         """
@@ -74,7 +179,7 @@ class Order(BaseModel):
 
         # Add order items
         y_position = 700
-        for item in self.items.all():
+        for item in self.items.select_related('product_variant__product__product_type'):
             pdf.drawString(100, y_position, f"Product: {item.product_variant.product.product_type.name}, Quantity: {item.quantity}, Price: {item.product_variant.price}")
             y_position -= 20
 
@@ -88,6 +193,18 @@ class Order(BaseModel):
         db_table = "order"
         verbose_name = "Order"
         verbose_name_plural = "Orders"
+        indexes = [
+            # Keyset pagination of a customer's history and of the admin status views
+            # Soft-deleted orders are left out, no listing ever reads them
+            models.Index(fields=['user', '-created_at', '-id'], condition=models.Q(is_deleted=False), name='order_user_created_idx'),
+            models.Index(fields=['status', '-created_at', '-id'], condition=models.Q(is_deleted=False), name='order_status_created_idx'),
+            # Only open payment windows, the rows the expiry sweep looks at
+            models.Index(
+                fields=['payment_expires_at'],
+                condition=models.Q(is_approved=True, is_paid=False, is_deleted=False),
+                name='order_open_payment_window_idx',
+            ),
+        ]
 
 
 class OrderItem(BaseModel):
@@ -95,6 +212,8 @@ class OrderItem(BaseModel):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="items")
     product_variant = models.ForeignKey(ProductVariant, on_delete=models.PROTECT)
     quantity = models.IntegerField(default=1)
+    # Units paid for that were no longer in stock when the payment arrived
+    oversold_quantity = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return f"Order Item {self.product_variant.product.code} (Order {self.order.id})"
@@ -134,11 +253,37 @@ class Notification(BaseModel):
         verbose_name = "Notification"
         verbose_name_plural = "Notifications"
 
+
+class NotificationRecipient(BaseModel):
+    """One inbox entry per user a notification was delivered to."""
+    notification = models.ForeignKey(Notification, on_delete=models.CASCADE, related_name="recipients")
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="notification_inbox")
+    is_read = models.BooleanField(default=False)
+    read_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Notification {self.notification_id} for {self.user_id}"
+
+    class Meta:
+        db_table = "notification_recipient"
+        verbose_name = "Notification Recipient"
+        verbose_name_plural = "Notification Recipients"
+        constraints = [
+            models.UniqueConstraint(fields=['notification', 'user'], name='unique_notification_recipient'),
+        ]
+        indexes = [
+            # Only unread rows are indexed, they are the ones counted and marked as read
+            models.Index(fields=['user', '-created_at'], condition=models.Q(is_read=False), name='notif_recipient_unread_idx'),
+            models.Index(fields=['notification'], condition=models.Q(is_read=False), name='notif_unread_by_notif_idx'),
+        ]
+
 class Selling(BaseModel):
     """Tracks sold variants along with order details."""
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="selling_order")
     product_variant = models.ForeignKey(ProductVariant, on_delete=models.CASCADE, related_name="sold_variant")
     quantity = models.PositiveIntegerField(default=1)
+    # Variant price at the time of sale, empty for sales recorded before it was kept
+    unit_price = models.FloatField(null=True, blank=True)
 
     def __str__(self):
         return f"Sold {self.quantity} of {self.product_variant.product.product_type} in Order {self.order.id}"
@@ -146,4 +291,195 @@ class Selling(BaseModel):
     class Meta:
         db_table = "selling"
         verbose_name = "Selling"
-        verbose_name_plural = "Sellings"
\ No newline at end of file
+        verbose_name_plural = "Sellings"
+
+
+class PaymentWebhookEvent(BaseModel):
+    """Append-only inbox of Razorpay webhook deliveries, deduplicated on the Razorpay event ID."""
+
+    RECEIVED = 'RECEIVED'
+    PROCESSED = 'PROCESSED'
+    IGNORED = 'IGNORED'
+    FAILED = 'FAILED'
+
+    STATUS_CHOICES = [
+        (RECEIVED, 'Received'),
+        (PROCESSED, 'Processed'),
+        (IGNORED, 'Ignored'),
+        (FAILED, 'Failed'),
+    ]
+
+    event_id = models.CharField(max_length=100, unique=True)
+    event_type = models.CharField(max_length=100)
+    payload = models.JSONField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=RECEIVED, db_index=True)
+    attempts = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True, default="")
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.event_type} ({self.event_id}) - {self.status}"
+
+    class Meta:
+        db_table = "payment_webhook_event"
+        verbose_name = "Payment Webhook Event"
+        verbose_name_plural = "Payment Webhook Events"
+
+
+SALES_CUBE_VERSION_KEY = "sales-cube-version"
+
+
+def bump_sales_cube_version():
+    """Invalidates every cached sales analytics response at once."""
+    try:
+        cache.incr(SALES_CUBE_VERSION_KEY)
+    except ValueError:
+        cache.set(SALES_CUBE_VERSION_KEY, 1, timeout=None)
+
+
+class DailySalesRollup(models.Model):
+    """
+    Units and revenue sold per variant per day. Kept up to date as sales are
+    recorded, so sales reports read pre-aggregated rows instead of `selling`.
+    """
+    date = models.DateField()
+    product_variant = models.ForeignKey(ProductVariant, on_delete=models.CASCADE, related_name="daily_sales")
+    product_type = models.ForeignKey(ProductType, on_delete=models.CASCADE, related_name="+")
+    product_brand = models.ForeignKey(BrandType, on_delete=models.CASCADE, related_name="+")
+    product_category = models.CharField(max_length=20)
+    carat = models.IntegerField()
+    quantity = models.PositiveIntegerField(default=0)
+    revenue = models.FloatField(default=0.0)
+
+    def __str__(self):
+        return f"{self.date} - variant {self.product_variant_id}: {self.quantity}"
+
+    @classmethod
+    def record(cls, order_items, date):
+        """
+        Adds sold order items (with `product_variant__product` loaded) to the
+        day's totals, at the variant price they are sold at, the price stored
+        on their Selling rows.
+        """
+        bulk_increment(
+            cls,
+            [
+                {
+                    'date': date,
+                    'product_variant': order_item.product_variant_id,
+                    'product_type': order_item.product_variant.product.product_type_id,
+                    'product_brand': order_item.product_variant.product.product_brand_id,
+                    'product_category': order_item.product_variant.product.product_category,
+                    'carat': order_item.product_variant.carat,
+                    'quantity': order_item.quantity,
+                    'revenue': order_item.quantity * order_item.product_variant.price,
+                }
+                for order_item in order_items
+            ],
+            unique_fields=['date', 'product_variant'],
+            increment_fields=['quantity', 'revenue'],
+        )
+        transaction.on_commit(bump_sales_cube_version)
+
+    class Meta:
+        db_table = "daily_sales_rollup"
+        verbose_name = "Daily Sales Rollup"
+        verbose_name_plural = "Daily Sales Rollups"
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'product_variant'], name='unique_daily_sales_per_variant'),
+        ]
+        indexes = [
+            models.Index(fields=['date', 'product_type']),
+            models.Index(fields=['date', 'product_brand']),
+        ]
+
+
+class ArchiveModel(models.Model):
+    """
+    Closed orders and their rows are moved to the archive tables by
+    `orders.archive`. Rows keep their original IDs and audit columns;
+    relations are not enforced so archived rows outlive what they point to.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    created_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(null=True, blank=True)
+    created_by_id = models.BigIntegerField(null=True, blank=True)
+    updated_by_id = models.BigIntegerField(null=True, blank=True)
+    # First day of the month the order was placed in, archived rows are read by month
+    archive_month = models.DateField(db_index=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        abstract = True
+
+
+class ArchivedOrder(ArchiveModel):
+    order_number = models.CharField(max_length=100, unique=True)
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    user = models.ForeignKey(User, on_delete=models.DO_NOTHING, db_constraint=False, related_name="+")
+    total_price = models.FloatField(default=0.0)
+    time_duration = models.DurationField(null=True, blank=True)
+    is_approved = models.BooleanField(default=False)
+    is_deleted = models.BooleanField(default=False)
+    razorpay_order_id = models.CharField(max_length=100, null=True, blank=True)
+    razorpay_payment_id = models.CharField(max_length=100, null=True, blank=True)
+    is_paid = models.BooleanField(default=False)
+    invoice_file = models.FileField(upload_to="invoices/", null=True, blank=True)
+    invoice_hash = models.CharField(max_length=64, blank=True, default="")
+    payment_expires_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Archived order {self.id}"
+
+    # Archived invoices are rendered exactly like live ones
+    generate_invoice = Order.generate_invoice
+
+    class Meta:
+        db_table = "order_archive"
+        verbose_name = "Archived Order"
+        verbose_name_plural = "Archived Orders"
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='order_archive_user_idx'),
+        ]
+
+
+class ArchivedOrderItem(ArchiveModel):
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.DO_NOTHING, db_constraint=False, related_name="items")
+    product_variant = models.ForeignKey(ProductVariant, on_delete=models.DO_NOTHING, db_constraint=False, related_name="+")
+    quantity = models.IntegerField(default=1)
+    oversold_quantity = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        db_table = "order_item_archive"
+        verbose_name = "Archived Order Item"
+        verbose_name_plural = "Archived Order Items"
+
+
+class ArchivedSelling(ArchiveModel):
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.DO_NOTHING, db_constraint=False, related_name="sellings")
+    product_variant = models.ForeignKey(ProductVariant, on_delete=models.DO_NOTHING, db_constraint=False, related_name="+")
+    quantity = models.PositiveIntegerField(default=1)
+    unit_price = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        db_table = "selling_archive"
+        verbose_name = "Archived Selling"
+        verbose_name_plural = "Archived Sellings"
+        indexes = [
+            models.Index(fields=['created_at'], name='selling_archive_created_idx'),
+        ]
+
+
+class ArchivedNotification(ArchiveModel):
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.DO_NOTHING, db_constraint=False, related_name="notifications")
+    token_payment = models.FloatField()
+    sender = models.ForeignKey(User, on_delete=models.DO_NOTHING, db_constraint=False, null=True, related_name="+")
+    receiver = models.TextField()
+    status = models.CharField(max_length=20, choices=Notification.STATUS_CHOICES)
+    is_admin_read = models.BooleanField(default=False)
+    is_read = models.BooleanField(default=False)
+
+    class Meta:
+        db_table = "notification_archive"
+        verbose_name = "Archived Notification"
+        verbose_name_plural = "Archived Notifications"
@@ -0,0 +1,79 @@
+from datetime import datetime, time, timedelta
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.pagination import CursorPagination
+from .models import Order
+
+
+class OrderCursorPagination(CursorPagination):
+    """
+    Keyset pagination over (created_at, id). Each page is a range scan on the
+    (user, created_at) / (status, created_at) indexes instead of an OFFSET, so
+    deep pages cost the same as the first one.
+    """
+    page_size = settings.PAGE_LIMIT
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-created_at', '-id')
+
+
+def _parse_bool(value):
+    if value.lower() in ('true', '1'):
+        return True
+    if value.lower() in ('false', '0'):
+        return False
+    raise ValueError(f"Invalid boolean value: {value}")
+
+
+def _parse_moment(value, end=False):
+    """
+    Accepts ISO datetimes as well as plain dates (YYYY-MM-DD). Dates become the
+    start of that day, or of the next day for `end`, so the created_at index is
+    still used (no cast of the column to a date).
+    """
+    # parse_datetime() also accepts bare dates, so those are checked first
+    try:
+        day = parse_date(value)
+    except ValueError:
+        day = None
+    if day is not None:
+        moment = datetime.combine(day + timedelta(days=1) if end else day, time.min)
+        return timezone.make_aware(moment), end
+
+    moment = parse_datetime(value)
+    if moment is None:
+        raise ValueError(f"Invalid date: {value}")
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment, False
+
+
+def filter_orders(queryset, params):
+    """
+    Applies the status, is_paid, is_approved and start_date/end_date filters of
+    the order listings. Raises ValueError for values that cannot be parsed.
+    """
+    order_status = params.get('status', None)
+    if order_status:
+        if order_status not in dict(Order.STATUS_CHOICES):
+            raise ValueError(f"Invalid status: {order_status}")
+        queryset = queryset.filter(status=order_status)
+
+    for field in ('is_paid', 'is_approved'):
+        value = params.get(field, None)
+        if value:
+            queryset = queryset.filter(**{field: _parse_bool(value)})
+
+    start_date = params.get('start_date', None)
+    if start_date:
+        start, _ = _parse_moment(start_date)
+        queryset = queryset.filter(created_at__gte=start)
+
+    end_date = params.get('end_date', None)
+    if end_date:
+        # A plain end date includes the whole day
+        end, exclusive = _parse_moment(end_date, end=True)
+        queryset = queryset.filter(created_at__lt=end) if exclusive else queryset.filter(created_at__lte=end)
+
+    return queryset
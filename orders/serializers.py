@@ -113,7 +113,7 @@ class InvoiceListSerializer(serializers.ModelSerializer):
         fields = ['id', 'order_number', 'user', 'total_price', 'status', 'is_paid']
     
     def get_user(self, obj):
-        user_data = User.objects.filter(id=obj.user.id)
+        # The user is loaded with select_related by the list view
         return UserListSerializer(
-            user_data, read_only=True, context=self.context
+            obj.user, read_only=True, context=self.context
         ).data
\ No newline at end of file
@@ -0,0 +1,78 @@
+import logging
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from product.models import SharableCollection
+from stocks.projection import reserve_items
+from .models import Order, OrderItem
+
+logger = logging.getLogger(__name__)
+
+
+def batched_update(queryset, batch_size=None, after=None, **values):
+    """
+    Applies `values` to every row of `queryset` in UPDATEs of at most
+    `batch_size` rows, so each statement holds its row locks only briefly.
+    The queryset filter must stop matching updated rows. `after` is called
+    with the IDs of each batch inside its transaction. Returns the row count.
+    """
+    batch_size = batch_size or settings.SWEEP_BATCH_SIZE
+    updated = 0
+    while True:
+        with transaction.atomic():
+            # Locked so a concurrent change cannot slip between the update and `after`
+            ids = list(queryset.select_for_update(skip_locked=True).order_by().values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                return updated
+            updated += queryset.filter(pk__in=ids).update(**values)
+            if after:
+                after(ids)
+        if len(ids) < batch_size:
+            return updated
+
+
+def release_reservations(order_ids):
+    reserve_items(OrderItem.objects.filter(order_id__in=order_ids).values_list('product_variant_id', 'quantity'), sign=-1)
+
+
+def expire_payment_approvals(now):
+    """Withdraws approvals whose payment window closed, the buyer has to request payment again."""
+    expired = Order.objects.filter(is_approved=True, is_paid=False, payment_expires_at__lt=now)
+    return batched_update(expired, after=release_reservations, is_approved=False, updated_at=now)
+
+
+def cancel_stale_orders(now):
+    """Cancels pending orders that were never approved nor paid within STALE_ORDER_DAYS."""
+    stale = Order.objects.filter(
+        status=Order.PENDING,
+        is_approved=False,
+        is_paid=False,
+        created_at__lt=now - timedelta(days=settings.STALE_ORDER_DAYS),
+    )
+    return batched_update(stale, status=Order.CANCELED, updated_at=now)
+
+
+def invalidate_expired_links(now):
+    expired = SharableCollection.objects.filter(is_validate=True, expires_at__lt=now)
+    return batched_update(expired, is_validate=False)
+
+
+SWEEPS = (
+    ('expired_approvals', expire_payment_approvals),
+    ('stale_orders', cancel_stale_orders),
+    ('expired_links', invalidate_expired_links),
+)
+
+
+def sweep_expired():
+    """Runs every sweep and logs how many rows each changed and how long it took."""
+    now = timezone.now()
+    metrics = {}
+    for name, sweep in SWEEPS:
+        start = time.monotonic()
+        count = sweep(now)
+        metrics[name] = {'rows': count, 'duration_ms': round((time.monotonic() - start) * 1000, 1)}
+        logger.info("sweep.%s updated %s rows in %.1fms", name, count, metrics[name]['duration_ms'])
+    return metrics
@@ -0,0 +1,101 @@
+from celery import shared_task
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from .models import Order, PaymentWebhookEvent
+from .invoices import EXPORT_PROGRESS_TIMEOUT, ensure_invoice, invoice_order, log_progress, render_invoices_in_order
+from .sweeper import sweep_expired
+from .archive import archive_closed_orders
+
+# Razorpay events that confirm the money has been captured for an order
+PAYMENT_CAPTURED_EVENTS = ('payment.captured', 'order.paid')
+
+
+@shared_task(bind=True, max_retries=5, default_retry_delay=30)
+def process_payment_webhook(self, event_id):
+    """
+    Applies a stored Razorpay webhook event. Safe to run again for the same
+    event: processed and ignored events are skipped, received and failed ones
+    (e.g. the order was not found) are tried again on every redelivery.
+    """
+    try:
+        return _apply_payment_webhook(event_id)
+    except PaymentWebhookEvent.DoesNotExist:
+        raise
+    except Exception as exc:
+        # Database hiccups roll the whole event back, let Celery try again later
+        raise self.retry(exc=exc)
+
+
+def _apply_payment_webhook(event_id):
+    with transaction.atomic():
+        event = PaymentWebhookEvent.objects.select_for_update().get(pk=event_id)
+        if event.status in (PaymentWebhookEvent.PROCESSED, PaymentWebhookEvent.IGNORED):
+            return event.status
+
+        event.attempts += 1
+
+        if event.event_type not in PAYMENT_CAPTURED_EVENTS:
+            event.status = PaymentWebhookEvent.IGNORED
+            event.processed_at = timezone.now()
+            event.save()
+            return event.status
+
+        payment = event.payload.get('payload', {}).get('payment', {}).get('entity', {})
+        razorpay_order_id = payment.get('order_id')
+        order = Order.all_objects.filter(razorpay_order_id=razorpay_order_id).first() if razorpay_order_id else None
+
+        if order is None:
+            event.status = PaymentWebhookEvent.FAILED
+            event.error = f"No order found for Razorpay order {razorpay_order_id}."
+            event.save()
+            return event.status
+
+        order.mark_paid(payment.get('id'))
+
+        event.status = PaymentWebhookEvent.PROCESSED
+        event.error = ""
+        event.processed_at = timezone.now()
+        event.save()
+        return event.status
+
+
+@shared_task
+def generate_order_invoice(order_id):
+    """Renders and stores the invoice PDF for an order unless an up-to-date one already exists."""
+    order = invoice_order(order_id)
+    if order is None:
+        return False
+    return ensure_invoice(order)
+
+
+@shared_task
+def render_invoice_export(order_ids, progress_key):
+    """
+    Renders the invoices an export is waiting for, off the web workers.
+    Progress is kept under `progress_key` for the export view.
+    """
+    def progress(done, total):
+        log_progress(done, total)
+        cache.set(progress_key, {'status': 'rendering', 'done': done, 'total': total}, timeout=EXPORT_PROGRESS_TIMEOUT)
+
+    try:
+        rendered = render_invoices_in_order(order_ids, progress=progress)
+    except Exception:
+        # The next poll of the export starts another run instead of waiting for the timeout
+        cache.delete(progress_key)
+        raise
+    cache.set(progress_key, {'status': 'ready', 'done': len(order_ids), 'total': len(order_ids)}, timeout=EXPORT_PROGRESS_TIMEOUT)
+    return rendered
+
+
+@shared_task
+def sweep_expired_records():
+    """Periodic clean-up of expired payment windows, stale orders and expired sharable links."""
+    return sweep_expired()
+
+
+@shared_task
+def archive_orders():
+    """Moves closed orders older than ARCHIVE_AFTER_MONTHS out of the live tables."""
+    return archive_closed_orders()
@@ -1,3 +1,622 @@
-from django.test import TestCase
+import asyncio
+import csv
+import hashlib
+import hmac
+import io
+import json
+import shutil
+import tempfile
+import zipfile
+from datetime import date, timedelta
+from unittest import mock
+import requests
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import SimpleTestCase, override_settings
+from django.utils import timezone
+from openpyxl import load_workbook
+from rest_framework.test import APIClient
+from backend.push import CLIENT_QUEUE_SIZE, EventBroker, authenticate, notification_stream
+from backend.testing import CatalogTestCase, TemporaryMediaMixin
+from product.models import ProductVariant
+from stocks.models import Stock, StockMovement
+from stocks.projection import reserve_items
+from .archive import archive_batch
+from .events import PAYMENT_APPROVED, publish
+from .gateway import CircuitBreaker, CircuitOpenError, RazorpayGateway, reset_gateway
+from .inbox import deliver, mark_read, unread_count
+from .invoices import ensure_invoice
+from .models import ArchivedOrder, DailySalesRollup, Notification, NotificationRecipient, Order, OrderItem, PaymentWebhookEvent, Selling
+from .tasks import _apply_payment_webhook, sweep_expired_records
+from .views import VerifyPayment
 
-# Create your tests here.
+WEBHOOK_SECRET = "webhook-secret"
+
+
+@override_settings(RAZORPAY_GATEWAY_CLASS="orders.gateway.StubRazorpayGateway", RAZORPAY_WEBHOOK_SECRET=WEBHOOK_SECRET)
+class RazorpayWebhookTests(CatalogTestCase):
+    variant_quantity = 2
+
+    def setUp(self):
+        reset_gateway()
+        self.addCleanup(reset_gateway)
+        self.client = APIClient()
+        self.order = Order.objects.create(user=self.buyer, total_price=300.0, razorpay_order_id="order_test1")
+        OrderItem.objects.create(order=self.order, product_variant=self.variant, quantity=3)
+
+    def deliver(self, event_id="evt_1", order_id="order_test1", secret=WEBHOOK_SECRET):
+        body = json.dumps({
+            'event': 'payment.captured',
+            'payload': {'payment': {'entity': {'id': 'pay_1', 'order_id': order_id}}},
+        })
+        signature = hmac.new(secret.encode('utf-8'), body.encode('utf-8'), hashlib.sha256).hexdigest()
+        with mock.patch('orders.views.process_payment_webhook.delay') as delay, \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                "/order/razorpay/webhook/", body, content_type="application/json",
+                HTTP_X_RAZORPAY_SIGNATURE=signature, HTTP_X_RAZORPAY_EVENT_ID=event_id,
+            )
+        return response, delay
+
+    def test_invalid_signature_is_rejected(self):
+        response, delay = self.deliver(secret="wrong-secret")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(PaymentWebhookEvent.objects.exists())
+        delay.assert_not_called()
+
+    @override_settings(RAZORPAY_WEBHOOK_SECRET=None)
+    def test_delivery_without_a_configured_secret_is_refused(self):
+        with self.assertLogs('orders.views', level='ERROR'):
+            response, delay = self.deliver()
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(PaymentWebhookEvent.objects.exists())
+        delay.assert_not_called()
+
+    def test_first_delivery_is_stored_and_enqueued(self):
+        response, delay = self.deliver()
+        self.assertEqual(response.status_code, 200)
+        event = PaymentWebhookEvent.objects.get()
+        self.assertEqual(event.status, PaymentWebhookEvent.RECEIVED)
+        delay.assert_called_once_with(event.id)
+
+    def test_redelivery_of_processed_event_is_only_acknowledged(self):
+        self.deliver()
+        event = PaymentWebhookEvent.objects.get()
+        _apply_payment_webhook(event.id)
+
+        response, delay = self.deliver()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(PaymentWebhookEvent.objects.count(), 1)
+        delay.assert_not_called()
+        # Applied once, the order is sold once
+        self.assertEqual(Selling.objects.filter(order=self.order).count(), 1)
+        self.assertEqual(_apply_payment_webhook(event.id), PaymentWebhookEvent.PROCESSED)
+        self.assertEqual(Selling.objects.filter(order=self.order).count(), 1)
+
+    def test_redelivery_of_unprocessed_event_is_enqueued_again(self):
+        self.deliver()
+        event = PaymentWebhookEvent.objects.get()
+
+        response, delay = self.deliver()
+        self.assertEqual(response.status_code, 200)
+        delay.assert_called_once_with(event.id)
+
+    def test_failed_event_is_processed_on_redelivery(self):
+        self.deliver(order_id="order_unknown")
+        event = PaymentWebhookEvent.objects.get()
+        self.assertEqual(_apply_payment_webhook(event.id), PaymentWebhookEvent.FAILED)
+
+        # The order turns up, e.g. it was committed after the first delivery
+        Order.objects.filter(pk=self.order.pk).update(razorpay_order_id="order_unknown")
+        response, delay = self.deliver(order_id="order_unknown")
+        delay.assert_called_once_with(event.id)
+        self.assertEqual(_apply_payment_webhook(event.id), PaymentWebhookEvent.PROCESSED)
+        self.assertTrue(Order.objects.get(pk=self.order.pk).is_paid)
+
+    def test_payment_beyond_stock_is_recorded_as_oversold(self):
+        self.deliver()
+        _apply_payment_webhook(PaymentWebhookEvent.objects.get().id)
+
+        self.variant.refresh_from_db()
+        self.assertEqual(self.variant.quantity, 0)
+        self.assertEqual(OrderItem.objects.get(order=self.order).oversold_quantity, 1)
+        self.assertEqual(Selling.objects.get(order=self.order).quantity, 3)
+
+
+@override_settings(
+    RAZORPAY_KEY_ID="rzp_test", RAZORPAY_KEY_SECRET="key-secret", RAZORPAY_MAX_RETRIES=2, RAZORPAY_RETRY_BACKOFF=0,
+    RAZORPAY_CIRCUIT_FAILURE_THRESHOLD=2, RAZORPAY_CIRCUIT_RESET_TIMEOUT=30,
+)
+class RazorpayGatewayTests(SimpleTestCase):
+
+    def setUp(self):
+        self.gateway = RazorpayGateway()
+
+    def test_requests_are_bounded_by_the_timeouts(self):
+        with mock.patch('requests.Session.request') as request:
+            self.gateway.session.get("https://api.razorpay.com/v1/payments/pay_1")
+        self.assertEqual(request.call_args.kwargs['timeout'], (settings.RAZORPAY_CONNECT_TIMEOUT, settings.RAZORPAY_READ_TIMEOUT))
+
+    def test_only_idempotent_calls_are_retried_after_a_timeout(self):
+        fetch = mock.Mock(side_effect=[requests.Timeout(), {'id': "pay_1"}])
+        self.assertEqual(self.gateway.call('payment.fetch', fetch, "pay_1", idempotent=True), {'id': "pay_1"})
+        self.assertEqual(fetch.call_count, 2)
+
+        create = mock.Mock(side_effect=requests.Timeout())
+        with self.assertRaises(requests.Timeout):
+            self.gateway.call('order.create', create, data={})
+        self.assertEqual(create.call_count, 1)
+
+    def test_circuit_opens_after_consecutive_failures(self):
+        create = mock.Mock(side_effect=requests.Timeout())
+        for _ in range(2):
+            with self.assertRaises(requests.Timeout):
+                self.gateway.call('order.create', create, data={})
+
+        with self.assertRaises(CircuitOpenError):
+            self.gateway.call('order.create', create, data={})
+        self.assertEqual(create.call_count, 2)
+
+        # Once the reset timeout passed a trial call goes through and closes it again
+        self.gateway.breaker.opened_at -= settings.RAZORPAY_CIRCUIT_RESET_TIMEOUT
+        create.side_effect = None
+        self.gateway.call('order.create', create, data={})
+        self.assertEqual(self.gateway.breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(self.gateway.metrics.snapshot()['order.create'], {'count': 4, 'errors': 3, 'total_latency': mock.ANY, 'max_latency': mock.ANY})
+
+
+class SalesRollupTests(CatalogTestCase):
+    variant_count = 2
+    variant_quantity = 5
+
+    def sell(self, variant, quantity, day):
+        order = Order.objects.create(user=self.buyer, total_price=variant.price * quantity)
+        OrderItem.objects.create(order=order, product_variant=variant, quantity=quantity)
+        DailySalesRollup.record(order.items.select_related('product_variant__product'), day)
+
+    def test_sells_versus_stock_reads_the_rollup_of_the_range(self):
+        today = timezone.localdate()
+        self.sell(self.variants[0], 2, today)
+        self.sell(self.variants[0], 1, today - timedelta(days=1))
+        self.sell(self.variants[1], 1, today)
+        self.sell(self.variants[1], 4, today - timedelta(days=40))
+
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        body = json.dumps({'start_date': (today - timedelta(days=7)).isoformat(), 'end_date': today.isoformat()})
+        with self.assertNumQueries(1):
+            response = client.generic('GET', "/order/sell-versus-stock/", body, content_type="application/json")
+        self.assertEqual(
+            [(row['product_variant'], row['total_sold'], row['total_stock']) for row in response.data],
+            [("R0", 3, 5), ("R1", 1, 5)],
+        )
+
+    def test_time_series_buckets_sales_and_is_cached_until_the_next_sale(self):
+        cache.clear()
+        self.sell(self.variants[0], 2, date(2026, 1, 6))
+        self.sell(self.variants[1], 1, date(2026, 1, 13))
+        self.sell(self.variants[0], 3, date(2026, 1, 14))
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        url = "/order/sales-timeseries/?start_date=2026-01-05&end_date=2026-01-25&granularity=week&window=2"
+
+        response = client.get(url)
+        self.assertEqual(response.data['periods'], ["2026-01-05", "2026-01-12", "2026-01-19"])
+        series = response.data['series'][0]
+        self.assertEqual(series['units'], [2.0, 4.0, 0.0])
+        self.assertEqual(series['revenue'], [200.0, 500.0, 0.0])
+        self.assertEqual(series['units_change'], [None, 2.0, -4.0])
+        self.assertEqual(series['units_change_percent'], [None, 100.0, -100.0])
+        self.assertEqual(series['units_moving_average'], [2.0, 3.0, 2.0])
+
+        with self.assertNumQueries(0):
+            self.assertEqual(client.get(url).data, response.data)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.sell(self.variants[1], 1, date(2026, 1, 20))
+        self.assertEqual(client.get(url).data['series'][0]['units'], [2.0, 4.0, 1.0])
+
+    def test_rebuild_keeps_the_price_of_the_sale(self):
+        order = Order.objects.create(user=self.buyer, total_price=200.0)
+        OrderItem.objects.create(order=order, product_variant=self.variant, quantity=2)
+        order.mark_paid("pay_1")
+        live = list(DailySalesRollup.objects.values_list('quantity', 'revenue'))
+
+        self.variant.price = 150.0
+        self.variant.save()
+        call_command('rebuild_sales_rollup', stdout=io.StringIO())
+
+        self.assertEqual(live, [(2, 200.0)])
+        self.assertEqual(list(DailySalesRollup.objects.values_list('quantity', 'revenue')), live)
+
+
+class MarkPaidStockTests(CatalogTestCase):
+    variant_quantity = 3
+
+    def test_only_stocked_variants_move_the_ledger(self):
+        # Units of a variant still in QC are counted as pending, not on hand
+        pending = ProductVariant.objects.create(product=self.variant.product, image="variant.png", carat=14, price=50.0, quantity=3)
+        Stock.objects.filter(product_variant=pending).update(qc_pending=3)
+        order = Order.objects.create(user=self.buyer, total_price=150.0)
+        OrderItem.objects.create(order=order, product_variant=self.variant, quantity=1)
+        OrderItem.objects.create(order=order, product_variant=pending, quantity=1)
+
+        order.mark_paid("pay_1")
+
+        self.assertEqual(list(StockMovement.objects.values_list('product_variant_id', 'movement_type', 'quantity')), [(self.variant.id, StockMovement.SALE, -1)])
+        self.assertEqual(Stock.objects.get(product_variant=self.variant).on_hand, 2)
+        stock = Stock.objects.get(product_variant=pending)
+        self.assertEqual((stock.on_hand, stock.qc_pending), (0, 2))
+
+
+class ExportTests(CatalogTestCase):
+    variant_count = 2
+    variant_quantity = 5
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.orders = []
+        for variant, quantity in ((cls.variants[1], 2), (cls.variants[0], 1)):
+            order = Order.objects.create(user=cls.buyer, total_price=variant.price * quantity)
+            OrderItem.objects.create(order=order, product_variant=variant, quantity=quantity)
+            order.mark_paid(f"pay_{order.pk}")
+            cls.orders.append(order)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_sellings_are_streamed_as_csv(self):
+        response = self.client.get("/order/sellings/export/")
+        self.assertTrue(response.streaming)
+        rows = list(csv.reader(b"".join(response.streaming_content).decode('utf-8').splitlines()))
+        self.assertEqual(rows[0], ['order_id', 'product_variant', 'product_type', 'product_brand', 'quantity', 'created_at'])
+        self.assertEqual([row[:5] for row in rows[1:]], [
+            [str(self.orders[0].pk), "R1", "Ring", "Classic", "2"],
+            [str(self.orders[1].pk), "R0", "Ring", "Classic", "1"],
+        ])
+
+    def test_sellings_are_exported_as_xlsx(self):
+        response = self.client.get("/order/sellings/export/", {'file_type': 'xlsx'})
+        sheet = load_workbook(io.BytesIO(b"".join(response.streaming_content)), read_only=True).active
+        rows = [row[:5] for row in sheet.iter_rows(values_only=True)]
+        self.assertEqual(rows[1:], [(self.orders[0].pk, "R1", "Ring", "Classic", 2), (self.orders[1].pk, "R0", "Ring", "Classic", 1)])
+
+        self.assertEqual(self.client.get("/order/sellings/export/", {'file_type': 'pdf'}).status_code, 400)
+
+    def test_invoice_list_export_has_only_the_customers_orders(self):
+        Order.objects.create(user=self.admin, total_price=100.0)
+        self.client.force_authenticate(self.buyer)
+        response = self.client.get("/order/invoices/list-export/")
+        rows = list(csv.reader(b"".join(response.streaming_content).decode('utf-8').splitlines()))
+        self.assertEqual([int(row[0]) for row in rows[1:]], [order.pk for order in self.orders])
+
+
+class OrderHistoryTests(CatalogTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        now = timezone.now()
+        cls.orders = []
+        for days in (1, 2, 3, 4, 5):
+            order = Order.objects.create(user=cls.buyer, total_price=100.0, is_paid=days % 2 == 0)
+            OrderItem.objects.create(order=order, product_variant=cls.variant, quantity=1)
+            Order.objects.filter(pk=order.pk).update(created_at=now - timedelta(days=days))
+            cls.orders.append(order)
+        Order.objects.create(user=cls.admin, total_price=100.0)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.buyer)
+
+    def test_history_pages_through_the_customers_orders_newest_first(self):
+        ids, url = [], "/order/?page_size=2"
+        while url:
+            # The page of orders and their items
+            with self.assertNumQueries(2):
+                response = self.client.get(url)
+            ids += [order['id'] for order in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(ids, [order.pk for order in self.orders])
+
+    def test_history_filters(self):
+        response = self.client.get("/order/", {'is_paid': 'true'})
+        self.assertEqual([order['id'] for order in response.data['results']], [self.orders[1].pk, self.orders[3].pk])
+
+        # A plain end date includes that whole day
+        day = timezone.localtime(timezone.now() - timedelta(days=2)).date().isoformat()
+        response = self.client.get("/order/", {'end_date': day})
+        self.assertEqual([order['id'] for order in response.data['results']], [order.pk for order in self.orders[1:]])
+
+        self.assertEqual(self.client.get("/order/", {'status': 'LOST'}).status_code, 400)
+
+
+class ArchivedOrderListingTests(CatalogTestCase):
+    """Archived orders stay in the invoice and payment listings, paid deleted ones in the finance ones."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        now = timezone.now()
+        cls.archived, cls.deleted, cls.live = [Order.objects.create(user=cls.buyer, total_price=100.0 * (i + 1)) for i in range(3)]
+        for days, order in ((30, cls.archived), (20, cls.deleted), (10, cls.live)):
+            Order.all_objects.filter(pk=order.pk).update(created_at=now - timedelta(days=days))
+        Order.all_objects.filter(pk=cls.deleted.pk).update(is_paid=True, is_deleted=True)
+        archive_batch([Order.all_objects.get(pk=cls.archived.pk)])
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_invoice_list_pages_through_live_and_archived_orders(self):
+        self.client.force_authenticate(self.buyer)
+        ids, url = [], "/order/invoices/?page_size=1"
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids += [order['id'] for order in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(ids, [self.live.pk, self.archived.pk])
+
+    def test_order_payments_include_deleted_paid_and_archived_orders(self):
+        self.client.force_authenticate(self.admin)
+        response = self.client.get("/order/order-payments/")
+        self.assertEqual([order['id'] for order in response.data['results']], [self.live.pk, self.deleted.pk, self.archived.pk])
+
+        response = self.client.get("/order/order-payments/export/")
+        rows = b"".join(response.streaming_content).decode('utf-8').splitlines()[1:]
+        self.assertEqual([int(row.split(',')[0]) for row in rows], [self.archived.pk, self.deleted.pk, self.live.pk])
+
+    def test_archived_invoice_can_be_downloaded(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.client.force_authenticate(self.buyer)
+        with override_settings(MEDIA_ROOT=media_root):
+            response = self.client.get(f"/order/invoices/{self.archived.pk}/download/")
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(b"".join(response.streaming_content).startswith(b"%PDF"))
+        self.assertTrue(ArchivedOrder.objects.get(pk=self.archived.pk).invoice_hash)
+        self.assertEqual(self.client.get(f"/order/invoices/{self.deleted.pk}/download/").status_code, 404)
+
+
+@override_settings(CELERY_TASK_ALWAYS_EAGER=True)
+class InvoiceCacheTests(TemporaryMediaMixin, CatalogTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.order = Order.objects.create(user=self.buyer, total_price=100.0)
+        OrderItem.objects.create(order=self.order, product_variant=self.variant, quantity=1)
+
+    def test_paid_order_is_rendered_by_the_worker_and_downloaded_as_stored(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.order.mark_paid("pay_1")
+        self.order.refresh_from_db()
+        self.assertTrue(default_storage.exists(self.order.invoice_file.name))
+
+        client = APIClient()
+        client.force_authenticate(self.buyer)
+        with mock.patch.object(Order, 'generate_invoice') as generate_invoice:
+            response = client.get(f"/order/invoices/{self.order.pk}/download/")
+            self.assertTrue(b"".join(response.streaming_content).startswith(b"%PDF"))
+        generate_invoice.assert_not_called()
+
+    def test_invoice_is_rendered_again_only_after_the_order_changed(self):
+        self.assertTrue(ensure_invoice(self.order))
+        first = self.order.invoice_file.name
+        self.assertFalse(ensure_invoice(Order.objects.get(pk=self.order.pk)))
+
+        Order.objects.filter(pk=self.order.pk).update(status=Order.SHIPPED)
+        order = Order.objects.get(pk=self.order.pk)
+        self.assertTrue(ensure_invoice(order))
+        self.assertNotEqual(order.invoice_file.name, first)
+
+
+@override_settings(CELERY_TASK_ALWAYS_EAGER=True)
+class InvoiceExportTests(TemporaryMediaMixin, CatalogTestCase):
+    """The export's task runs as a prefork Celery worker would, where a process pool cannot start."""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        self.orders = [Order.objects.create(user=self.buyer, total_price=100.0) for _ in range(2)]
+        for order in self.orders:
+            OrderItem.objects.create(order=order, product_variant=self.variant, quantity=1)
+        pool = mock.patch('orders.invoices.django_process_pool', side_effect=AssertionError("daemonic processes are not allowed to have children"))
+        pool.start()
+        self.addCleanup(pool.stop)
+
+    def test_missing_invoices_are_rendered_by_the_task(self):
+        response = self.client.get("/order/invoices/export/")
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['total'], 2)
+
+        response = self.client.get("/order/invoices/export/")
+        self.assertEqual(response.status_code, 200)
+        with zipfile.ZipFile(io.BytesIO(b"".join(response.streaming_content))) as archive:
+            self.assertEqual(sorted(archive.namelist()), sorted(f"invoice_{order.order_number}.pdf" for order in self.orders))
+
+    def test_failed_render_is_started_again_by_the_next_poll(self):
+        with mock.patch('orders.invoices.ensure_invoice', side_effect=OSError("No space left on device")) as ensure:
+            self.assertEqual(self.client.get("/order/invoices/export/").status_code, 202)
+            self.assertEqual(self.client.get("/order/invoices/export/").status_code, 202)
+        self.assertEqual(ensure.call_count, 2)
+
+        self.assertEqual(self.client.get("/order/invoices/export/").status_code, 202)
+        self.assertEqual(self.client.get("/order/invoices/export/").status_code, 200)
+
+
+class InboxTests(CatalogTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        self.order = Order.objects.create(user=self.buyer, total_price=100.0)
+
+    def notify(self):
+        notification = Notification.objects.create(order=self.order, token_payment=30.0, sender=self.buyer, receiver=str(self.admin.id))
+        with self.captureOnCommitCallbacks(execute=True):
+            deliver(notification, [self.admin])
+        return notification
+
+    def count(self):
+        return self.client.get("/notifications/count/").data['unread_notification_count']
+
+    def test_unread_counter_follows_deliveries_and_reads(self):
+        first = self.notify()
+        self.assertEqual(self.count(), 1)
+
+        # Later changes move the cached counter, reading it is free
+        self.notify()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.count(), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(mark_read(NotificationRecipient.objects.filter(notification=first)), 1)
+            self.assertEqual(mark_read(NotificationRecipient.objects.filter(notification=first)), 0)
+        self.assertEqual(self.count(), 1)
+
+        # Delivered again, a read entry is unread once more
+        with self.captureOnCommitCallbacks(execute=True):
+            deliver(first, [self.admin])
+        self.assertEqual(self.count(), 2)
+        self.assertEqual(unread_count(self.buyer), 0)
+
+
+@override_settings(SWEEP_BATCH_SIZE=1, STALE_ORDER_DAYS=30)
+class SweeperTests(CatalogTestCase):
+    variant_quantity = 3
+
+    def order(self, days_old=0, expires_in=None):
+        order = Order.objects.create(user=self.buyer, total_price=100.0)
+        OrderItem.objects.create(order=order, product_variant=self.variant, quantity=1)
+        now = timezone.now()
+        changes = {'created_at': now - timedelta(days=days_old)}
+        if expires_in is not None:
+            changes.update(is_approved=True, payment_expires_at=now + expires_in)
+            reserve_items([(self.variant.id, 1)])
+        Order.objects.filter(pk=order.pk).update(**changes)
+        return order
+
+    def test_sweep_expires_approvals_and_cancels_stale_orders(self):
+        expired = [self.order(expires_in=-timedelta(minutes=1)) for _ in range(2)]
+        open_window = self.order(expires_in=timedelta(minutes=10))
+        stale = self.order(days_old=31)
+        fresh = self.order(days_old=29)
+
+        metrics = sweep_expired_records()
+
+        self.assertEqual({name: values['rows'] for name, values in metrics.items()}, {'expired_approvals': 2, 'stale_orders': 1, 'expired_links': 0})
+        self.assertFalse(Order.objects.filter(pk__in=[order.pk for order in expired], is_approved=True).exists())
+        self.assertTrue(Order.objects.get(pk=open_window.pk).is_approved)
+        # Only the reservation of the order still in its payment window is held
+        self.assertEqual(Stock.objects.get(product_variant=self.variant).reserved, 1)
+        self.assertEqual(Order.objects.get(pk=stale.pk).status, Order.CANCELED)
+        self.assertEqual(Order.objects.get(pk=fresh.pk).status, Order.PENDING)
+
+
+class ApprovalStockTests(CatalogTestCase):
+    variant_quantity = 2
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def request_payment(self, quantity):
+        order = Order.objects.create(user=self.buyer, total_price=100.0 * quantity)
+        OrderItem.objects.create(order=order, product_variant=self.variant, quantity=quantity)
+        return order, Notification.objects.create(order=order, token_payment=30.0 * quantity, sender=self.buyer, receiver=str(self.admin.id))
+
+    def approve(self, notification):
+        return self.client.patch(
+            f"/approve-order-payment-notification/{notification.id}/", {'is_approved': True, 'time_duration': "01:00:00"}, format='json',
+        )
+
+    def test_approval_beyond_available_stock_is_rejected(self):
+        _, first = self.request_payment(2)
+        order, second = self.request_payment(1)
+        self.assertEqual(self.approve(first).status_code, 200)
+
+        response = self.approve(second)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['shortfall'], {self.variant.id: 1})
+        order.refresh_from_db()
+        self.assertFalse(order.is_approved)
+        self.assertEqual(Stock.objects.get(product_variant=self.variant).reserved, 2)
+
+    def test_variant_without_stock_row_is_not_available(self):
+        order, _ = self.request_payment(1)
+        Stock.objects.filter(product_variant=self.variant).delete()
+        self.assertFalse(VerifyPayment().check_stock_availability(order))
+
+
+class EventStreamTests(CatalogTestCase):
+
+    def scope(self, query="", method="GET", origin="http://localhost:8000"):
+        return {
+            'type': 'http', 'method': method, 'path': '/events/notifications/', 'query_string': query.encode('latin1'),
+            'headers': [(b'origin', origin.encode('latin1'))],
+        }
+
+    def call(self, scope):
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        async def receive():
+            return {'type': 'http.disconnect'}
+
+        async_to_sync(notification_stream)(scope, receive, send)
+        return messages[0]['status'], dict(messages[0]['headers'])
+
+    def test_ticket_opens_one_stream(self):
+        client = APIClient()
+        client.force_authenticate(self.buyer)
+        response = client.post("/notifications/stream-ticket/")
+        self.assertEqual(response.status_code, 201)
+
+        scope = self.scope(f"ticket={response.data['ticket']}")
+        self.assertEqual(async_to_sync(authenticate)(scope), self.buyer)
+        self.assertIsNone(async_to_sync(authenticate)(scope))
+
+    def test_events_are_published_once_committed(self):
+        with mock.patch('orders.events.get_redis') as get_redis:
+            with self.captureOnCommitCallbacks() as callbacks:
+                publish([self.buyer.id, self.admin.id, self.buyer.id], PAYMENT_APPROVED, {'order': 1})
+            get_redis.return_value.publish.assert_not_called()
+            callbacks[0]()
+        channel, message = get_redis.return_value.publish.call_args.args
+        self.assertEqual(channel, settings.EVENTS_CHANNEL)
+        self.assertEqual(json.loads(message), {'users': sorted([self.buyer.id, self.admin.id]), 'event': PAYMENT_APPROVED, 'data': {'order': 1}})
+
+    def test_broker_fans_events_out_to_the_queues_of_their_users(self):
+        broker = EventBroker()
+        buyer_queue, admin_queue = asyncio.Queue(maxsize=CLIENT_QUEUE_SIZE), asyncio.Queue(maxsize=CLIENT_QUEUE_SIZE)
+        broker.queues = {self.buyer.id: {buyer_queue}, self.admin.id: {admin_queue}}
+        for number in range(CLIENT_QUEUE_SIZE + 1):
+            broker.dispatch(json.dumps({'users': [self.buyer.id], 'event': PAYMENT_APPROVED, 'data': {'number': number}}))
+
+        self.assertTrue(admin_queue.empty())
+        # A client that is not reading loses the oldest events
+        self.assertEqual(buyer_queue.qsize(), CLIENT_QUEUE_SIZE)
+        self.assertEqual(buyer_queue.get_nowait(), {'event': PAYMENT_APPROVED, 'data': {'number': 1}})
+
+    @override_settings(CORS_ALLOW_ALL_ORIGINS=False, CORS_ALLOWED_ORIGINS=["http://localhost:8000"])
+    def test_cors_follows_the_api_settings(self):
+        status_code, headers = self.call(self.scope(method="OPTIONS"))
+        self.assertEqual(status_code, 200)
+        self.assertEqual(headers[b'access-control-allow-origin'], b"http://localhost:8000")
+        self.assertIn(b"authorization", headers[b'access-control-allow-headers'])
+
+        status_code, headers = self.call(self.scope("ticket=unknown"))
+        self.assertEqual(status_code, 401)
+        self.assertEqual(headers[b'access-control-allow-origin'], b"http://localhost:8000")
+
+        _, headers = self.call(self.scope(method="OPTIONS", origin="http://evil.example"))
+        self.assertNotIn(b'access-control-allow-origin', headers)
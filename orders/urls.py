@@ -1,5 +1,5 @@
 from django.urls import path
-from .views import OrderAPIView, CreateRazorpayOrder, VerifyPayment, SellingListAPI, SellsVsStockAPI, OrderPaymentListView, InvoiceListView, DownloadInvoiceView 
+from .views import OrderAPIView, CreateRazorpayOrder, VerifyPayment, SellingListAPI, SellsVsStockAPI, OrderPaymentListView, InvoiceListView, DownloadInvoiceView, RazorpayWebhookView, InvoiceExportView, SalesTimeSeriesAPI, SellingExportAPI, OrderPaymentExportView, InvoiceListExportView
 
 urlpatterns = [
     # Product Type API
@@ -7,9 +7,15 @@ urlpatterns = [
     path('<int:pk>/', OrderAPIView.as_view(), name='product_type_detail'),
     path('checkout-order/', CreateRazorpayOrder.as_view(), name='checkout_order'),
     path('verify-payment/', VerifyPayment.as_view(), name='verify_payment'),
+    path('razorpay/webhook/', RazorpayWebhookView.as_view(), name='razorpay_webhook'),
     path('sellings/', SellingListAPI.as_view(), name='selling-list'),
+    path('sellings/export/', SellingExportAPI.as_view(), name='selling-export'),
     path('sell-versus-stock/', SellsVsStockAPI.as_view(), name='sell-versus-stock'),
+    path('sales-timeseries/', SalesTimeSeriesAPI.as_view(), name='sales-timeseries'),
     path('order-payments/', OrderPaymentListView.as_view(), name='order-payment-list'),
+    path('order-payments/export/', OrderPaymentExportView.as_view(), name='order-payment-export'),
     path('invoices/', InvoiceListView.as_view(), name='invoice-list'),
+    path('invoices/list-export/', InvoiceListExportView.as_view(), name='invoice-list-export'),
+    path('invoices/export/', InvoiceExportView.as_view(), name='invoice-export'),
     path('invoices/<int:pk>/download/', DownloadInvoiceView.as_view(), name='invoice-download'),
 ]
\ No newline at end of file
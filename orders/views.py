@@ -2,19 +2,38 @@ from rest_framework import status, permissions, generics
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from .models import Order, Notification, OrderItem, Selling
-from .serializers import OrderSerializer, SendPaymentRequestSerializer, SellingSerializer, OrderPaymentSerializer, InvoiceListSerializer
+from .models import Order, Notification, NotificationRecipient, OrderItem, Selling, ArchivedSelling, PaymentWebhookEvent, DailySalesRollup
+from .serializers import OrderSerializer, SendPaymentRequestSerializer, OrderPaymentSerializer, InvoiceListSerializer
 from django.shortcuts import get_object_or_404
 from django.db import transaction
 from django.conf import settings
+from django.core.cache import cache
 from django.utils import timezone
 import razorpay
 from datetime import timedelta
 from product.models import ProductVariant, ProductType, BrandType
 from datetime import datetime
-from django.db.models import Sum
+from django.db.models import Sum, F, Prefetch, Value
+from django.db.models.functions import Coalesce
 from django.utils.dateparse import parse_datetime
-from django.http import FileResponse
+from django.http import FileResponse, Http404, StreamingHttpResponse
+from .tasks import process_payment_webhook, render_invoice_export
+from .gateway import get_gateway, CircuitOpenError
+from .analytics import sales_time_series, GRANULARITIES, SPLIT_FIELDS
+from .exports import export_response, EXPORT_TYPES
+from .pagination import OrderCursorPagination, filter_orders
+from .archive import customer_orders, finance_orders
+from .inbox import deliver, mark_read, unread_count as unread_count_for
+from stocks.projection import lock_shortfall, reserve_items
+from .events import publish, issue_stream_ticket, notification_event_data, PAYMENT_REQUESTED, PAYMENT_APPROVED, PAYMENT_DECLINED
+from .invoices import EXPORT_PROGRESS_TIMEOUT, ensure_invoice, export_progress_key, find_stale_invoices, stream_invoice_zip
+import hashlib
+import heapq
+import json
+import logging
+from operator import attrgetter
+
+logger = logging.getLogger(__name__)
 
 
 class OrderAPIView(APIView):
@@ -30,9 +49,19 @@ class OrderAPIView(APIView):
             serializer = OrderSerializer(order)
             return Response(serializer.data)
         
-        orders = Order.objects.filter(user=request.user)
-        serializer = OrderSerializer(orders, many=True)
-        return Response(serializer.data)
+        orders = Order.objects.filter(user=request.user).prefetch_related(
+            Prefetch('items', queryset=OrderItem.objects.select_related('product_variant'))
+        )
+        try:
+            orders = filter_orders(orders, request.query_params)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        # One page of orders plus one query for their items
+        paginator = OrderCursorPagination()
+        page = paginator.paginate_queryset(orders, request, view=self)
+        serializer = OrderSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
     def post(self, request, *args, **kwargs):
         """
@@ -54,7 +83,8 @@ class OrderAPIView(APIView):
         Delete an existing order for the authenticated user.
         """
         order = get_object_or_404(Order, pk=kwargs.get('pk'), user=request.user)
-        order.delete()
+        # Soft delete, the order stays available to reports and the archive
+        order.soft_delete(user=request.user)
         return Response({"message": "Order successfully deleted"}, status=status.HTTP_204_NO_CONTENT)
 
     
@@ -73,7 +103,9 @@ class SendPaymentRequest(APIView):
             notifications = Notification.objects.all()
         else:
             notifications = Notification.objects.filter(sender_id=self.request.user.id)
-            notifications.update(is_read=True)
+            # Only the unread entries are touched, through the partial unread index
+            mark_read(NotificationRecipient.objects.filter(user=self.request.user), user=self.request.user)
+            notifications.filter(is_read=False).update(is_read=True)
         serializer = SendPaymentRequestSerializer(notifications, many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
     
@@ -118,10 +150,14 @@ class SendPaymentRequest(APIView):
         # Use the serializer to save the notification
         serializer = SendPaymentRequestSerializer(data=payment_data)
         if serializer.is_valid():
-            notification = serializer.save(
-                created_by = self.request.user,
-                updated_by = self.request.user
-            )
+            with transaction.atomic():
+                notification = serializer.save(
+                    created_by = self.request.user,
+                    updated_by = self.request.user
+                )
+                # One inbox entry per admin
+                deliver(notification, receivers, created_by=self.request.user)
+                publish([receiver.id for receiver in receivers], PAYMENT_REQUESTED, notification_event_data(notification))
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -139,13 +175,18 @@ class DeleteNotification(APIView):
             return Response({"error": "You are not authorized to delete this notification."}, status=status.HTTP_403_FORBIDDEN)
 
         # If authorized, delete the notification
-        notification.status=Notification.DECLINED
-        notification.is_admin_read=True
-        notification.is_read=False
-        notification.save(
-            created_by = self.request.user,
-            updated_by = self.request.user
-        )
+        with transaction.atomic():
+            notification.status=Notification.DECLINED
+            notification.is_admin_read=True
+            notification.is_read=False
+            notification.updated_by = self.request.user
+            notification.save()
+
+            # Handled for every admin, and the buyer is told about it
+            mark_read(notification.recipients.exclude(user_id=notification.sender_id), user=self.request.user)
+            if notification.sender:
+                deliver(notification, [notification.sender], created_by=self.request.user)
+                publish([notification.sender_id], PAYMENT_DECLINED, notification_event_data(notification))
         return Response({"message": "Notification deleted successfully."}, status=status.HTTP_204_NO_CONTENT)
 
 
@@ -190,10 +231,21 @@ class ApproveNotificationAPIView(APIView):
         # Start a transaction to update both Notification and Order
         with transaction.atomic():
             # Set the order's approval and time_duration
-            order = notification.order
+            order = Order.objects.select_for_update().get(pk=notification.order_id)
+            if not order.is_approved and not order.is_paid:
+                # Hold the items for the buyer while the payment window is open, if they are still there
+                items = list(order.items.values_list('product_variant_id', 'quantity'))
+                shortfall = lock_shortfall(items)
+                if shortfall:
+                    return Response(
+                        {'error': 'Not enough stock available to approve this order.', 'shortfall': shortfall},
+                        status=status.HTTP_409_CONFLICT,
+                    )
+                reserve_items(items)
             order.time_duration = time_duration
             order.is_approved = True
             order.updated_at = timezone.now()
+            order.payment_expires_at = order.updated_at + time_duration
             order.updated_by = self.request.user
             order.save()
 
@@ -203,6 +255,12 @@ class ApproveNotificationAPIView(APIView):
             notification.is_read = False
             notification.save()
 
+            # Handled for every admin, and the buyer is told about it
+            mark_read(notification.recipients.exclude(user_id=notification.sender_id), user=self.request.user)
+            if notification.sender:
+                deliver(notification, [notification.sender], created_by=self.request.user)
+                publish([notification.sender_id], PAYMENT_APPROVED, notification_event_data(notification))
+
         return Response({'message': 'Notification approved and payment window set.'}, status=status.HTTP_200_OK)
 
 
@@ -211,18 +269,23 @@ class NotificationCountAPIView(APIView):
 
     def get(self, request):
         user = self.request.user
-        
-        # Admins get the count of all unread notifications
-        if user.is_superuser:
-            unread_count = Notification.objects.filter(is_admin_read=False).count()
-        
-        # Regular users get the count of their own unread notifications
-        else:
-            unread_count = Notification.objects.filter(sender=user, is_read=False).count()
+
+        # Admins count unhandled payment requests, buyers the replies to theirs,
+        # both from the per-user counter kept in the cache
+        unread_count = unread_count_for(user)
 
         return Response({'unread_notification_count': unread_count}, status=status.HTTP_200_OK)
 
 
+class EventStreamTicketAPIView(APIView):
+    """Issues a one-time ticket for opening the notification event stream (`?ticket=`)."""
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        ticket = issue_stream_ticket(request.user)
+        return Response({'ticket': ticket, 'expires_in': settings.EVENTS_TICKET_TIMEOUT}, status=status.HTTP_201_CREATED)
+
+
 class CreateRazorpayOrder(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -235,12 +298,6 @@ class CreateRazorpayOrder(APIView):
 
         if order.valid_time() and not order.is_paid:
         
-            # Razorpay client initialization
-            client = razorpay.Client(
-                auth=(settings.RAZORPAY_KEY_ID,
-                settings.RAZORPAY_KEY_SECRET)
-            )
-            
             # Create a Razorpay order
             razorpay_order_data = {
                 "amount": int(order.total_price * 100),  # amount in paise (INR)
@@ -250,7 +307,7 @@ class CreateRazorpayOrder(APIView):
             }
             
             try:
-                razorpay_order = client.order.create(data=razorpay_order_data)
+                razorpay_order = get_gateway().create_order(razorpay_order_data)
                 order.razorpay_order_id = razorpay_order['id']
                 order.created_by = self.request.user
                 order.updated_by = self.request.user
@@ -265,6 +322,8 @@ class CreateRazorpayOrder(APIView):
                     "order_id": order.id
                 }, status=status.HTTP_200_OK)
 
+            except CircuitOpenError as e:
+                return Response({"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
             except Exception as e:
                 return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         else:
@@ -287,7 +346,6 @@ class VerifyPayment(APIView):
             return Response({"error": "Insufficient stock for one or more items"}, status=status.HTTP_400_BAD_REQUEST)
 
         # Proceed to verify the payment signature
-        client = razorpay.Client(auth=(settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_SECRET))
         params_dict = {
             'razorpay_order_id': razorpay_order_id,
             'razorpay_payment_id': razorpay_payment_id,
@@ -295,90 +353,144 @@ class VerifyPayment(APIView):
         }
 
         try:
-            client.utility.verify_payment_signature(params_dict)
+            get_gateway().verify_payment_signature(params_dict)
+        except razorpay.errors.SignatureVerificationError:
+            return Response({"error": "Payment verification failed"}, status=status.HTTP_400_BAD_REQUEST)
 
-            # Mark the order as paid
-            order.razorpay_payment_id = razorpay_payment_id
-            order.is_paid = True
-            order.created_by = self.request.user
-            order.updated_by = self.request.user
-            order.save()
+        # Mark the order as paid, update stock and log the sale (no-op if the webhook got there first)
+        order.mark_paid(razorpay_payment_id, user=self.request.user)
+
+        return Response({"status": "Payment Successful"}, status=status.HTTP_200_OK)
+
+    def check_stock_availability(self, order):
+        """Check if stock is available for all order items."""
+        # Units reserved for this order by its approval count as available to it
+        own_reservation = F('quantity') if order.is_approved else Value(0)
+        # Variants without a stock row have nothing available (an alias keeps the join to stock outer)
+        return not OrderItem.objects.alias(available=Coalesce(F('product_variant__stock__available'), 0)) \
+            .filter(order_id=order.id, quantity__gt=F('available') + own_reservation).exists()
 
-            # Update stock and log history
-            self.update_stock(order)
-            
-            OrderItemData = OrderItem.objects.filter(order=order)
-            for OrderItemObj in OrderItemData:
-                Selling.objects.create(order=order, product_variant=OrderItemObj.product_variant, quantity=OrderItemObj.quantity)
 
-            return Response({"status": "Payment Successful"}, status=status.HTTP_200_OK)
+class RazorpayWebhookView(APIView):
+    """
+    Receives Razorpay webhooks, stores them in the webhook inbox and hands
+    processing to the Celery worker so the request returns immediately.
+    """
+    permission_classes = [permissions.AllowAny]
+    authentication_classes = []
 
+    def post(self, request, *args, **kwargs):
+        if not settings.RAZORPAY_WEBHOOK_SECRET:
+            # Without the secret no signature can be checked, Razorpay retries the delivery later
+            logger.error("Rejected a Razorpay webhook, RAZORPAY_WEBHOOK_SECRET is not set")
+            return Response({"error": "Webhooks are not configured"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        body = request.body.decode('utf-8')
+        signature = request.headers.get('X-Razorpay-Signature', '')
+
+        try:
+            get_gateway().verify_webhook_signature(body, signature)
         except razorpay.errors.SignatureVerificationError:
-            return Response({"error": "Payment verification failed"}, status=status.HTTP_400_BAD_REQUEST)
+            return Response({"error": "Invalid webhook signature"}, status=status.HTTP_400_BAD_REQUEST)
 
-    def check_stock_availability(self, order):
-        """Check if stock is available for all order items."""
-        order_items = OrderItem.objects.filter(order_id=order.id)
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            return Response({"error": "Invalid webhook payload"}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Razorpay sends the same event ID on every redelivery, fall back to the body hash
+        event_id = request.headers.get('X-Razorpay-Event-Id') or hashlib.sha256(body.encode('utf-8')).hexdigest()
+
+        event, _ = PaymentWebhookEvent.objects.get_or_create(
+            event_id=event_id,
+            defaults={'event_type': payload.get('event', ''), 'payload': payload},
+        )
+        # Redeliveries of an event that never went through (broker down, retries used up,
+        # order not found yet) are processed again, finished ones are only acknowledged
+        if event.status not in (PaymentWebhookEvent.PROCESSED, PaymentWebhookEvent.IGNORED):
+            transaction.on_commit(lambda: process_payment_webhook.delay(event.id))
+
+        return Response({"status": "received"}, status=status.HTTP_200_OK)
+
+
+def filter_sellings(queryset, params):
+    """Applies the product type, brand and date range filters shared by the selling list and export."""
+    product_type = params.get('product_type', None)
+    product_brand = params.get('product_brand', None)
+    start_date = params.get('start_date', None)
+    end_date = params.get('end_date', None)
+
+    # Filter by product type if provided
+    if product_type:
+        product_type_obj = ProductType.objects.filter(name=product_type).first()
+        if product_type_obj:
+            queryset = queryset.filter(product_variant__product__product_type=product_type_obj)
+
+    # Filter by product brand if provided
+    if product_brand:
+        product_brand_obj = BrandType.objects.filter(name=product_brand).first()
+        if product_brand_obj:
+            queryset = queryset.filter(product_variant__product__product_brand=product_brand_obj)
 
-        for order_item in order_items:
-            Variant = ProductVariant.objects.filter(product_variant=order_item.product_variant).first()
-            if not Variant or Variant.quantity < order_item.quantity:
-                # Insufficient stock for this order item
-                return False
-        # All stocks are available
-        return True  
+    # Filter by date range if provided, raises ValueError for malformed dates
+    if start_date and end_date:
+        start_date_obj = datetime.strptime(start_date, '%Y-%m-%d')
+        end_date_obj = datetime.strptime(end_date, '%Y-%m-%d')
+        queryset = queryset.filter(created_at__range=[start_date_obj, end_date_obj])
 
-    def update_stock(self, request, order):
-        """Update stock based on order items and log history."""
-        order_items = OrderItem.objects.filter(order_id=order.id)
+    return queryset
 
-        for order_item in order_items:
-            Variant = get_object_or_404(ProductVariant, product_variant=order_item.product_variant)
 
-            # Decrease stock quantity
-            Variant.quantity -= order_item.quantity
-            Variant.created_by = self.request.user
-            Variant.updated_by = self.request.user
-            Variant.save()
+# Report column -> lookup, shared by the live and the archived selling tables
+SELLING_REPORT_COLUMNS = (
+    ('order_id', 'order_id'),
+    ('product_variant', 'product_variant__product__code'),
+    ('product_type', 'product_variant__product__product_type__name'),
+    ('product_brand', 'product_variant__product__product_brand__name'),
+    ('quantity', 'quantity'),
+    ('created_at', 'created_at'),
+)
+
+
+def selling_report(params):
+    """Rows of the selling report, archived sellings included, oldest first."""
+    lookups = [lookup for _, lookup in SELLING_REPORT_COLUMNS]
+    live = filter_sellings(Selling.objects.all(), params).values_list(*lookups)
+    archived = filter_sellings(ArchivedSelling.objects.all(), params).values_list(*lookups)
+    return live.union(archived, all=True).order_by('created_at')
 
 
 class SellingListAPI(APIView):
     permission_classes = [permissions.IsAdminUser]
 
     def get(self, request, *args, **kwargs):
-        # Get query parameters for filtering
-        product_type = self.request.data.get('product_type', None)
-        product_brand = self.request.data.get('product_brand', None)
-        start_date = self.request.data.get('start_date', None)
-        end_date = self.request.data.get('end_date', None)
-
-        # Start building the queryset
-        queryset = Selling.objects.all()
-
-        # Filter by product type if provided
-        if product_type:
-            product_type_obj = ProductType.objects.filter(name=product_type).first()
-            if product_type_obj:
-                queryset = queryset.filter(product_variant__product__product_type=product_type_obj)
-
-        # Filter by product brand if provided
-        if product_brand:
-            product_brand_obj = BrandType.objects.filter(name=product_brand).first()
-            if product_brand_obj:
-                queryset = queryset.filter(product_variant__product__product_brand=product_brand_obj)
-
-        # Filter by date range if provided
-        if start_date and end_date:
-            try:
-                start_date_obj = datetime.strptime(start_date, '%Y-%m-%d')
-                end_date_obj = datetime.strptime(end_date, '%Y-%m-%d')
-                queryset = queryset.filter(created_at__range=[start_date_obj, end_date_obj])
-            except ValueError:
-                return Response({"error": "Invalid date format. Please use YYYY-MM-DD."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            rows = selling_report(self.request.data)
+        except ValueError:
+            return Response({"error": "Invalid date format. Please use YYYY-MM-DD."}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Serialize the data
-        serializer = SellingSerializer(queryset, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        # Same shape as SellingSerializer, built from the row values
+        names = [name for name, _ in SELLING_REPORT_COLUMNS]
+        data = [dict(zip(names, row)) for row in rows]
+        return Response(data, status=status.HTTP_200_OK)
+
+
+class SellingExportAPI(APIView):
+    """Streams the selling report as CSV or XLSX (`?file_type=xlsx`)."""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        export_type = request.query_params.get('file_type', 'csv')
+        if export_type not in EXPORT_TYPES:
+            return Response({"error": f"file_type must be one of {', '.join(EXPORT_TYPES)}."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            rows = selling_report(request.query_params)
+        except ValueError:
+            return Response({"error": "Invalid date format. Please use YYYY-MM-DD."}, status=status.HTTP_400_BAD_REQUEST)
+
+        header = [name for name, _ in SELLING_REPORT_COLUMNS]
+        return export_response(export_type, 'sellings', header, rows)
 
 
 class SellsVsStockAPI(APIView):
@@ -399,77 +511,124 @@ class SellsVsStockAPI(APIView):
         else:
             return Response({"error": "Both start_date and end_date are required."}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Query Selling data within the date range and aggregate total quantity sold per product variant
-        sold_data = Selling.objects.filter(created_at__range=[start_date_obj, end_date_obj]) \
-            .values('product_variant') \
-            .annotate(total_sold=Sum('quantity'))
-
-        # Prepare final result by combining sold and stock data
-        result = []
-        for sold in sold_data:
-            product_variant_id = sold['product_variant']
-            total_sold = sold['total_sold']
-
-            # Get the product variant object and stock quantity directly from the variant
-            product_variant = ProductVariant.objects.get(id=product_variant_id)
-            total_stock = product_variant.quantity  # Stock is stored directly in ProductVariant
-
-            # Get product details (e.g., code, product type, product brand)
-            product = product_variant.product
-            result.append({
-                'product_variant': product.code,
-                'product_type': product.product_type.name,
-                'product_brand': product.product_brand.name,
-                'total_sold': total_sold,
-                'total_stock': total_stock
-            })
+        # One grouped query over the daily rollup, joined with the variant for its code and stock
+        sold_data = DailySalesRollup.objects.filter(date__range=[start_date_obj.date(), end_date_obj.date()]) \
+            .values(
+                'product_variant_id',
+                product_code=F('product_variant__product__code'),
+                product_type_name=F('product_type__name'),
+                product_brand_name=F('product_brand__name'),
+                total_stock=F('product_variant__quantity'),
+            ) \
+            .annotate(total_sold=Sum('quantity')) \
+            .order_by('product_variant_id')
+
+        result = [
+            {
+                'product_variant': sold['product_code'],
+                'product_type': sold['product_type_name'],
+                'product_brand': sold['product_brand_name'],
+                'total_sold': sold['total_sold'],
+                'total_stock': sold['total_stock'],
+            }
+            for sold in sold_data
+        ]
 
         return Response(result, status=status.HTTP_200_OK)
 
+class SalesTimeSeriesAPI(APIView):
+    """
+    Revenue and units sold per day, week or month, optionally split by
+    product_type, product_brand, product_category or carat.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        start_date = request.query_params.get('start_date', None)
+        end_date = request.query_params.get('end_date', None)
+        granularity = request.query_params.get('granularity', 'day')
+        split_by = request.query_params.get('split_by', None)
+
+        if not start_date or not end_date:
+            return Response({"error": "Both start_date and end_date are required."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            start_date_obj = datetime.strptime(start_date, '%Y-%m-%d').date()
+            end_date_obj = datetime.strptime(end_date, '%Y-%m-%d').date()
+        except ValueError:
+            return Response({"error": "Invalid date format. Please use YYYY-MM-DD."}, status=status.HTTP_400_BAD_REQUEST)
+
+        if granularity not in GRANULARITIES:
+            return Response({"error": f"granularity must be one of {', '.join(GRANULARITIES)}."}, status=status.HTTP_400_BAD_REQUEST)
+        if split_by and split_by not in SPLIT_FIELDS:
+            return Response({"error": f"split_by must be one of {', '.join(SPLIT_FIELDS)}."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            window = int(request.query_params.get('window', 7))
+            if window < 1:
+                raise ValueError
+        except ValueError:
+            return Response({"error": "window must be a positive integer."}, status=status.HTTP_400_BAD_REQUEST)
+
+        data = sales_time_series(start_date_obj, end_date_obj, granularity, split_by, window)
+        return Response(data, status=status.HTTP_200_OK)
+
+
+def filter_order_payments(queryset, params):
+    """Filter by date range (start_date and end_date, ISO format), raises ValueError for invalid dates."""
+    start_date = params.get('start_date', None)
+    end_date = params.get('end_date', None)
+
+    if start_date:
+        start_date = parse_datetime(start_date)
+        if start_date:
+            queryset = queryset.filter(created_at__gte=start_date)
+
+    if end_date:
+        end_date = parse_datetime(end_date)
+        if end_date:
+            queryset = queryset.filter(created_at__lte=end_date)
+
+    return queryset
+
+
 class InvoiceListView(generics.ListAPIView):
     """
     API to list all orders with invoice details.
     """
     permission_classes = [IsAuthenticated]
     serializer_class = InvoiceListSerializer
+    pagination_class = OrderCursorPagination
 
     def get_queryset(self):
-        # Filter orders for the authenticated user
-        return Order.objects.filter(user=self.request.user)
+        # Orders of the authenticated user, archived ones included
+        return filter_orders(customer_orders(self.request.user).select_related('user'), self.request.query_params)
+
+    def list(self, request, *args, **kwargs):
+        try:
+            return super().list(request, *args, **kwargs)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
 class OrderPaymentListView(generics.ListAPIView):
     """API to get order payments with optional date range filter."""
     serializer_class = OrderPaymentSerializer
     permission_classes = [permissions.IsAdminUser]
+    pagination_class = OrderCursorPagination
     
     def get_queryset(self):
-        # Get the queryset from Order model
-        queryset = Order.objects.all()
-
-        # Filter by date range (start_date and end_date)
-        start_date = self.request.data.get('start_date', None)
-        end_date = self.request.data.get('end_date', None)
-
-        if start_date:
-            try:
-                start_date = parse_datetime(start_date)  # Assuming date in ISO format
-                queryset = queryset.filter(created_at__gte=start_date)
-            except ValueError:
-                return Response({"error": "Invalid start date format"}, status=status.HTTP_400_BAD_REQUEST)
-
-        if end_date:
-            try:
-                end_date = parse_datetime(end_date)
-                queryset = queryset.filter(created_at__lte=end_date)
-            except ValueError:
-                return Response({"error": "Invalid end date format"}, status=status.HTTP_400_BAD_REQUEST)
-
-        return queryset
+        # Live and archived orders, deleted ones too once paid
+        queryset = finance_orders().select_related('user')
+        # Date range in the body is still accepted for existing clients
+        queryset = filter_order_payments(queryset, self.request.data)
+        return filter_orders(queryset, self.request.query_params)
 
     def list(self, request, *args, **kwargs):
-        queryset = self.get_queryset()
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        try:
+            queryset = self.get_queryset()
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
 
 class DownloadInvoiceView(APIView):
@@ -480,11 +639,110 @@ class DownloadInvoiceView(APIView):
 
     def get(self, request, *args, **kwargs):
         order_id = kwargs.get('pk')
-        order = get_object_or_404(Order, id=order_id, user=request.user)
+        order = customer_orders(request.user).filter(id=order_id).select_related('user').first()
+        if order is None:
+            raise Http404
+
+        # Render only if the worker has not stored an up-to-date invoice yet
+        ensure_invoice(order)
+
+        # Serve the stored PDF
+        response = FileResponse(order.invoice_file.open('rb'), as_attachment=True, filename=f"invoice_{order.order_number}.pdf")
+        return response
 
-        # Generate the invoice as a PDF
-        pdf_buffer = order.generate_invoice()
 
-        # Create a FileResponse for the PDF
-        response = FileResponse(pdf_buffer, as_attachment=True, filename=f"invoice_{order.order_number}.pdf")
+class InvoiceExportView(APIView):
+    """
+    API to download the invoices of many orders as one ZIP file.
+    Orders can be selected by date range and status. While some invoices are
+    still missing, a worker renders them and the response is 202 with the progress.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        start_date = request.query_params.get('start_date', None)
+        end_date = request.query_params.get('end_date', None)
+        order_status = request.query_params.get('status', None)
+
+        orders = finance_orders()
+        try:
+            if start_date:
+                orders = orders.filter(created_at__date__gte=datetime.strptime(start_date, '%Y-%m-%d').date())
+            if end_date:
+                orders = orders.filter(created_at__date__lte=datetime.strptime(end_date, '%Y-%m-%d').date())
+        except ValueError:
+            return Response({"error": "Invalid date format. Please use YYYY-MM-DD."}, status=status.HTTP_400_BAD_REQUEST)
+        if order_status:
+            orders = orders.filter(status=order_status)
+
+        # Missing invoices are rendered by a worker, the client polls until they are all stored
+        stale = [order_id for queryset in orders.querysets for order_id in find_stale_invoices(queryset)]
+        if stale:
+            progress_key = export_progress_key(stale)
+            progress = {'status': 'rendering', 'done': 0, 'total': len(stale)}
+            previous = cache.get(progress_key)
+            if previous is None:
+                # Only the first of concurrent requests starts the render
+                if cache.add(progress_key, progress, timeout=EXPORT_PROGRESS_TIMEOUT):
+                    render_invoice_export.delay(stale, progress_key)
+            elif previous['status'] == 'ready':
+                # The last run finished but left some of these invoices unrendered
+                cache.set(progress_key, progress, timeout=EXPORT_PROGRESS_TIMEOUT)
+                render_invoice_export.delay(stale, progress_key)
+            else:
+                progress = previous
+            response = Response(
+                dict(progress, message="Invoices are being rendered, try again shortly."),
+                status=status.HTTP_202_ACCEPTED,
+            )
+            response['Retry-After'] = '10'
+            return response
+
+        # Both tables are read in ID order and merged
+        invoices = heapq.merge(
+            *(queryset.only('order_number', 'invoice_file').order_by('id').iterator() for queryset in orders.querysets),
+            key=attrgetter('id'),
+        )
+        response = StreamingHttpResponse(
+            stream_invoice_zip(invoices),
+            content_type='application/zip',
+        )
+        response['Content-Disposition'] = 'attachment; filename="invoices.zip"'
         return response
+
+
+class OrderPaymentExportView(APIView):
+    """Streams order payments, with the optional date range filter, as CSV or XLSX."""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        export_type = request.query_params.get('file_type', 'csv')
+        if export_type not in EXPORT_TYPES:
+            return Response({"error": f"file_type must be one of {', '.join(EXPORT_TYPES)}."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            queryset = filter_order_payments(finance_orders(), request.query_params)
+        except ValueError:
+            return Response({"error": "Invalid date format"}, status=status.HTTP_400_BAD_REQUEST)
+
+        rows = queryset.values_list(
+            'id', 'user__email', 'total_price', 'status', 'is_paid', 'razorpay_payment_id', 'created_at',
+        ).order_by('id')
+        header = ['id', 'user_email', 'total_price', 'status', 'is_paid', 'razorpay_payment_id', 'created_at']
+        return export_response(export_type, 'order_payments', header, rows)
+
+
+class InvoiceListExportView(APIView):
+    """Streams the authenticated user's invoice list as CSV or XLSX."""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        export_type = request.query_params.get('file_type', 'csv')
+        if export_type not in EXPORT_TYPES:
+            return Response({"error": f"file_type must be one of {', '.join(EXPORT_TYPES)}."}, status=status.HTTP_400_BAD_REQUEST)
+
+        rows = customer_orders(request.user).values_list(
+            'id', 'order_number', 'user__email', 'total_price', 'status', 'is_paid', 'created_at',
+        ).order_by('id')
+        header = ['id', 'order_number', 'user_email', 'total_price', 'status', 'is_paid', 'created_at']
+        return export_response(export_type, 'invoices', header, rows)
@@ -94,6 +94,11 @@ class Employee(BaseModel):
         return self.email
 
 
+def variant_barcode(product_variant_id):
+    """Code128 value of a variant, derived from its ID so it is unique and never reused."""
+    return f"PV{product_variant_id:08d}"
+
+
 class ProductVariant(BaseModel):
     """This model links a product color to different carat and price options."""
 
@@ -125,6 +130,14 @@ class ProductVariant(BaseModel):
     qc_employee = models.ForeignKey(Employee, on_delete=models.SET_NULL, null=True, related_name="product_variant_qc")
     qc_status = models.CharField(choices=QC_STATUS, default="PENDING")
     is_stock = models.BooleanField(default=False)
+    # Printed on the labels and read back by the scanners, assigned from the ID on creation
+    barcode = models.CharField(max_length=64, unique=True, null=True, blank=True)
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        if not self.barcode:
+            self.barcode = variant_barcode(self.pk)
+            ProductVariant.objects.filter(pk=self.pk).update(barcode=self.barcode)
 
     def __str__(self):
         product_code = self.product.code
@@ -165,18 +178,34 @@ class SharableCollection(BaseModel):
     product_variant_ids = models.TextField(null=False, blank=False)
     time_duration = models.DurationField(null=True, blank=True)
     is_validate = models.BooleanField(default=True)
+    # Set from time_duration on save, indexed for the expiry sweep
+    expires_at = models.DateTimeField(null=True, blank=True)
 
     def __str__(self):
         return self.slug
 
+    def save(self, *args, **kwargs):
+        # The link is valid for time_duration from its last save, like updated_at
+        self.expires_at = timezone.now() + self.time_duration if self.time_duration else None
+        super().save(*args, **kwargs)
+
     def valid_time(self):
         """
         Validates if the current time is within the `time_duration` window since `created_at`.
         Returns True if the payment is still valid (within time window), False if time has expired.
         """
+        if self.expires_at:
+            return timezone.now() <= self.expires_at
+
         # Calculate the expiration time by adding the time_duration to created_at
         expiration_time = self.updated_at + self.time_duration
 
         # Check if the current time is beyond the expiration time
         return timezone.now() <= expiration_time
+
+    class Meta:
+        indexes = [
+            # Only links still valid, the rows the expiry sweep looks at
+            models.Index(fields=['expires_at'], condition=models.Q(is_validate=True), name='sharable_valid_expiry_idx'),
+        ]
     
\ No newline at end of file
@@ -136,6 +136,7 @@ class ProductVariantSerializer(serializers.ModelSerializer):
     class Meta:
         model = ProductVariant
         fields = '__all__'
+        read_only_fields = ['barcode']
 
     def validate(self, attrs):
         # Get the product and color from the incoming data
@@ -7,6 +7,9 @@ from backend.utils import superuser_required
 from rest_framework.pagination import PageNumberPagination
 from django.shortcuts import get_object_or_404
 from django.conf import settings
+from django.db import transaction
+from stocks.models import Stock, StockMovement
+from stocks.ledger import record_change, stock_state
 
 # ProductType CRUD API View
 class ProductTypeAPIView(APIView):
@@ -282,10 +285,13 @@ class ProductVariantAPIView(APIView):
     def post(self, request, *args, **kwargs):
         serializer = ProductVariantSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save(
-                created_by = self.request.user,
-                updated_by = self.request.user
-            )
+            with transaction.atomic():
+                product_variant = serializer.save(
+                    created_by = self.request.user,
+                    updated_by = self.request.user
+                )
+                # Variants created straight into stock are a receipt
+                record_change(product_variant, (0, False, None), StockMovement.RECEIPT, "variant:create", self.request.user)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -296,11 +302,15 @@ class ProductVariantAPIView(APIView):
         except ProductVariant.DoesNotExist:
             return Response({"error": "Product Variant not found."}, status=status.HTTP_404_NOT_FOUND)
         
+        before = stock_state(product_variant)
         serializer = ProductVariantSerializer(product_variant, data=request.data)
         if serializer.is_valid():
-            serializer.save(
-                updated_by = self.request.user
-            )
+            with transaction.atomic():
+                product_variant = serializer.save(
+                    updated_by = self.request.user
+                )
+                # Manual edits of the quantity are logged as adjustments
+                record_change(product_variant, before, StockMovement.ADJUSTMENT, "variant:edit", self.request.user)
             return Response(serializer.data, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -363,6 +373,12 @@ class CartAPIView(APIView):
         if not shoping_cart:
             shoping_cart = ShoppingCart.objects.create(user=self.request.user)
 
+        # Units not yet reserved by approved orders, read from the stock projection
+        available = Stock.objects.filter(product_variant=product_variant).values_list('available', flat=True).first() or 0
+        in_cart = CartItems.objects.filter(cart=shoping_cart, product_variant=product_variant).values_list('quantity', flat=True).first() or 0
+        if in_cart + int(quantity) > available:
+            return Response({"error": f"Only {available} units available."}, status=status.HTTP_400_BAD_REQUEST)
+
         # Check if the product is already in the cart
         cart_item, created = CartItems.objects.get_or_create(
             cart=shoping_cart,
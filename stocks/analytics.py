@@ -0,0 +1,56 @@
+from django.db.models import Sum
+from product.models import Employee
+from .models import QCDailyRollup
+
+# Query parameter -> rollup column the report is grouped by
+QC_GROUP_FIELDS = {
+    'employee': 'assigned_employee_id',
+    'product_brand': 'product_brand__name',
+    'product_type': 'product_type__name',
+}
+
+
+def _employee_names(employee_ids):
+    employees = Employee.objects.in_bulk([employee_id for employee_id in employee_ids if employee_id])
+    return {
+        employee_id: f"{employee.first_name or ''} {employee.last_name or ''}".strip() or employee.email
+        for employee_id, employee in employees.items()
+    }
+
+
+def qc_breakdown(start_date, end_date, group_by='employee'):
+    """
+    Throughput, reject rate and average queue and inspection times per
+    inspector, brand or product type, summed from the QC daily rollup.
+    """
+    key_field = QC_GROUP_FIELDS[group_by]
+    days = (end_date - start_date).days + 1
+    rows = list(
+        QCDailyRollup.objects.filter(date__range=[start_date, end_date])
+        .values(key_field)
+        .annotate(
+            total_decided=Sum('decided'),
+            total_approved=Sum('approved'),
+            total_rejected=Sum('rejected'),
+            total_queue_seconds=Sum('queue_seconds'),
+            total_inprocess_seconds=Sum('inprocess_seconds'),
+        )
+        .order_by('-total_decided')
+    )
+    names = _employee_names(row[key_field] for row in rows) if group_by == 'employee' else {}
+
+    results = []
+    for row in rows:
+        decided = row['total_decided']
+        results.append({
+            'key': row[key_field],
+            'name': names.get(row[key_field]) if group_by == 'employee' else row[key_field],
+            'decided': decided,
+            'approved': row['total_approved'],
+            'rejected': row['total_rejected'],
+            'reject_rate': round(row['total_rejected'] / decided * 100, 2) if decided else None,
+            'throughput_per_day': round(decided / days, 2),
+            'avg_queue_hours': round(row['total_queue_seconds'] / decided / 3600, 2) if decided else None,
+            'avg_inprocess_hours': round(row['total_inprocess_seconds'] / decided / 3600, 2) if decided else None,
+        })
+    return {'group_by': group_by, 'start_date': start_date, 'end_date': end_date, 'days': days, 'results': results}
@@ -5,5 +5,5 @@ class StocksConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'stocks'
 
-    # def ready(self):
-    #     import stocks.signals
+    def ready(self):
+        import stocks.signals
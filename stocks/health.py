@@ -0,0 +1,136 @@
+import logging
+from datetime import timedelta
+import numpy as np
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.mail import send_mass_mail
+from django.db import transaction
+from django.db.models import Max, Sum
+from django.template.loader import render_to_string
+from django.utils import timezone
+from orders.models import Selling
+from product.models import ProductVariant
+from .models import StockHealth
+
+logger = logging.getLogger(__name__)
+
+HEALTH_FIELDS = ['quantity', 'daily_velocity', 'days_of_cover', 'last_sold_at', 'is_low_stock', 'is_dead_stock', 'flagged_at', 'analyzed_at']
+
+
+def _timestamps(values):
+    return np.fromiter((value.timestamp() if value else np.nan for value in values), dtype=float, count=len(values))
+
+
+def compute_health(quantity, sold, last_activity, now_timestamp, window_days):
+    """
+    Vectorized over all variants: daily velocity from the units sold in the
+    window, days of cover at that pace, and the low and dead stock flags.
+    `last_activity` holds the epoch of the last sale (or of the variant
+    creation when it never sold).
+    """
+    velocity = sold / window_days
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cover = np.where(velocity > 0, quantity / velocity, np.nan)
+    is_low = (velocity > 0) & (cover < settings.LOW_STOCK_COVER_DAYS)
+    idle_days = (now_timestamp - last_activity) / 86400
+    is_dead = (quantity > 0) & (velocity == 0) & (idle_days >= settings.DEAD_STOCK_DAYS)
+    return velocity, cover, is_low, is_dead
+
+
+def analyze_stock_health(now=None):
+    """
+    Recomputes the stock health of every variant held in stock with three
+    grouped queries and one pass over NumPy arrays, then upserts the results.
+    Returns the variants that became low or dead stock in this run.
+    """
+    now = now or timezone.now()
+    window_days = settings.STOCK_VELOCITY_DAYS
+
+    variants = list(
+        ProductVariant.objects.filter(is_stock=True).order_by('id')
+        .values_list('id', 'product__code', 'quantity', 'created_at')
+    )
+    sold = dict(
+        Selling.objects.filter(created_at__gte=now - timedelta(days=window_days), product_variant__is_stock=True)
+        .values('product_variant_id').annotate(total=Sum('quantity')).order_by()
+        .values_list('product_variant_id', 'total')
+    )
+    # Archived sellings are older than any dead stock threshold, the live table is enough
+    last_sold = dict(
+        Selling.objects.filter(product_variant__is_stock=True)
+        .values('product_variant_id').annotate(last=Max('created_at')).order_by()
+        .values_list('product_variant_id', 'last')
+    )
+    previous = {
+        row[0]: row[1:]
+        for row in StockHealth.objects.values_list('product_variant_id', 'is_low_stock', 'is_dead_stock', 'flagged_at')
+    }
+
+    count = len(variants)
+    quantity = np.fromiter((variant[2] for variant in variants), dtype=float, count=count)
+    units_sold = np.fromiter((sold.get(variant[0], 0) for variant in variants), dtype=float, count=count)
+    last_activity = _timestamps([last_sold.get(variant[0]) or variant[3] for variant in variants])
+    velocity, cover, is_low, is_dead = compute_health(quantity, units_sold, last_activity, now.timestamp(), window_days)
+
+    rows, alerts = [], []
+    for index, (product_variant_id, code, held, created_at) in enumerate(variants):
+        low, dead = bool(is_low[index]), bool(is_dead[index])
+        was_low, was_dead, flagged_at = previous.get(product_variant_id, (False, False, None))
+        if (low and not was_low) or (dead and not was_dead):
+            flagged_at = now
+            alerts.append({
+                'code': code,
+                'quantity': held,
+                'daily_velocity': round(float(velocity[index]), 2),
+                'days_of_cover': None if np.isnan(cover[index]) else round(float(cover[index]), 1),
+                'last_sold_at': last_sold.get(product_variant_id),
+                'is_low_stock': low,
+                'is_dead_stock': dead,
+            })
+        rows.append(StockHealth(
+            product_variant_id=product_variant_id,
+            quantity=held,
+            daily_velocity=float(velocity[index]),
+            days_of_cover=None if np.isnan(cover[index]) else float(cover[index]),
+            last_sold_at=last_sold.get(product_variant_id),
+            is_low_stock=low,
+            is_dead_stock=dead,
+            flagged_at=flagged_at if low or dead else None,
+            analyzed_at=now,
+        ))
+
+    with transaction.atomic():
+        StockHealth.objects.bulk_create(
+            rows,
+            batch_size=1000,
+            update_conflicts=True,
+            unique_fields=['product_variant'],
+            update_fields=HEALTH_FIELDS,
+        )
+        # Variants taken out of stock have nothing left to analyze
+        StockHealth.objects.filter(product_variant__is_stock=False).delete()
+
+    logger.info("Stock health analyzed %s variants, %s newly flagged", count, len(alerts))
+    return alerts
+
+
+def send_alert_digest(alerts):
+    """Emails one digest of the newly flagged variants to every active admin."""
+    if not alerts:
+        return 0
+    recipients = list(
+        get_user_model().objects.filter(is_superuser=True, is_active=True).exclude(email='').values_list('email', flat=True)
+    )
+    context = {
+        'low_stock': [alert for alert in alerts if alert['is_low_stock']],
+        'dead_stock': [alert for alert in alerts if alert['is_dead_stock']],
+        'cover_days': settings.LOW_STOCK_COVER_DAYS,
+        'dead_days': settings.DEAD_STOCK_DAYS,
+    }
+    subject = f"Stock alerts: {len(context['low_stock'])} low, {len(context['dead_stock'])} not moving"
+    message = render_to_string('stock_alert_digest.txt', context)
+    # One connection for the whole batch, each admin gets their own message
+    return send_mass_mail(
+        [(subject, message, settings.DEFAULT_FROM_EMAIL, [email]) for email in recipients],
+        fail_silently=False,
+    )
@@ -0,0 +1,99 @@
+import hashlib
+import io
+import json
+import tempfile
+import barcode
+from barcode.writer import ImageWriter
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import mm
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas
+
+BARCODE_DIR = "barcodes"
+
+# Part of the cache key, bump it when the rendering options change
+BARCODE_RENDER_VERSION = 1
+BARCODE_OPTIONS = {'write_text': False}
+
+# A4 sheet of 3 x 8 labels
+LABEL_COLUMNS = 3
+LABEL_ROWS = 8
+LABEL_MARGIN = 8 * mm
+
+
+def barcode_payload(product_variant):
+    """Data encoded in the label of a variant, what the scanners send back."""
+    if product_variant.barcode:
+        return product_variant.barcode
+    # Variants not backfilled yet keep the older product code labels
+    return json.dumps({"Code": product_variant.product.code}, separators=(',', ':'))
+
+
+def label_text(product_variant):
+    return f"{product_variant.product.code}  {product_variant.carat}K  {product_variant.weight}g"
+
+
+def barcode_path(payload):
+    """Storage path of the rendered barcode, a hash of everything that affects the image."""
+    key = hashlib.sha256(f"{BARCODE_RENDER_VERSION}:{payload}".encode('utf-8')).hexdigest()
+    return f"{BARCODE_DIR}/{key[:2]}/{key}.png"
+
+
+def render_barcode(payload):
+    buffer = io.BytesIO()
+    barcode.get_barcode_class('code128')(payload, writer=ImageWriter()).write(buffer, options=BARCODE_OPTIONS)
+    return buffer.getvalue()
+
+
+def ensure_barcode(payload):
+    """Returns the storage path of the payload's barcode, rendering it only if it was never rendered."""
+    path = barcode_path(payload)
+    if not default_storage.exists(path):
+        default_storage.save(path, ContentFile(render_barcode(payload)))
+    return path
+
+
+def ensure_barcodes(payloads):
+    """
+    Makes sure every distinct payload has a cached barcode, rendering the
+    missing ones. A barcode takes milliseconds, so they are rendered in the
+    request rather than in worker processes. Returns {payload: path}.
+    """
+    return {payload: ensure_barcode(payload) for payload in set(payloads)}
+
+
+def label_sheets(labels):
+    """
+    Lays out (payload, text) labels on A4 sheets, in order and left to right.
+    Returns the PDF as a temporary file positioned at its start.
+    """
+    paths = ensure_barcodes([payload for payload, _ in labels])
+    images = {}
+
+    width, height = A4
+    cell_width = (width - 2 * LABEL_MARGIN) / LABEL_COLUMNS
+    cell_height = (height - 2 * LABEL_MARGIN) / LABEL_ROWS
+    per_sheet = LABEL_COLUMNS * LABEL_ROWS
+
+    output = tempfile.TemporaryFile()
+    pdf = canvas.Canvas(output, pagesize=A4)
+    for index, (payload, text) in enumerate(labels):
+        if index and index % per_sheet == 0:
+            pdf.showPage()
+        if payload not in images:
+            # Read once per distinct barcode, reportlab embeds it once per PDF
+            with default_storage.open(paths[payload], 'rb') as image:
+                images[payload] = ImageReader(io.BytesIO(image.read()))
+
+        row, column = divmod(index % per_sheet, LABEL_COLUMNS)
+        x = LABEL_MARGIN + column * cell_width
+        y = height - LABEL_MARGIN - (row + 1) * cell_height
+        pdf.drawImage(images[payload], x + 2 * mm, y + 8 * mm, width=cell_width - 4 * mm, height=cell_height - 12 * mm, preserveAspectRatio=True)
+        pdf.setFont("Helvetica", 8)
+        pdf.drawCentredString(x + cell_width / 2, y + 3 * mm, text)
+    pdf.save()
+
+    output.seek(0)
+    return output
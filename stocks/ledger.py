@@ -0,0 +1,104 @@
+from collections import defaultdict
+from django.db import transaction
+from django.db.models import F, Sum
+from .models import StockMovement, StockSnapshot
+from .projection import apply_deltas, qc_pending_units
+
+
+def held(quantity, is_stock):
+    """Units a variant contributes to stock, only variants assigned to stock count."""
+    return quantity if is_stock else 0
+
+
+def movement(product_variant, movement_type, quantity, reference="", user=None):
+    return StockMovement(
+        product_variant_id=product_variant.pk,
+        movement_type=movement_type,
+        quantity=quantity,
+        unit_price=product_variant.price,
+        reference=reference,
+        created_by=user,
+    )
+
+
+def record(movements):
+    """Writes the non-empty movements in one INSERT and moves the on-hand stock with them."""
+    movements = [item for item in movements if item.quantity]
+    deltas = {}
+    for item in movements:
+        deltas.setdefault(item.product_variant_id, {'on_hand': 0})['on_hand'] += item.quantity
+    apply_deltas(deltas)
+    return StockMovement.objects.bulk_create(movements)
+
+
+def stock_state(product_variant):
+    """The fields of a variant that decide its stock, taken before changing it."""
+    return product_variant.quantity, product_variant.is_stock, product_variant.qc_status
+
+
+def record_change(product_variant, before, movement_type, reference="", user=None):
+    """
+    Records the difference in held stock after `product_variant` was changed
+    in place, `before` being its `stock_state()` from before the change.
+    """
+    return record_changes([(product_variant, before, reference)], movement_type, user)
+
+
+def record_changes(changes, movement_type, user=None):
+    """Batch of record_change(): (variant, before, reference) triples written with one INSERT."""
+    movements, qc_deltas = [], {}
+    for product_variant, (old_quantity, old_is_stock, old_qc_status), reference in changes:
+        delta = held(product_variant.quantity, product_variant.is_stock) - held(old_quantity, old_is_stock)
+        qc_deltas[product_variant.pk] = {
+            'qc_pending': qc_pending_units(product_variant.quantity, product_variant.is_stock, product_variant.qc_status)
+            - qc_pending_units(old_quantity, old_is_stock, old_qc_status)
+        }
+        movements.append(movement(product_variant, movement_type, delta, reference, user))
+    apply_deltas(qc_deltas)
+    return record(movements)
+
+
+def inventory_at(moment, product_variant_ids=None):
+    """
+    Quantity and value held per variant at `moment`: the latest snapshot taken
+    up to then plus the movements recorded after it. Returns
+    (snapshot time or None, {variant id: [quantity, value]}).
+    """
+    snapshot_at = StockSnapshot.objects.filter(taken_at__lte=moment) \
+        .order_by('-taken_at').values_list('taken_at', flat=True).first()
+
+    balances = defaultdict(lambda: [0, 0.0])
+    snapshots = StockSnapshot.objects.filter(taken_at=snapshot_at)
+    movements = StockMovement.objects.filter(created_at__lte=moment)
+    if snapshot_at:
+        movements = movements.filter(created_at__gt=snapshot_at)
+    if product_variant_ids is not None:
+        snapshots = snapshots.filter(product_variant_id__in=product_variant_ids)
+        movements = movements.filter(product_variant_id__in=product_variant_ids)
+
+    if snapshot_at:
+        for product_variant_id, quantity, value in snapshots.values_list('product_variant_id', 'quantity', 'value'):
+            balances[product_variant_id] = [quantity, value]
+
+    replay = movements.values('product_variant_id') \
+        .annotate(total_quantity=Sum('quantity'), total_value=Sum(F('quantity') * F('unit_price'))) \
+        .order_by() \
+        .values_list('product_variant_id', 'total_quantity', 'total_value')
+    for product_variant_id, quantity, value in replay:
+        balances[product_variant_id][0] += quantity
+        balances[product_variant_id][1] += value
+
+    return snapshot_at, dict(balances)
+
+
+def take_snapshot(moment):
+    """Stores the balances at `moment`. Movements recorded up to then must all be committed."""
+    with transaction.atomic():
+        _, balances = inventory_at(moment)
+        StockSnapshot.objects.filter(taken_at=moment).delete()
+        snapshots = StockSnapshot.objects.bulk_create([
+            StockSnapshot(taken_at=moment, product_variant_id=product_variant_id, quantity=quantity, value=value)
+            for product_variant_id, (quantity, value) in balances.items()
+            if quantity or value
+        ])
+    return len(snapshots)
@@ -0,0 +1,168 @@
+import gzip
+import hashlib
+import math
+import re
+import time
+import brotli
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.urls import reverse
+from rest_framework.renderers import JSONRenderer
+from product.models import ProductVariant
+from .serializers import ProductVariantSerializer
+
+# Version of the published rendering and the one it replaced, the only versions whose pages are kept
+LISTING_VERSION_KEY = "stock-listing-version"
+LISTING_PREVIOUS_KEY = "stock-listing-previous-version"
+# Set while a refresh is scheduled, so a burst of stock changes renders once
+LISTING_REFRESH_KEY = "stock-listing-refresh-pending"
+
+# Seconds a request may spend rendering a page missing from the cache before another one may try
+LISTING_RENDER_LOCK_TIMEOUT = 30
+
+# Most preferred first, identity is always acceptable
+ENCODINGS = ('br', 'gzip')
+
+COMPRESSORS = {
+    'br': lambda body: brotli.compress(body, quality=11),
+    'gzip': lambda body: gzip.compress(body, compresslevel=9),
+}
+
+_accept_encoding_re = re.compile(r'^\s*([\w*-]+)\s*(?:;\s*q\s*=\s*([\d.]+))?\s*$')
+
+
+def _page_key(version, page):
+    return f"stock-listing:{version}:page:{page}"
+
+
+def _pages_key(version):
+    return f"stock-listing:{version}:pages"
+
+
+def _render_lock_key(version, page):
+    return f"stock-listing:{version}:page:{page}:rendering"
+
+
+class ListingUnavailable(Exception):
+    """The page is missing from the cache and another request is rendering it."""
+
+
+def in_stock_variants():
+    # Variants with units left after reservations, from the stock projection
+    return ProductVariant.objects.filter(is_stock=True, stock__available__gt=0) \
+        .select_related('product__product_type', 'product__product_brand', 'product__product_style') \
+        .order_by('id')
+
+
+def _page_link(page):
+    return f"{reverse('product-variants-in-stock')}?page={page}"
+
+
+def render_page(variants, page, pages, count, encodings=ENCODINGS):
+    """The page as JSON, also compressed in each of `encodings`, with its ETag."""
+    body = JSONRenderer().render({
+        'count': count,
+        'next': _page_link(page + 1) if page < pages else None,
+        'previous': _page_link(page - 1) if page > 1 else None,
+        'results': ProductVariantSerializer(variants, many=True).data,
+    })
+    entry = {'etag': hashlib.md5(body).hexdigest(), 'identity': body}
+    entry.update({encoding: COMPRESSORS[encoding](body) for encoding in encodings})
+    return entry
+
+
+def publish_stock_listing():
+    """
+    Renders every page of the listing under a new version, then points the
+    listing at it. Requests keep getting the previous version until then.
+    Pages are kept until the version after next replaces them. Returns the
+    number of pages.
+    """
+    version = time.time_ns()
+    variants = list(in_stock_variants())
+    pages = max(math.ceil(len(variants) / settings.PAGE_LIMIT), 1)
+    entries = {_pages_key(version): pages}
+    for page in range(1, pages + 1):
+        offset = (page - 1) * settings.PAGE_LIMIT
+        entries[_page_key(version, page)] = render_page(variants[offset:offset + settings.PAGE_LIMIT], page, pages, len(variants))
+    cache.set_many(entries, timeout=None)
+
+    published = cache.get_many([LISTING_VERSION_KEY, LISTING_PREVIOUS_KEY])
+    cache.set_many({LISTING_VERSION_KEY: version, LISTING_PREVIOUS_KEY: published.get(LISTING_VERSION_KEY, 0)}, timeout=None)
+    # The version before the previous one is no longer read
+    older = published.get(LISTING_PREVIOUS_KEY)
+    if older:
+        older_pages = cache.get(_pages_key(older)) or 0
+        cache.delete_many([_pages_key(older)] + [_page_key(older, page) for page in range(1, older_pages + 1)])
+    return pages
+
+
+def listing_page(page):
+    """
+    The rendered page, or None past the last one. A page missing from the
+    cache (never published, or evicted) is served from the previous version,
+    else rendered uncompressed by one request at a time while a refresh is
+    scheduled. Raises ListingUnavailable while another request renders it.
+    """
+    published = cache.get_many([LISTING_VERSION_KEY, LISTING_PREVIOUS_KEY])
+    # Pages rendered before the first publish are kept under version 0
+    version = published.get(LISTING_VERSION_KEY, 0)
+    keys = [_page_key(version, page)]
+    if published.get(LISTING_PREVIOUS_KEY):
+        keys.append(_page_key(published[LISTING_PREVIOUS_KEY], page))
+    entries = cache.get_many(keys)
+    for key in keys:
+        if key in entries:
+            return entries[key]
+
+    pages = cache.get(_pages_key(version))
+    if pages is not None and page > pages:
+        return None
+
+    lock = _render_lock_key(version, page)
+    if not cache.add(lock, 1, timeout=LISTING_RENDER_LOCK_TIMEOUT):
+        raise ListingUnavailable("The listing is being rendered, try again shortly.")
+    try:
+        schedule_stock_listing_refresh()
+        variants = in_stock_variants()
+        count = variants.count()
+        pages = max(math.ceil(count / settings.PAGE_LIMIT), 1)
+        if page > pages:
+            return None
+        offset = (page - 1) * settings.PAGE_LIMIT
+        # Compressing is left to the refresh, the page is only kept until it publishes
+        entry = render_page(variants[offset:offset + settings.PAGE_LIMIT], page, pages, count, encodings=())
+        cache.set(_page_key(version, page), entry, timeout=settings.STOCK_LISTING_CACHE_TIMEOUT)
+        return entry
+    finally:
+        cache.delete(lock)
+
+
+def preferred_encoding(accept_encoding):
+    """The best of ENCODINGS the client accepts (Accept-Encoding header), 'identity' otherwise."""
+    accepted = {}
+    for part in (accept_encoding or '').split(','):
+        match = _accept_encoding_re.match(part)
+        if not match:
+            continue
+        try:
+            quality = float(match.group(2)) if match.group(2) else 1.0
+        except ValueError:
+            continue
+        accepted[match.group(1).lower()] = quality
+
+    for encoding in ENCODINGS:
+        if accepted.get(encoding, accepted.get('*', 0)) > 0:
+            return encoding
+    return 'identity'
+
+
+def schedule_stock_listing_refresh():
+    """Republishes the listing shortly after the current transaction commits, once per burst of changes."""
+    def schedule():
+        if cache.add(LISTING_REFRESH_KEY, 1, timeout=settings.STOCK_LISTING_REFRESH_DELAY + 60):
+            from .tasks import refresh_stock_listing
+            refresh_stock_listing.apply_async(countdown=settings.STOCK_LISTING_REFRESH_DELAY)
+
+    transaction.on_commit(schedule)
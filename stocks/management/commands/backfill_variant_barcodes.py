@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db.models import CharField, Value
+from django.db.models.functions import Cast, Concat, LPad
+from product.models import ProductVariant
+
+
+class Command(BaseCommand):
+    help = "Assign a barcode to every variant created before barcodes were stored. Reprint their labels afterwards."
+
+    def handle(self, *args, **options):
+        # Same value as product.models.variant_barcode(), computed by the database in one UPDATE
+        count = ProductVariant.objects.filter(barcode__isnull=True).update(
+            barcode=Concat(Value("PV"), LPad(Cast('id', CharField()), 8, Value("0")))
+        )
+        self.stdout.write(self.style.SUCCESS(f"Assigned {count} barcodes."))
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from stocks.models import QCDailyRollup, QualityCheck
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the QC daily rollup from the decided quality checks (backfill or repair). "
+        "Each check counts once, for its latest decision at its last update, as the live rollup does."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        checks = QualityCheck.objects.filter(qc_status__in=[QualityCheck.APPROVED, QualityCheck.REJECTED]) \
+            .select_related('memo_detail__product_variant__product', 'product_variant__product') \
+            .order_by('id')
+
+        recorded = 0
+        with transaction.atomic():
+            QCDailyRollup.objects.all().delete()
+            batch = []
+            for quality_check in checks.iterator(chunk_size=options['batch_size']):
+                memo_detail = quality_check.memo_detail
+                product_variant = memo_detail.product_variant if memo_detail else quality_check.product_variant
+                if product_variant is None or quality_check.updated_at is None:
+                    continue
+                batch.append((quality_check, product_variant))
+                if len(batch) == options['batch_size']:
+                    recorded += self.record(batch)
+                    batch = []
+            recorded += self.record(batch)
+
+        self.stdout.write(self.style.SUCCESS(f"Recorded {recorded} decided quality checks."))
+
+    def record(self, batch):
+        # Grouped by decision and decision time, as the rollup records them
+        groups = {}
+        for quality_check, product_variant in batch:
+            groups.setdefault((quality_check.qc_status, quality_check.updated_at), []).append((quality_check, product_variant))
+        for (decision, decided_at), decisions in groups.items():
+            QCDailyRollup.record(decisions, decision, decided_at)
+        return len(batch)
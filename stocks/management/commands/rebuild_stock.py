@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum
+from orders.models import OrderItem
+from product.models import ProductVariant
+from stocks.models import Stock, StockMovement
+from stocks.projection import qc_pending_units
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute every stock row from its sources: on hand from the stock ledger, reserved from "
+        "approved unpaid orders and QC pending from the variants. Run after a deploy or to repair drift."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        with transaction.atomic():
+            # Locked so no change lands between reading the sources and writing the rows
+            list(Stock.objects.select_for_update().values_list('id', flat=True))
+
+            on_hand = dict(
+                StockMovement.objects.values('product_variant_id').annotate(total=Sum('quantity')).order_by()
+                .values_list('product_variant_id', 'total')
+            )
+            reserved = dict(
+                OrderItem.objects.filter(order__is_approved=True, order__is_paid=False, order__is_deleted=False)
+                .values('product_variant_id').annotate(total=Sum('quantity')).order_by()
+                .values_list('product_variant_id', 'total')
+            )
+
+            rows = []
+            variants = ProductVariant.objects.values_list('id', 'quantity', 'is_stock', 'qc_status').order_by('id')
+            for product_variant_id, quantity, is_stock, qc_status in variants.iterator(chunk_size=batch_size):
+                rows.append(Stock(
+                    product_variant_id=product_variant_id,
+                    on_hand=on_hand.get(product_variant_id, 0),
+                    reserved=reserved.get(product_variant_id, 0),
+                    available=on_hand.get(product_variant_id, 0) - reserved.get(product_variant_id, 0),
+                    qc_pending=qc_pending_units(quantity, is_stock, qc_status),
+                ))
+
+            Stock.objects.bulk_create(
+                rows,
+                batch_size=batch_size,
+                update_conflicts=True,
+                unique_fields=['product_variant'],
+                update_fields=['on_hand', 'reserved', 'available', 'qc_pending', 'updated_at'],
+            )
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {len(rows)} stock rows."))
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum
+from product.models import ProductVariant
+from stocks.ledger import held, movement, record
+from stocks.models import StockMovement
+
+
+class Command(BaseCommand):
+    help = (
+        "Record an adjustment for every variant whose held stock differs from its stock ledger. "
+        "Run once to open the ledger, later runs report shrinkage and out-of-band edits."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help="Only list the differences.")
+
+    def handle(self, *args, **options):
+        ledger = dict(
+            StockMovement.objects.values('product_variant_id').annotate(total=Sum('quantity')).order_by()
+            .values_list('product_variant_id', 'total')
+        )
+
+        adjustments = []
+        variants = ProductVariant.objects.only('id', 'quantity', 'is_stock', 'price').order_by('id')
+        for product_variant in variants.iterator(chunk_size=options['batch_size']):
+            difference = held(product_variant.quantity, product_variant.is_stock) - ledger.get(product_variant.id, 0)
+            if difference:
+                adjustments.append(movement(product_variant, StockMovement.ADJUSTMENT, difference, "reconcile"))
+                self.stdout.write(f"Variant {product_variant.id}: {difference:+d}")
+
+        if options['dry_run']:
+            self.stdout.write(f"{len(adjustments)} variants differ from the ledger.")
+            return
+
+        with transaction.atomic():
+            for start in range(0, len(adjustments), options['batch_size']):
+                record(adjustments[start:start + options['batch_size']])
+        self.stdout.write(self.style.SUCCESS(f"Recorded {len(adjustments)} adjustments."))
@@ -0,0 +1,188 @@
+import hashlib
+import io
+import json
+import tempfile
+from collections import defaultdict
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from pypdf import PdfWriter
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import mm
+from reportlab.pdfgen import canvas
+from .models import Memo, MemoDetail
+
+MEMO_PDF_DIR = "memos"
+
+# Seconds the progress of a background memo batch render is kept
+BATCH_PROGRESS_TIMEOUT = 3600
+
+MEMO_LINE_FIELDS = (
+    'product_variant__product__code',
+    'product_variant__carat',
+    'product_variant__color',
+    'product_variant__weight',
+    'product_variant__price',
+)
+
+PAGE_MARGIN = 15 * mm
+LINE_HEIGHT = 6 * mm
+# x offset and title of each column of the line table
+COLUMNS = ((0, "#"), (12 * mm, "Product"), (70 * mm, "Carat"), (90 * mm, "Color"), (125 * mm, "Weight (g)"), (155 * mm, "Price"))
+
+
+def memo_lines(memo):
+    return list(MemoDetail.objects.filter(memo=memo).order_by('id').values_list(*MEMO_LINE_FIELDS))
+
+
+def memo_fingerprint(memo, lines):
+    """
+    Hash of everything printed on the memo, its version. It changes whenever
+    the memo or the price or weight of one of its pieces does, so it doubles
+    as the storage key of the rendered PDF.
+    """
+    content = {
+        'jangad_number': memo.jangad_number,
+        'client_name': memo.client_name,
+        'company_name': memo.company_name,
+        'date': memo.created_at.date() if memo.created_at else None,
+        'lines': [list(line) for line in lines],
+    }
+    return hashlib.sha256(json.dumps(content, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def memo_pdf_path(fingerprint):
+    return f"{MEMO_PDF_DIR}/{fingerprint[:2]}/{fingerprint}.pdf"
+
+
+def has_current_pdf(memo, fingerprint):
+    return bool(memo.pdf_file) and memo.pdf_hash == fingerprint and default_storage.exists(memo.pdf_file.name)
+
+
+def render_memo_pdf(memo, lines):
+    """The memo (jangad) as a PDF: header, one row per piece and the totals."""
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    width, height = A4
+
+    def header():
+        pdf.setFont("Helvetica-Bold", 14)
+        pdf.drawString(PAGE_MARGIN, height - PAGE_MARGIN, f"Memo {memo.jangad_number or memo.pk}")
+        pdf.setFont("Helvetica", 10)
+        pdf.drawString(PAGE_MARGIN, height - PAGE_MARGIN - 7 * mm, f"Client: {memo.client_name or ''}")
+        pdf.drawString(PAGE_MARGIN, height - PAGE_MARGIN - 12 * mm, f"Company: {memo.company_name or ''}")
+        if memo.created_at:
+            pdf.drawRightString(width - PAGE_MARGIN, height - PAGE_MARGIN, timezone.localtime(memo.created_at).strftime("%d-%m-%Y"))
+        y = height - PAGE_MARGIN - 22 * mm
+        pdf.setFont("Helvetica-Bold", 9)
+        for x, title in COLUMNS:
+            pdf.drawString(PAGE_MARGIN + x, y, title)
+        pdf.line(PAGE_MARGIN, y - 2 * mm, width - PAGE_MARGIN, y - 2 * mm)
+        pdf.setFont("Helvetica", 9)
+        return y - LINE_HEIGHT
+
+    y = header()
+    total_weight = total_amount = 0.0
+    for number, (code, carat, color, weight, price) in enumerate(lines, start=1):
+        if y < PAGE_MARGIN + 2 * LINE_HEIGHT:
+            pdf.showPage()
+            y = header()
+        values = (number, code, f"{carat}K", color or "", f"{weight:.3f}", f"{price:.2f}")
+        for (x, _), value in zip(COLUMNS, values):
+            pdf.drawString(PAGE_MARGIN + x, y, str(value))
+        total_weight += weight
+        total_amount += price
+        y -= LINE_HEIGHT
+
+    if y < PAGE_MARGIN + 2 * LINE_HEIGHT:
+        pdf.showPage()
+        y = header()
+    pdf.line(PAGE_MARGIN, y + 4 * mm, width - PAGE_MARGIN, y + 4 * mm)
+    pdf.setFont("Helvetica-Bold", 9)
+    pdf.drawString(PAGE_MARGIN + COLUMNS[1][0], y, f"Total: {len(lines)} pieces")
+    pdf.drawString(PAGE_MARGIN + COLUMNS[4][0], y, f"{total_weight:.3f}")
+    pdf.drawString(PAGE_MARGIN + COLUMNS[5][0], y, f"{total_amount:.2f}")
+    pdf.showPage()
+    pdf.save()
+    return buffer.getvalue()
+
+
+def ensure_memo_pdf(memo, lines=None):
+    """
+    Makes sure the stored PDF matches the current version of the memo,
+    rendering it only when the memo changed or the file is missing. The
+    previous version's file is deleted once no memo points at it.
+    Returns True if a PDF was rendered.
+    """
+    if lines is None:
+        lines = memo_lines(memo)
+    fingerprint = memo_fingerprint(memo, lines)
+    if has_current_pdf(memo, fingerprint):
+        return False
+
+    previous = memo.pdf_file.name if memo.pdf_file else None
+    name = memo_pdf_path(fingerprint)
+    rendered = not default_storage.exists(name)
+    if rendered:
+        name = default_storage.save(name, ContentFile(render_memo_pdf(memo, lines)))
+
+    Memo.objects.filter(pk=memo.pk).update(pdf_file=name, pdf_hash=fingerprint)
+    memo.pdf_file.name = name
+    memo.pdf_hash = fingerprint
+    # Memos with the same content share a file
+    if previous and previous != name and not Memo.objects.filter(pdf_file=previous).exists():
+        default_storage.delete(previous)
+    return rendered
+
+
+def stale_memo_ids(memos):
+    """
+    IDs of the memos among `memos` whose stored PDF is missing or outdated.
+    Lines of all memos are read with one query.
+    """
+    memos = list(memos)
+    lines = defaultdict(list)
+    for memo_id, *line in MemoDetail.objects.filter(memo__in=memos).order_by('id').values_list('memo_id', *MEMO_LINE_FIELDS):
+        lines[memo_id].append(tuple(line))
+    return [memo.pk for memo in memos if not has_current_pdf(memo, memo_fingerprint(memo, lines[memo.pk]))]
+
+
+def render_memo_pdfs(memo_ids, progress=None):
+    """
+    Brings the PDFs of the given memos up to date one after the other, in
+    the process of the Celery worker: its prefork children are daemonic and
+    cannot start a process pool. `progress` is called with (done, total)
+    after each memo. Returns the rendered count.
+    """
+    memos = Memo.objects.in_bulk(memo_ids)
+    total = len(memo_ids)
+    rendered = 0
+    for done, memo_id in enumerate(memo_ids, start=1):
+        memo = memos.get(memo_id)
+        rendered += memo is not None and ensure_memo_pdf(memo)
+        if progress:
+            progress(done, total)
+    return rendered
+
+
+def batch_progress_key(memo_ids):
+    """Cache key of the progress of rendering exactly these memos."""
+    return f"memo-batch:{hashlib.md5(','.join(map(str, sorted(memo_ids))).encode('utf-8')).hexdigest()}"
+
+
+def merged_memo_pdf(memos):
+    """
+    One PDF with the stored PDFs of `memos`, in order. Outdated PDFs are
+    rendered by the worker first, see stale_memo_ids. Returns a temporary
+    file positioned at its start.
+    """
+    writer = PdfWriter()
+    for memo in memos:
+        with default_storage.open(memo.pdf_file.name, 'rb') as source:
+            writer.append(io.BytesIO(source.read()))
+
+    output = tempfile.TemporaryFile()
+    writer.write(output)
+    writer.close()
+    output.seek(0)
+    return output
@@ -0,0 +1,144 @@
+from django.db import transaction
+from django.db.models import Q
+from openpyxl import load_workbook
+from product.models import ProductVariant
+from .models import Memo, MemoDetail
+
+# Derived from the primary key, so two memos can never get the same number.
+# The dash keeps it apart from the 8 character random numbers of older memos.
+JANGAD_FORMAT = "JG-{:06d}"
+
+DETAIL_BATCH_SIZE = 500
+
+# Accepted sheet headers, lower-cased, for each way of naming a variant
+VARIANT_ID_HEADERS = ('product_variant', 'variant_id')
+PRODUCT_CODE_HEADERS = ('product_code', 'code')
+
+
+class MemoImportError(Exception):
+    """Raised with every problem found in an import sheet, one message per row."""
+
+    def __init__(self, errors):
+        super().__init__("; ".join(errors))
+        self.errors = errors
+
+
+def jangad_number(memo_id):
+    return JANGAD_FORMAT.format(memo_id)
+
+
+def create_memo(product_variant_ids, user=None, **fields):
+    """
+    Creates a memo with one line per variant ID: a single INSERT for the memo,
+    an UPDATE for its jangad number and batched INSERTs for the lines.
+    """
+    with transaction.atomic():
+        memo = Memo.objects.create(created_by=user, updated_by=user, **fields)
+        memo.jangad_number = jangad_number(memo.pk)
+        Memo.objects.filter(pk=memo.pk).update(jangad_number=memo.jangad_number)
+
+        MemoDetail.objects.bulk_create(
+            [
+                MemoDetail(memo=memo, product_variant_id=product_variant_id, created_by=user, updated_by=user)
+                for product_variant_id in product_variant_ids
+            ],
+            batch_size=DETAIL_BATCH_SIZE,
+        )
+
+        # Printed in the background, once the lines are committed
+        from .tasks import generate_memo_pdf
+        transaction.on_commit(lambda: generate_memo_pdf.delay(memo.pk))
+    return memo
+
+
+def _column(header, names):
+    for name in names:
+        if name in header:
+            return header.index(name)
+    return None
+
+
+def _cell(row, index):
+    if index is None or index >= len(row) or row[index] is None:
+        return None
+    value = row[index]
+    return value.strip() if isinstance(value, str) else value
+
+
+def read_memo_sheet(file):
+    """
+    Reads the variant of every line of a supplier sheet (first worksheet, a
+    header row then one row per piece). A row names its variant either by
+    `product_variant` ID or by `product_code` and `carat`, plus `color` when a
+    product has several. Rows are streamed and all variants are resolved with
+    one query. Returns the variant IDs in sheet order.
+    """
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = [str(value).strip().lower() if value is not None else "" for value in next(rows, ())]
+        id_column = _column(header, VARIANT_ID_HEADERS)
+        code_column = _column(header, PRODUCT_CODE_HEADERS)
+        carat_column = _column(header, ('carat',))
+        color_column = _column(header, ('color',))
+        if id_column is None and (code_column is None or carat_column is None):
+            raise MemoImportError(["The sheet needs a product_variant column or product_code and carat columns."])
+
+        lines, errors = [], []
+        for number, row in enumerate(rows, start=2):
+            variant_id = _cell(row, id_column)
+            code = _cell(row, code_column)
+            if variant_id is None and code is None:
+                # Blank rows are common at the end of supplier sheets
+                continue
+            if variant_id is not None:
+                try:
+                    lines.append((number, int(variant_id)))
+                except (TypeError, ValueError):
+                    errors.append((number, f"invalid product_variant {variant_id!r}."))
+                continue
+            try:
+                carat = int(_cell(row, carat_column))
+            except (TypeError, ValueError):
+                errors.append((number, f"invalid carat for product {code}."))
+                continue
+            color = _cell(row, color_column)
+            lines.append((number, (str(code), carat, str(color) if color is not None else None)))
+    finally:
+        workbook.close()
+
+    if not lines and not errors:
+        raise MemoImportError(["The sheet has no lines."])
+
+    ids = {key for _, key in lines if isinstance(key, int)}
+    codes = {key[0] for _, key in lines if isinstance(key, tuple)}
+    known_ids = set()
+    by_code = {}
+    if ids or codes:
+        variants = ProductVariant.objects.filter(Q(id__in=ids) | Q(product__code__in=codes))
+        for variant_id, code, carat, color in variants.values_list('id', 'product__code', 'carat', 'color'):
+            known_ids.add(variant_id)
+            by_code.setdefault((code, carat), []).append((color, variant_id))
+
+    product_variant_ids = []
+    for number, key in lines:
+        if isinstance(key, int):
+            if key in known_ids:
+                product_variant_ids.append(key)
+            else:
+                errors.append((number, f"product variant {key} does not exist."))
+            continue
+        code, carat, color = key
+        candidates = by_code.get((code, carat), [])
+        if color is not None:
+            candidates = [candidate for candidate in candidates if (candidate[0] or "").lower() == color.lower()]
+        if len(candidates) == 1:
+            product_variant_ids.append(candidates[0][1])
+        elif not candidates:
+            errors.append((number, f"no variant of product {code} with carat {carat}" + (f" and color {color}." if color else ".")))
+        else:
+            errors.append((number, f"product {code} has several {carat} carat variants, add a color column."))
+
+    if errors:
+        raise MemoImportError([f"Row {number}: {message}" for number, message in sorted(errors)])
+    return product_variant_ids
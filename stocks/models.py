@@ -1,13 +1,52 @@
 from django.db import models
+from django.db.models import Count, Exists, F, FloatField, OuterRef, Prefetch, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from backend.models import BaseModel
-from product.models import ProductVariant, Employee
+from backend.utils import bulk_increment
+from product.models import ProductVariant, Employee, BrandType, ProductType
 from users.models import User
 
+class MemoQuerySet(models.QuerySet):
+    def with_totals(self):
+        """Pieces, weight and amount of each memo, summed by the database."""
+        return self.annotate(
+            total_pieces=Count('memo_detail'),
+            total_weight=Coalesce(Sum('memo_detail__product_variant__weight'), Value(0.0), output_field=FloatField()),
+            total_amount=Coalesce(Sum('memo_detail__product_variant__price'), Value(0.0), output_field=FloatField()),
+        )
+
+    def with_details(self):
+        """Prefetches the lines with their variant and QC flag, one query for the whole page."""
+        return self.prefetch_related(
+            Prefetch('memo_detail', queryset=MemoDetail.objects.with_qc().select_related('product_variant').order_by('id'))
+        )
+
+
+class MemoDetailQuerySet(models.QuerySet):
+    def with_qc(self):
+        """Flags the lines already sent to quality check."""
+        return self.annotate(QC=Exists(QualityCheck.objects.filter(memo_detail=OuterRef('pk'))))
+
+
+class QualityCheckQuerySet(models.QuerySet):
+    def with_details(self):
+        """Loads the sender, the inspector and the memo line with its variant, two queries for the whole page."""
+        return self.select_related('sender', 'assigned_employee').prefetch_related(
+            Prefetch('memo_detail', queryset=MemoDetail.objects.with_qc().select_related('product_variant'))
+        )
+
+
 class Memo(BaseModel):
     client_name = models.CharField(max_length=255, null=True, blank=False)
     company_name = models.CharField(max_length=255, null=True, blank=False)
-    jangad_number = models.CharField(max_length=255, null=True, blank=False)
+    jangad_number = models.CharField(max_length=255, null=True, blank=False, unique=True)
     qc_employee = models.ForeignKey(Employee, on_delete=models.SET_NULL, null=True, related_name="product_variant")
+    pdf_file = models.FileField(upload_to="memos/", null=True, blank=True)
+    pdf_hash = models.CharField(max_length=64, blank=True, default="")
+
+    objects = MemoQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.client_name} - {self.jangad_number}"
 
@@ -29,6 +68,7 @@ class MemoDetail(BaseModel):
     qc_employee = models.ForeignKey(Employee, on_delete=models.SET_NULL, null=True, related_name="memo_detail_qc")
     qc_status = models.CharField(choices=QC_STATUS, default="PENDING")
 
+    objects = MemoDetailQuerySet.as_manager()
 
     def __str__(self):
         return self.memo.jangad_number   
@@ -49,8 +89,259 @@ class QualityCheck(BaseModel):
     memo_detail = models.ForeignKey(MemoDetail, null=True, blank=True, on_delete=models.CASCADE, related_name="qc_memo_detail")
     product_variant = models.ForeignKey(ProductVariant, null=True, blank=True, on_delete=models.CASCADE, related_name="qc_product_variant")
     sender = models.ForeignKey(User, null=False, blank=False, on_delete=models.CASCADE, related_name="qc_sender_client")
-    assigned_employee = models.ForeignKey(Employee, null=False, blank=False, on_delete=models.CASCADE, related_name="qc_receiver_client")
+    # Empty while a queued check waits to be claimed
+    assigned_employee = models.ForeignKey(Employee, null=True, blank=True, on_delete=models.CASCADE, related_name="qc_receiver_client")
     qc_status = models.CharField(choices=QC_STATUS, default="INPROCESS")
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    # A claimed check goes back to the queue if it is not decided by then, null for pushed assignments
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+
+    objects = QualityCheckQuerySet.as_manager()
+
+    def __str__(self):
+        return self.product_variant.product.code
+
+    class Meta:
+        indexes = [
+            # Claim order of the queue
+            models.Index(fields=['created_at', 'id'], condition=models.Q(qc_status='PENDING'), name='qc_queue_idx'),
+            models.Index(fields=['lease_expires_at'], condition=models.Q(qc_status='INPROCESS'), name='qc_lease_idx'),
+        ]
+
+class Stock(models.Model):
+    """
+    Current stock of a variant, maintained alongside every change so readers
+    query one indexed row instead of recomputing it:
+    on_hand  units held in stock (the stock ledger balance),
+    reserved units in approved orders awaiting payment,
+    available on_hand - reserved,
+    qc_pending units received but not through quality check yet.
+    """
+    product_variant = models.OneToOneField(ProductVariant, on_delete=models.CASCADE, related_name="stock")
+    on_hand = models.IntegerField(default=0)
+    reserved = models.IntegerField(default=0)
+    available = models.IntegerField(default=0)
+    qc_pending = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Stock of variant {self.product_variant_id}: {self.available} available"
+
+    class Meta:
+        db_table = "stock"
+        verbose_name = "Stock"
+        verbose_name_plural = "Stocks"
+        indexes = [
+            # In-stock listings only read variants with something to sell
+            models.Index(fields=['available'], condition=models.Q(available__gt=0), name='stock_available_idx'),
+        ]
+
+
+class StockMovement(models.Model):
+    """
+    Append-only ledger of the units entering and leaving stock. The sum of a
+    variant's movements is what it has on hand, rows are never updated.
+    """
+    RECEIPT = 'RECEIPT'
+    SALE = 'SALE'
+    QC_REJECT = 'QC_REJECT'
+    ADJUSTMENT = 'ADJUSTMENT'
+
+    MOVEMENT_TYPES = [
+        (RECEIPT, 'Receipt'),
+        (SALE, 'Sale'),
+        (QC_REJECT, 'QC Reject'),
+        (ADJUSTMENT, 'Adjustment'),
+    ]
+    product_variant = models.ForeignKey(ProductVariant, on_delete=models.PROTECT, related_name="stock_movements")
+    movement_type = models.CharField(max_length=20, choices=MOVEMENT_TYPES)
+    # Signed, negative for units leaving stock
+    quantity = models.IntegerField()
+    # Variant price when the movement happened, used for valuation
+    unit_price = models.FloatField()
+    reference = models.CharField(max_length=100, blank=True, default="")
+    created_at = models.DateTimeField(default=timezone.now)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+
+    def __str__(self):
+        return f"{self.movement_type} {self.quantity:+d} of variant {self.product_variant_id}"
+
+    class Meta:
+        db_table = "stock_movement"
+        verbose_name = "Stock Movement"
+        verbose_name_plural = "Stock Movements"
+        indexes = [
+            models.Index(fields=['created_at'], name='stock_movement_created_idx'),
+            models.Index(fields=['product_variant', 'created_at'], name='stock_movement_variant_idx'),
+        ]
+
+
+class StockSnapshot(models.Model):
+    """Per-variant balance of the ledger at `taken_at`, so history is replayed from here on."""
+    taken_at = models.DateTimeField()
+    product_variant = models.ForeignKey(ProductVariant, on_delete=models.CASCADE, related_name="stock_snapshots")
+    quantity = models.IntegerField()
+    value = models.FloatField()
 
     def __str__(self):
-        return self.product_variant.product.code
\ No newline at end of file
+        return f"{self.taken_at} - variant {self.product_variant_id}: {self.quantity}"
+
+    class Meta:
+        db_table = "stock_snapshot"
+        verbose_name = "Stock Snapshot"
+        verbose_name_plural = "Stock Snapshots"
+        constraints = [
+            models.UniqueConstraint(fields=['taken_at', 'product_variant'], name='unique_stock_snapshot'),
+        ]
+
+
+class StockHealth(models.Model):
+    """
+    Latest stock health analysis of a variant: how fast it sells, how many days
+    the units held last at that pace and whether it is running low or not moving.
+    """
+    product_variant = models.OneToOneField(ProductVariant, on_delete=models.CASCADE, related_name="stock_health")
+    quantity = models.IntegerField(default=0)
+    # Average units sold per day over the velocity window
+    daily_velocity = models.FloatField(default=0)
+    # Null when nothing sold in the window, the stock lasts indefinitely
+    days_of_cover = models.FloatField(null=True, blank=True)
+    last_sold_at = models.DateTimeField(null=True, blank=True)
+    is_low_stock = models.BooleanField(default=False)
+    is_dead_stock = models.BooleanField(default=False)
+    # When the variant last entered a flagged state, alerts are only sent for new flags
+    flagged_at = models.DateTimeField(null=True, blank=True)
+    analyzed_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"Stock health of variant {self.product_variant_id}"
+
+    class Meta:
+        db_table = "stock_health"
+        verbose_name = "Stock Health"
+        verbose_name_plural = "Stock Health"
+        indexes = [
+            models.Index(fields=['days_of_cover'], condition=models.Q(is_low_stock=True), name='stock_health_low_idx'),
+            models.Index(fields=['last_sold_at'], condition=models.Q(is_dead_stock=True), name='stock_health_dead_idx'),
+        ]
+
+
+class StockTakeSession(BaseModel):
+    """A physical count of the stock, reconciled against the variants held in stock."""
+    OPEN = 'OPEN'
+    CLOSED = 'CLOSED'
+
+    STATUS_CHOICES = [
+        (OPEN, 'Open'),
+        (CLOSED, 'Closed'),
+    ]
+    name = models.CharField(max_length=255)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=OPEN)
+    closed_at = models.DateTimeField(null=True, blank=True)
+    # Reconciliation counts frozen when the session is closed
+    summary = models.JSONField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.status})"
+
+    class Meta:
+        db_table = "stock_take_session"
+        verbose_name = "Stock Take Session"
+        verbose_name_plural = "Stock Take Sessions"
+
+
+class StockTakeScan(models.Model):
+    """One scanned piece. Codes that matched no variant are kept to report them as unexpected."""
+    session = models.ForeignKey(StockTakeSession, on_delete=models.CASCADE, related_name="scans")
+    code = models.CharField(max_length=255)
+    product_variant = models.ForeignKey(ProductVariant, on_delete=models.CASCADE, null=True, blank=True, related_name="stock_take_scans")
+    scanned_at = models.DateTimeField(default=timezone.now)
+    scanned_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+
+    def __str__(self):
+        return f"{self.code} in stock take {self.session_id}"
+
+    class Meta:
+        db_table = "stock_take_scan"
+        verbose_name = "Stock Take Scan"
+        verbose_name_plural = "Stock Take Scans"
+        indexes = [
+            models.Index(fields=['session', 'product_variant'], name='stock_take_scan_variant_idx'),
+        ]
+
+
+class QCDailyRollup(models.Model):
+    """
+    QC decisions per day, inspector, brand and product type, added to as
+    checks are approved or rejected so QC reports never scan quality_check.
+    Times are summed in seconds, averages are taken when reading.
+    """
+    date = models.DateField()
+    # 0 for checks decided without an inspector
+    assigned_employee_id = models.BigIntegerField(default=0)
+    product_brand = models.ForeignKey(BrandType, on_delete=models.CASCADE, related_name="+")
+    product_type = models.ForeignKey(ProductType, on_delete=models.CASCADE, related_name="+")
+    decided = models.PositiveIntegerField(default=0)
+    approved = models.PositiveIntegerField(default=0)
+    rejected = models.PositiveIntegerField(default=0)
+    # From creation of the check until an inspector started on it
+    queue_seconds = models.FloatField(default=0.0)
+    # From the start of the inspection until the decision
+    inprocess_seconds = models.FloatField(default=0.0)
+
+    def __str__(self):
+        return f"{self.date} - employee {self.assigned_employee_id}: {self.decided} decided"
+
+    @staticmethod
+    def _rows(decisions, decision, decided_at):
+        rows = {}
+        for quality_check, product_variant in decisions:
+            started_at = quality_check.claimed_at or quality_check.created_at or decided_at
+            key = (quality_check.assigned_employee_id or 0, product_variant.product.product_brand_id, product_variant.product.product_type_id)
+            row = rows.setdefault(key, {
+                'date': timezone.localdate(decided_at),
+                'assigned_employee_id': key[0],
+                'product_brand': key[1],
+                'product_type': key[2],
+                'decided': 0,
+                'approved': 0,
+                'rejected': 0,
+                'queue_seconds': 0.0,
+                'inprocess_seconds': 0.0,
+            })
+            row['decided'] += 1
+            row['approved' if decision == QualityCheck.APPROVED else 'rejected'] += 1
+            row['queue_seconds'] += max((started_at - (quality_check.created_at or started_at)).total_seconds(), 0)
+            row['inprocess_seconds'] += max((decided_at - started_at).total_seconds(), 0)
+        return list(rows.values())
+
+    @classmethod
+    def record(cls, decisions, decision, decided_at):
+        """Adds (quality check, variant with `product` loaded) pairs decided at `decided_at`."""
+        bulk_increment(
+            cls,
+            cls._rows(decisions, decision, decided_at),
+            unique_fields=['date', 'assigned_employee_id', 'product_brand', 'product_type'],
+            increment_fields=['decided', 'approved', 'rejected', 'queue_seconds', 'inprocess_seconds'],
+        )
+
+    @classmethod
+    def retract(cls, decisions, decision, decided_at):
+        """Takes pairs recorded as decided at `decided_at` back out, when their checks are decided again."""
+        for row in cls._rows(decisions, decision, decided_at):
+            # The row was stored with the decision, an UPDATE never inserts negative counts
+            cls.objects.filter(
+                date=row['date'], assigned_employee_id=row['assigned_employee_id'],
+                product_brand=row['product_brand'], product_type=row['product_type'],
+            ).update(**{
+                field: F(field) - row[field]
+                for field in ('decided', 'approved', 'rejected', 'queue_seconds', 'inprocess_seconds')
+            })
+
+    class Meta:
+        db_table = "qc_daily_rollup"
+        verbose_name = "QC Daily Rollup"
+        verbose_name_plural = "QC Daily Rollups"
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'assigned_employee_id', 'product_brand', 'product_type'], name='unique_qc_daily_rollup'),
+        ]
@@ -0,0 +1,78 @@
+from collections import defaultdict
+from django.db.models import Case, F, IntegerField, Value, When
+from product.models import ProductVariant
+from .listing import schedule_stock_listing_refresh
+from .models import Stock
+
+STOCK_COLUMNS = ('on_hand', 'reserved', 'qc_pending')
+
+# Variant QC states whose units are still waiting for quality check
+QC_PENDING_STATES = (ProductVariant.PENDING, ProductVariant.INPROCESS)
+
+
+def qc_pending_units(quantity, is_stock, qc_status):
+    return quantity if not is_stock and qc_status in QC_PENDING_STATES else 0
+
+
+def _column_delta(deltas, column):
+    whens = [
+        When(product_variant_id=product_variant_id, then=Value(values[column]))
+        for product_variant_id, values in deltas.items()
+        if values.get(column)
+    ]
+    if not whens:
+        return Value(0)
+    return Case(*whens, default=Value(0), output_field=IntegerField())
+
+
+def apply_deltas(deltas):
+    """
+    Adds `deltas` ({variant id: {column: delta}}, columns from STOCK_COLUMNS)
+    to the stock rows in a single UPDATE, creating missing rows first. Must run
+    in the transaction that made the change so both commit together.
+    """
+    deltas = {product_variant_id: values for product_variant_id, values in deltas.items() if any(values.values())}
+    if not deltas:
+        return 0
+
+    Stock.objects.bulk_create([Stock(product_variant_id=product_variant_id) for product_variant_id in deltas], ignore_conflicts=True)
+
+    schedule_stock_listing_refresh()
+
+    changes = {column: _column_delta(deltas, column) for column in STOCK_COLUMNS}
+    # Every right-hand side reads the values from before the UPDATE
+    return Stock.objects.filter(product_variant_id__in=deltas.keys()).update(
+        on_hand=F('on_hand') + changes['on_hand'],
+        reserved=F('reserved') + changes['reserved'],
+        qc_pending=F('qc_pending') + changes['qc_pending'],
+        available=F('on_hand') + changes['on_hand'] - F('reserved') - changes['reserved'],
+    )
+
+
+def reserve_items(items, sign=1):
+    """Reserves (or with sign=-1 releases) the quantities of (variant id, quantity) pairs."""
+    deltas = {}
+    for product_variant_id, quantity in items:
+        deltas.setdefault(product_variant_id, {'reserved': 0})['reserved'] += sign * quantity
+    return apply_deltas(deltas)
+
+
+def lock_shortfall(items):
+    """
+    Locks the stock rows of (variant id, quantity) pairs and returns
+    {variant id: missing units} for the variants with fewer units available
+    than asked for. A variant without a stock row has none available.
+    """
+    needed = defaultdict(int)
+    for product_variant_id, quantity in items:
+        needed[product_variant_id] += quantity
+    # Locked in variant order so concurrent approvals cannot deadlock
+    available = dict(
+        Stock.objects.select_for_update().filter(product_variant_id__in=needed.keys())
+        .order_by('product_variant_id').values_list('product_variant_id', 'available')
+    )
+    return {
+        product_variant_id: quantity - available.get(product_variant_id, 0)
+        for product_variant_id, quantity in needed.items()
+        if quantity > available.get(product_variant_id, 0)
+    }
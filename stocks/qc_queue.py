@@ -0,0 +1,91 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Min, Q
+from django.utils import timezone
+from orders.sweeper import batched_update
+from product.models import ProductVariant
+from .models import MemoDetail, QualityCheck
+
+
+def claim_quality_checks(employee, count, now=None):
+    """
+    Claims the `count` oldest queued checks for `employee` under a lease of
+    QC_LEASE_SECONDS. Rows another inspector is claiming at the same moment
+    are skipped instead of waited for, so no check is handed out twice.
+    Returns the IDs of the claimed checks.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        ids = list(
+            QualityCheck.objects.filter(qc_status=QualityCheck.PENDING)
+            .order_by('created_at', 'id')
+            .select_for_update(skip_locked=True)
+            .values_list('id', flat=True)[:count]
+        )
+        if not ids:
+            return []
+
+        QualityCheck.objects.filter(id__in=ids).update(
+            qc_status=QualityCheck.INPROCESS,
+            assigned_employee=employee,
+            claimed_at=now,
+            lease_expires_at=now + timedelta(seconds=settings.QC_LEASE_SECONDS),
+            updated_at=now,
+        )
+        claimed = QualityCheck.objects.filter(id__in=ids)
+        MemoDetail.objects.filter(id__in=claimed.values('memo_detail_id')).update(qc_employee=employee, updated_at=now)
+        ProductVariant.objects.filter(id__in=claimed.values('product_variant_id')) \
+            .update(qc_employee=employee, qc_status=ProductVariant.INPROCESS, updated_at=now)
+    return ids
+
+
+def renew_leases(employee, qc_ids, now=None):
+    """Extends the leases `employee` still holds on `qc_ids`. Returns how many were renewed."""
+    now = now or timezone.now()
+    return QualityCheck.objects.filter(
+        id__in=qc_ids, assigned_employee=employee, qc_status=QualityCheck.INPROCESS, lease_expires_at__gte=now,
+    ).update(lease_expires_at=now + timedelta(seconds=settings.QC_LEASE_SECONDS), updated_at=now)
+
+
+def _release(qc_ids):
+    released = QualityCheck.objects.filter(id__in=qc_ids)
+    MemoDetail.objects.filter(id__in=released.values('memo_detail_id')).update(qc_employee=None)
+    ProductVariant.objects.filter(id__in=released.values('product_variant_id')) \
+        .update(qc_employee=None, qc_status=ProductVariant.PENDING)
+
+
+def requeue_expired_leases(now=None):
+    """Puts checks whose lease ran out back at their place in the queue. Returns the count."""
+    now = now or timezone.now()
+    expired = QualityCheck.objects.filter(qc_status=QualityCheck.INPROCESS, lease_expires_at__lt=now)
+    return batched_update(
+        expired,
+        after=_release,
+        qc_status=QualityCheck.PENDING,
+        assigned_employee=None,
+        claimed_at=None,
+        lease_expires_at=None,
+        updated_at=now,
+    )
+
+
+def queue_metrics(now=None):
+    """Depth and age of the queue and the state of the leases, from one aggregate query."""
+    now = now or timezone.now()
+    pending = Q(qc_status=QualityCheck.PENDING)
+    leased = Q(qc_status=QualityCheck.INPROCESS, lease_expires_at__isnull=False)
+    totals = QualityCheck.objects.filter(pending | leased).aggregate(
+        depth=Count('id', filter=pending),
+        oldest_queued_at=Min('created_at', filter=pending),
+        claimed=Count('id', filter=leased),
+        expired_leases=Count('id', filter=leased & Q(lease_expires_at__lt=now)),
+        oldest_claimed_at=Min('claimed_at', filter=leased),
+    )
+    return {
+        'depth': totals['depth'],
+        'oldest_age_seconds': round((now - totals['oldest_queued_at']).total_seconds()) if totals['oldest_queued_at'] else 0,
+        'claimed': totals['claimed'],
+        'expired_leases': totals['expired_leases'],
+        'oldest_claim_age_seconds': round((now - totals['oldest_claimed_at']).total_seconds()) if totals['oldest_claimed_at'] else 0,
+    }
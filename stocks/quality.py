@@ -0,0 +1,130 @@
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from product.models import ProductVariant
+from .ledger import record_changes, stock_state
+from .models import Memo, MemoDetail, QCDailyRollup, QualityCheck, StockMovement
+
+# Per-item outcomes returned by the batch operations
+ASSIGNED = 'assigned'
+APPROVED = 'approved'
+REJECTED = 'rejected'
+NOT_FOUND = 'not_found'
+ALREADY_APPROVED = 'already_approved'
+NO_VARIANT = 'no_variant'
+
+DECISIONS = {
+    QualityCheck.APPROVED: (APPROVED, StockMovement.RECEIPT),
+    QualityCheck.REJECTED: (REJECTED, StockMovement.QC_REJECT),
+}
+
+
+def assign_quality_checks(sender, employee, memo_ids=(), memo_detail_ids=(), variant_ids=()):
+    """
+    Opens a QC record per memo line (of `memo_ids` and `memo_detail_ids`) and
+    per variant of `variant_ids`, all assigned to `employee`, or queued for the
+    inspectors to claim when `employee` is None. One INSERT for the records and
+    one UPDATE per table. Returns (created records, outcomes).
+    """
+    qc_status = QualityCheck.INPROCESS if employee else QualityCheck.PENDING
+    memo_ids, memo_detail_ids, variant_ids = set(memo_ids), set(memo_detail_ids), set(variant_ids)
+    outcomes = []
+    with transaction.atomic():
+        found_memos = set(Memo.objects.filter(id__in=memo_ids).values_list('id', flat=True))
+        found_details = set(
+            MemoDetail.objects.filter(Q(id__in=memo_detail_ids) | Q(memo_id__in=found_memos)).values_list('id', flat=True)
+        )
+        found_variants = set(ProductVariant.objects.filter(id__in=variant_ids).values_list('id', flat=True))
+
+        records = [
+            QualityCheck(memo_detail_id=detail_id, sender=sender, assigned_employee=employee, qc_status=qc_status)
+            for detail_id in sorted(found_details)
+        ] + [
+            QualityCheck(product_variant_id=variant_id, sender=sender, assigned_employee=employee, qc_status=qc_status)
+            for variant_id in sorted(found_variants)
+        ]
+        QualityCheck.objects.bulk_create(records)
+
+        now = timezone.now()
+        MemoDetail.objects.filter(id__in=found_details).update(qc_employee=employee, updated_at=now)
+        Memo.objects.filter(id__in=found_memos).update(qc_employee=employee, updated_at=now)
+        # Both states count as pending QC, the stock projection does not change
+        ProductVariant.objects.filter(id__in=found_variants).update(qc_employee=employee, qc_status=qc_status, updated_at=now)
+
+    for memo_id in sorted(memo_ids):
+        outcomes.append({'memo': memo_id, 'outcome': ASSIGNED if memo_id in found_memos else NOT_FOUND})
+    for record in records:
+        key = ('memo_detail', record.memo_detail_id) if record.memo_detail_id else ('product_variant', record.product_variant_id)
+        outcomes.append({key[0]: key[1], 'outcome': ASSIGNED, 'qc_id': record.id})
+    for detail_id in sorted(memo_detail_ids - found_details):
+        outcomes.append({'memo_detail': detail_id, 'outcome': NOT_FOUND})
+    for variant_id in sorted(variant_ids - found_variants):
+        outcomes.append({'product_variant': variant_id, 'outcome': NOT_FOUND})
+    return records, outcomes
+
+
+def decide_quality_checks(qc_ids, decision, user=None, defect_notes=""):
+    """
+    Approves (into stock) or rejects (out of stock, with `defect_notes`) the
+    given QC records in one transaction: the records, their memo lines and
+    their variants are each changed with one statement and the stock ledger
+    with one INSERT. Returns one outcome per requested ID, in request order.
+    """
+    outcome, movement_type = DECISIONS[decision]
+    qc_ids = list(dict.fromkeys(qc_ids))
+    now = timezone.now()
+
+    with transaction.atomic():
+        checks = QualityCheck.objects.select_for_update(of=('self',)) \
+            .select_related('memo_detail__product_variant__product', 'product_variant__product') \
+            .in_bulk(qc_ids)
+
+        results, decided, decided_variants, variants, before, references, redecided = [], [], {}, {}, {}, {}, {}
+        for qc_id in qc_ids:
+            quality_check = checks.get(qc_id)
+            if quality_check is None:
+                results.append({'qc_id': qc_id, 'outcome': NOT_FOUND})
+                continue
+            if quality_check.qc_status == QualityCheck.APPROVED:
+                results.append({'qc_id': qc_id, 'outcome': ALREADY_APPROVED})
+                continue
+            memo_detail = quality_check.memo_detail
+            product_variant = memo_detail.product_variant if memo_detail else quality_check.product_variant
+            if product_variant is None:
+                results.append({'qc_id': qc_id, 'outcome': NO_VARIANT})
+                continue
+
+            # A variant checked twice in the batch is changed once
+            product_variant = variants.setdefault(product_variant.pk, product_variant)
+            before.setdefault(product_variant.pk, stock_state(product_variant))
+            references[product_variant.pk] = f"qc:{qc_id}"
+            product_variant.is_stock = decision == QualityCheck.APPROVED
+            product_variant.qc_status = decision
+            product_variant.updated_by = user
+            product_variant.updated_at = now
+            if decision == QualityCheck.REJECTED:
+                product_variant.notes = defect_notes
+            decided.append(quality_check)
+            decided_variants[qc_id] = product_variant
+            if quality_check.qc_status == QualityCheck.REJECTED and quality_check.updated_at:
+                # Only the latest decision of a check counts, as in the rollup rebuild, so the
+                # rejection is taken out as of its own time (a rejected check's last update)
+                redecided.setdefault(quality_check.updated_at, []).append((quality_check, product_variant))
+            results.append({'qc_id': qc_id, 'outcome': outcome, 'product_variant': product_variant.pk, 'product_code': product_variant.product.code})
+
+        if decided:
+            QualityCheck.objects.filter(id__in=[check.id for check in decided]).update(qc_status=decision, lease_expires_at=None, updated_at=now)
+            MemoDetail.objects.filter(id__in=[check.memo_detail_id for check in decided if check.memo_detail_id]) \
+                .update(qc_status=decision, updated_at=now)
+            fields = ['is_stock', 'qc_status', 'updated_by', 'updated_at'] + (['notes'] if decision == QualityCheck.REJECTED else [])
+            ProductVariant.objects.bulk_update(variants.values(), fields)
+            for rejected_at, rejections in redecided.items():
+                QCDailyRollup.retract(rejections, QualityCheck.REJECTED, rejected_at)
+            QCDailyRollup.record([(check, decided_variants[check.id]) for check in decided], decision, now)
+
+            record_changes(
+                [(product_variant, before[product_variant.pk], references[product_variant.pk]) for product_variant in variants.values()],
+                movement_type,
+                user,
+            )
+    return results
@@ -0,0 +1,139 @@
+import json
+import threading
+from collections import Counter
+from django.db.models import Count
+from product.models import ProductVariant
+from .models import StockTakeScan
+
+# Process-wide barcode -> variant ID map. Barcodes never change once assigned,
+# so entries stay valid until their variant is deleted, and variants created
+# later are added on their first miss.
+_barcodes = {}
+_barcodes_loaded = False
+_barcodes_lock = threading.Lock()
+
+SCAN_BATCH_SIZE = 1000
+
+
+def clean_codes(codes):
+    # Readers often send the line terminator along with the code
+    return [str(code).strip() for code in codes if code is not None and str(code).strip()]
+
+
+def _load_barcodes():
+    global _barcodes_loaded
+    with _barcodes_lock:
+        if not _barcodes_loaded:
+            rows = ProductVariant.objects.filter(barcode__isnull=False).values_list('barcode', 'id')
+            _barcodes.update(rows.iterator(chunk_size=10000))
+            _barcodes_loaded = True
+
+
+def forget_barcode(barcode):
+    """Drops the barcode of a deleted variant from this process's map."""
+    if barcode:
+        _barcodes.pop(barcode, None)
+
+
+def _legacy_product_code(code):
+    """Product code of the labels printed before variants had barcodes ({"Code": ...})."""
+    if not code.startswith('{'):
+        return None
+    try:
+        return json.loads(code).get('Code')
+    except (ValueError, AttributeError):
+        return None
+
+
+def resolve_codes(codes):
+    """Maps each scanned code to its variant ID, or None when it matches no variant."""
+    if not _barcodes_loaded:
+        _load_barcodes()
+
+    resolved, misses = {}, []
+    for code in set(codes):
+        if code in _barcodes:
+            resolved[code] = _barcodes[code]
+        else:
+            misses.append(code)
+    if not misses:
+        return resolved
+
+    found = dict(ProductVariant.objects.filter(barcode__in=misses).values_list('barcode', 'id'))
+    _barcodes.update(found)
+    resolved.update(found)
+
+    # Older labels only name the product, they resolve when it has a single variant
+    legacy = {code: _legacy_product_code(code) for code in misses if code not in found}
+    legacy = {code: product_code for code, product_code in legacy.items() if product_code}
+    if legacy:
+        variants = {}
+        for product_code, variant_id in ProductVariant.objects.filter(product__code__in=set(legacy.values())).values_list('product__code', 'id'):
+            variants.setdefault(product_code, []).append(variant_id)
+        for code, product_code in legacy.items():
+            if len(variants.get(product_code, [])) == 1:
+                resolved[code] = variants[product_code][0]
+
+    for code in misses:
+        resolved.setdefault(code, None)
+    return resolved
+
+
+def record_scans(session, codes, user=None):
+    """Stores a batch of scans of an open session. Returns (scanned, unknown) counts."""
+    codes = clean_codes(codes)
+    resolved = resolve_codes(codes)
+
+    # Variants deleted through another process are still in this one's map
+    variant_ids = {variant_id for variant_id in resolved.values() if variant_id is not None}
+    existing = set(ProductVariant.objects.filter(id__in=variant_ids).values_list('id', flat=True))
+    for code, variant_id in resolved.items():
+        if variant_id is not None and variant_id not in existing:
+            forget_barcode(code)
+            resolved[code] = None
+
+    StockTakeScan.objects.bulk_create(
+        [StockTakeScan(session=session, code=code, product_variant_id=resolved[code], scanned_by=user) for code in codes],
+        batch_size=SCAN_BATCH_SIZE,
+    )
+    return len(codes), sum(1 for code in codes if resolved[code] is None)
+
+
+def reconcile(session):
+    """
+    Compares the pieces scanned in `session` with the variants held in stock:
+    found (scanned and in stock), missing (in stock, never scanned), unexpected
+    (scanned but not in stock) and short (scanned fewer times than held).
+    Scans are counted per variant by the database, the rest are set operations.
+    """
+    scanned = Counter(dict(
+        StockTakeScan.objects.filter(session=session, product_variant__isnull=False)
+        .values('product_variant_id').annotate(count=Count('id')).order_by()
+        .values_list('product_variant_id', 'count')
+    ))
+    unknown_codes = sorted(set(
+        StockTakeScan.objects.filter(session=session, product_variant__isnull=True).values_list('code', flat=True)
+    ))
+    held = dict(ProductVariant.objects.filter(is_stock=True).values_list('id', 'quantity'))
+
+    scanned_ids, held_ids = set(scanned), set(held)
+    found = scanned_ids & held_ids
+    missing = held_ids - scanned_ids
+    unexpected = scanned_ids - held_ids
+    short = {variant_id for variant_id in found if scanned[variant_id] < held[variant_id]}
+
+    return {
+        'matched_scans': sum(scanned.values()),
+        'found_count': len(found),
+        'missing_count': len(missing),
+        'unexpected_count': len(unexpected) + len(unknown_codes),
+        'short_count': len(short),
+        'found': sorted(found),
+        'missing': sorted(missing),
+        'unexpected': sorted(unexpected),
+        'unknown_codes': unknown_codes,
+        'short': [
+            {'product_variant': variant_id, 'scanned': scanned[variant_id], 'held': held[variant_id]}
+            for variant_id in sorted(short)
+        ],
+    }
@@ -1,11 +1,9 @@
 from rest_framework import serializers
-from .models import Memo, MemoDetail, ProductVariant, QualityCheck
+from .models import Memo, MemoDetail, ProductVariant, QualityCheck, StockTakeSession
 from product.serializers import ProductVariantSerializer, ProductSerializer
 from product.models import ProductVariant, Employee
-from users.models import User
 from users.serializers import UserListSerializer
-import random
-import string
+from .memos import create_memo
 
 
 class MemoDetailSerializer(serializers.ModelSerializer):
@@ -22,8 +20,10 @@ class MemoDetailSerializer(serializers.ModelSerializer):
     def to_representation(self, instance):
         data = super().to_representation(instance)
 
-        # Check if a related QualityCheck exists for this MemoDetail
-        qc_exists = QualityCheck.objects.filter(memo_detail=instance).exists()
+        # Annotated by MemoDetail.objects.with_qc(), only looked up for lone instances
+        qc_exists = getattr(instance, 'QC', None)
+        if qc_exists is None:
+            qc_exists = QualityCheck.objects.filter(memo_detail=instance).exists()
 
         # Set QC to True if a related QualityCheck exists, otherwise False
         data['QC'] = qc_exists
@@ -42,34 +42,23 @@ class MemoSerializer(serializers.ModelSerializer):
         read_only_fields =  ['id']
  
     def create(self, validated_data):
-        # Generate a random jangad_number
-        jangad_number = ''.join(random.choices(string.ascii_uppercase + string.digits, k=8))
-        
         # Extract memo details data
         memo_details_data = validated_data.pop('memo_detail')
-        
-        # Create memo instance
-        memo = Memo.objects.create(jangad_number=jangad_number, **validated_data)
-        
-        # Create MemoDetail instances
-        for detail_data in memo_details_data:
-            MemoDetail.objects.create(memo=memo, **detail_data)
-        
-        return memo
+        user = validated_data.pop('created_by', None)
+        validated_data.pop('updated_by', None)
+
+        # One INSERT for all the lines, the jangad number is allocated from the memo ID
+        return create_memo([detail['product_variant'].pk for detail in memo_details_data], user=user, **validated_data)
 
     def to_representation(self, instance):
         data = super().to_representation(instance)
 
-        # Calculate total pieces, total weight, and total amount, with defaults to handle missing values
-        total_pieces = len(data['memo_detail'])
-        total_weight = sum(detail['product_variant_details']['weight'] for detail in data['memo_detail'])
-        total_amount = sum(detail.get('price', 0.0) for detail in data['memo_detail'])
-        
-        # Add these totals to the response
-        data['total_pieces'] = total_pieces
-        data['total_weight'] = total_weight
-        data['total_amount'] = total_amount
-        
+        # Totals come from Memo.objects.with_totals(), they are only summed here for memos loaded without it
+        if getattr(instance, 'total_pieces', None) is None:
+            data['total_pieces'] = len(data['memo_detail'])
+            data['total_weight'] = sum(detail['product_variant_details']['weight'] for detail in data['memo_detail'])
+            data['total_amount'] = sum(detail.get('price', 0.0) for detail in data['memo_detail'])
+
         return data
 
 
@@ -88,19 +77,23 @@ class QualityCheckSerializer(serializers.ModelSerializer):
         fields = ['id', 'sender_detail', 'assigned_employee_detail', 'memo_detail_data', 'qc_status']
     
     def get_sender_detail(self, obj):
-        sender_data = User.objects.filter(id=obj.sender.id)
-        return UserListSerializer(
-            sender_data, many=True, read_only=True, context=self.context
-        ).data
+        # Loaded with the check by QualityCheck.objects.with_details()
+        return [UserListSerializer(obj.sender, context=self.context).data]
     
     def get_assigned_employee_detail(self, obj):
-        sender_data = User.objects.filter(id=obj.assigned_employee.id)
-        return UserListSerializer(
-            sender_data, many=True, read_only=True, context=self.context
-        ).data
+        if not obj.assigned_employee_id:
+            return []
+        return [EmployeeSerializer(obj.assigned_employee, context=self.context).data]
 
 class ProductVariantSerializer(serializers.ModelSerializer):
     product = ProductSerializer(read_only=True) 
     class Meta:
         model = ProductVariant
-        fields = ['id', 'product', 'color', 'weight', 'size', 'carat', 'price', 'quantity', 'notes', 'is_stock']
\ No newline at end of file
+        fields = ['id', 'product', 'color', 'weight', 'size', 'carat', 'price', 'quantity', 'notes', 'is_stock']
+
+
+class StockTakeSessionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = StockTakeSession
+        fields = ['id', 'name', 'status', 'created_at', 'closed_at', 'summary']
+        read_only_fields = ['id', 'status', 'created_at', 'closed_at', 'summary']
@@ -1,10 +1,25 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
-from product.models import ProductVariant
+from product.models import Product, ProductVariant
+from .listing import schedule_stock_listing_refresh
 from .models import Stock
+from .scanning import forget_barcode
 
 @receiver(post_save, sender=ProductVariant)
 def create_stock_for_variant(sender, instance, created, **kwargs):
     if created:
-        # Create a Stock entry for each new ProductVariant
-        Stock.objects.create(product_variant=instance)
+        # Create an empty Stock entry for each new ProductVariant, the ledger fills it
+        Stock.objects.bulk_create([Stock(product_variant=instance)], ignore_conflicts=True)
+
+
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=ProductVariant)
+def refresh_listing_for_catalog_change(sender, instance, **kwargs):
+    # Prices, codes and images are part of the public listing
+    schedule_stock_listing_refresh()
+
+
+@receiver(post_delete, sender=ProductVariant)
+def forget_deleted_variant_barcode(sender, instance, **kwargs):
+    # Scans of its label no longer point at a variant
+    forget_barcode(instance.barcode)
@@ -0,0 +1,75 @@
+import logging
+from datetime import datetime, time
+from celery import shared_task
+from django.core.cache import cache
+from django.utils import timezone
+from . import health
+from .listing import LISTING_REFRESH_KEY, publish_stock_listing
+from .memo_pdf import BATCH_PROGRESS_TIMEOUT, ensure_memo_pdf, render_memo_pdfs
+from .models import Memo
+from .qc_queue import requeue_expired_leases
+from .ledger import take_snapshot
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def snapshot_stock():
+    """
+    Snapshots the stock ledger as of midnight. Taken a little after midnight so
+    every movement of the previous day has been committed.
+    """
+    midnight = timezone.make_aware(datetime.combine(timezone.localdate(), time.min))
+    count = take_snapshot(midnight)
+    logger.info("Stock snapshot at %s stored %s variants", midnight, count)
+    return count
+
+
+@shared_task
+def analyze_stock_health():
+    """Flags low and dead stock and emails the newly flagged variants to the admins."""
+    alerts = health.analyze_stock_health()
+    return health.send_alert_digest(alerts)
+
+
+@shared_task
+def requeue_expired_qc_leases():
+    """Returns checks whose inspector did not decide them in time to the QC queue."""
+    count = requeue_expired_leases()
+    if count:
+        logger.info("Requeued %s QC checks with expired leases", count)
+    return count
+
+
+@shared_task
+def refresh_stock_listing():
+    """Re-renders the public in-stock listing after stock changed."""
+    # Cleared first, a change made while rendering schedules another refresh
+    cache.delete(LISTING_REFRESH_KEY)
+    return publish_stock_listing()
+
+
+@shared_task
+def generate_memo_pdf(memo_id):
+    """Renders and stores the PDF of a memo unless the current version is already stored."""
+    memo = Memo.objects.filter(pk=memo_id).first()
+    if memo is None:
+        return False
+    return ensure_memo_pdf(memo)
+
+
+@shared_task
+def render_memo_batch(memo_ids, progress_key):
+    """Renders the outdated PDFs of a day's memos for the batch download, which polls `progress_key`."""
+    def progress(done, total):
+        cache.set(progress_key, {'status': 'rendering', 'done': done, 'total': total}, timeout=BATCH_PROGRESS_TIMEOUT)
+
+    try:
+        rendered = render_memo_pdfs(memo_ids, progress=progress)
+    except Exception:
+        # The next poll of the download starts another run instead of waiting for the timeout
+        cache.delete(progress_key)
+        raise
+    cache.set(progress_key, {'status': 'ready', 'done': len(memo_ids), 'total': len(memo_ids)}, timeout=BATCH_PROGRESS_TIMEOUT)
+    logger.info("Rendered %s of %s memo PDFs", rendered, len(memo_ids))
+    return rendered
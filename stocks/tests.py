@@ -1,3 +1,609 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+from datetime import date, timedelta
+from unittest import mock
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.files.storage import default_storage
+from django.test import override_settings
+from django.utils import timezone
+from openpyxl import Workbook
+from pypdf import PdfReader
+from rest_framework.test import APIClient
+from backend.testing import CatalogTestCase, TemporaryMediaMixin, create_employees
+from orders.models import Order, OrderItem, Selling
+from product.models import ProductVariant
+from .labels import barcode_path, ensure_barcode
+from .ledger import inventory_at, movement, record, record_change, stock_state, take_snapshot
+from .listing import LISTING_VERSION_KEY, _page_key, _pages_key, _render_lock_key, publish_stock_listing
+from .memo_pdf import ensure_memo_pdf
+from .memos import JANGAD_FORMAT, create_memo
+from .models import Memo, QCDailyRollup, QualityCheck, Stock, StockHealth, StockMovement, StockTakeSession
+from .projection import reserve_items
+from .qc_queue import claim_quality_checks, renew_leases, requeue_expired_leases
+from .quality import assign_quality_checks, decide_quality_checks
+from .scanning import _barcodes, record_scans, resolve_codes
+from .serializers import MemoSerializer
+from .tasks import analyze_stock_health
 
-# Create your tests here.
+
+class StocksQueryCountTests(TemporaryMediaMixin, CatalogTestCase):
+    """
+    Pins the stocks endpoints to a fixed number of queries, whatever the
+    number of rows they return, so a lazily loaded relation shows up here.
+    """
+    variant_count = 6
+    variant_quantity = 2
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.employees = create_employees(2)
+        cls.memos = [create_memo([variant.id for variant in cls.variants[i::2]], user=cls.admin, client_name=f"Client {i}") for i in range(2)]
+        assign_quality_checks(cls.admin, cls.employees[0], memo_ids=[cls.memos[0].id])
+        assign_quality_checks(cls.admin, cls.employees[1], variant_ids=[variant.id for variant in cls.variants[3:]])
+        assign_quality_checks(cls.admin, None, memo_ids=[cls.memos[1].id])
+        StockTakeSession.objects.create(name="Shelf A", created_by=cls.admin)
+        StockTakeSession.objects.create(name="Shelf B", created_by=cls.admin)
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_memo_list(self):
+        with self.assertNumQueries(3):
+            response = self.client.get("/stock/memo/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 2)
+
+    def test_memo_retrieve(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(f"/stock/memo/{self.memos[0].id}/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['total_pieces'], 3)
+
+    def test_memo_details(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(f"/stock/memo/{self.memos[0].id}/details/")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(all(detail['QC'] for detail in response.data))
+
+    def test_memo_update(self):
+        with self.assertNumQueries(4):
+            response = self.client.put(f"/stock/memo/{self.memos[0].id}/", {'client_name': "Renamed"}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['memo_detail']), 3)
+
+    def test_quality_check_list(self):
+        with self.assertNumQueries(3):
+            response = self.client.get("/stock/quality-checks/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 9)
+        employees = {employee.id: employee.email for employee in self.employees}
+        for record in response.data['results']:
+            self.assertEqual(record['sender_detail'][0]['email'], self.admin.email)
+            if record['assigned_employee_detail']:
+                self.assertIn(record['assigned_employee_detail'][0]['email'], employees.values())
+
+    def test_quality_check_claim(self):
+        with self.assertNumQueries(9):
+            response = self.client.post("/stock/quality-checks/queue/claim/", {'employee_id': self.employees[1].id, 'count': 3}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 3)
+        self.assertEqual(response.data[0]['assigned_employee_detail'][0]['id'], self.employees[1].id)
+
+    def test_quality_check_assign(self):
+        memo = create_memo([variant.id for variant in self.variants], user=self.admin)
+        with self.assertNumQueries(11):
+            response = self.client.post("/stock/quality-checks/assign/", {'memo_id': memo.id, 'assigned_employee_id': self.employees[0].id}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data), 6)
+
+    def test_quality_check_batch_assign(self):
+        memo = create_memo([variant.id for variant in self.variants], user=self.admin)
+        with self.assertNumQueries(10):
+            response = self.client.post("/stock/quality-checks/batch-assign/", {
+                'assigned_employee_id': self.employees[0].id, 'memo_ids': [memo.id], 'variant_ids': [variant.id for variant in self.variants],
+            }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['assigned'], 12)
+
+    def test_quality_check_batch_decide(self):
+        qc_ids = list(QualityCheck.objects.order_by('id').values_list('id', flat=True))
+        with self.assertNumQueries(7):
+            response = self.client.post("/stock/quality-checks/batch-decide/", {'decision': QualityCheck.APPROVED, 'qc_ids': qc_ids}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['decided'], 9)
+
+    def test_quality_check_renew(self):
+        claimed = self.client.post("/stock/quality-checks/queue/claim/", {'employee_id': self.employees[1].id, 'count': 3}, format='json').data
+        with self.assertNumQueries(2):
+            response = self.client.post("/stock/quality-checks/queue/renew/", {
+                'employee_id': self.employees[1].id, 'qc_ids': [record['id'] for record in claimed],
+            }, format='json')
+        self.assertEqual(response.data, {'renewed': 3, 'lost': 0})
+
+    def test_assign_to_stock(self):
+        quality_check = QualityCheck.objects.filter(memo_detail__isnull=False).earliest('id')
+        with self.assertNumQueries(7):
+            response = self.client.post("/stock/assign-to-stock/", {'qc_id': quality_check.id}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_assign_to_purchase(self):
+        quality_check = QualityCheck.objects.filter(product_variant__isnull=False).earliest('id')
+        with self.assertNumQueries(9):
+            response = self.client.post("/stock/assign-to-purchase/", {'qc_id': quality_check.id, 'defect_notes': "Scratched"}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_quality_check_queue(self):
+        with self.assertNumQueries(1):
+            response = self.client.get("/stock/quality-checks/queue/")
+        self.assertEqual(response.data['depth'], 3)
+
+    def test_quality_check_analytics(self):
+        today = date.today().isoformat()
+        with self.assertNumQueries(1):
+            response = self.client.get("/stock/quality-checks/analytics/", {'start_date': today, 'end_date': today, 'group_by': 'product_brand'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_products_in_stock(self):
+        publish_stock_listing()
+        # Published pages are served from the cache, compressed when the client accepts it
+        with self.assertNumQueries(0):
+            response = self.client.get("/stock/", HTTP_ACCEPT_ENCODING="gzip, deflate")
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertIn('public', response['Cache-Control'])
+        self.assertEqual(json.loads(gzip.decompress(response.content))['count'], 6)
+
+        response = self.client.get("/stock/", HTTP_ACCEPT_ENCODING="gzip", HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.client.get("/stock/", {'page': 2}).status_code, 404)
+
+    def test_products_in_stock_missing_from_the_cache(self):
+        cache.clear()
+        # While another request renders a missing page, callers are asked to retry
+        cache.add(_render_lock_key(0, 1), 1)
+        response = self.client.get("/stock/")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+        cache.delete(_render_lock_key(0, 1))
+
+        # Otherwise only the requested page is rendered, uncompressed, and a refresh is scheduled
+        with self.assertNumQueries(2), mock.patch('stocks.listing.schedule_stock_listing_refresh') as schedule:
+            response = self.client.get("/stock/", HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(json.loads(response.content)['count'], 6)
+        schedule.assert_called_once()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get("/stock/").status_code, 200)
+
+    def test_products_in_stock_falls_back_to_the_previous_version(self):
+        publish_stock_listing()
+        first = cache.get(LISTING_VERSION_KEY)
+        publish_stock_listing()
+        cache.delete(_page_key(cache.get(LISTING_VERSION_KEY), 1))
+        with self.assertNumQueries(0):
+            response = self.client.get("/stock/")
+        self.assertEqual(json.loads(response.content)['count'], 6)
+
+        # Only the current and the previous version are kept
+        self.assertIsNotNone(cache.get(_page_key(first, 1)))
+        publish_stock_listing()
+        self.assertIsNone(cache.get(_page_key(first, 1)))
+        self.assertIsNone(cache.get(_pages_key(first)))
+
+    def test_employee_list(self):
+        with self.assertNumQueries(1):
+            response = self.client.get("/stock/employees/")
+        self.assertEqual(len(response.data), 2)
+
+    def test_stock_take_list(self):
+        with self.assertNumQueries(2):
+            response = self.client.get("/stock/stock-takes/")
+        self.assertEqual(response.data['count'], 2)
+
+    def test_stock_take_scans(self):
+        session = StockTakeSession.objects.earliest('id')
+        codes = [variant.barcode for variant in self.variants] + ["UNKNOWN"]
+        with self.assertNumQueries(4):
+            response = self.client.post(f"/stock/stock-takes/{session.id}/scans/", {'codes': codes}, format='json')
+        self.assertEqual(response.data, {'scanned': 7, 'unknown': 1})
+
+    def test_stock_take_report_and_close(self):
+        session = StockTakeSession.objects.earliest('id')
+        self.client.post(f"/stock/stock-takes/{session.id}/scans/", {'codes': [variant.barcode for variant in self.variants[:4]]}, format='json')
+        with self.assertNumQueries(4):
+            response = self.client.get(f"/stock/stock-takes/{session.id}/report/")
+        self.assertEqual(response.data['found_count'], 4)
+        with self.assertNumQueries(7):
+            response = self.client.post(f"/stock/stock-takes/{session.id}/close/")
+        self.assertEqual(response.data['missing_count'], 2)
+
+    def test_memo_import(self):
+        workbook = Workbook()
+        sheet = workbook.active
+        sheet.append(['product_code', 'carat'])
+        for variant in self.variants:
+            sheet.append([variant.product.code, variant.carat])
+        upload = io.BytesIO()
+        workbook.save(upload)
+        upload.seek(0)
+        upload.name = "memo.xlsx"
+        with self.assertNumQueries(8):
+            response = self.client.post("/stock/memo/import/", {'file': upload, 'client_name': "Supplier"}, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data['memo_detail']), 6)
+
+    def test_barcode_labels(self):
+        # Barcode images are rendered once, the queries are what is pinned here
+        for variant in self.variants:
+            ensure_barcode(variant.barcode)
+        with self.assertNumQueries(3):
+            response = self.client.post("/stock/barcode-labels/", {'memo_id': self.memos[0].id}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b"".join(response.streaming_content).startswith(b"%PDF"))
+
+    def test_barcode_labels_render_missing_barcodes_in_the_request(self):
+        with mock.patch('backend.utils.ProcessPoolExecutor', side_effect=AssertionError("No worker processes in a request")):
+            response = self.client.post("/stock/barcode-labels/", {'product_variant_ids': [variant.id for variant in self.variants]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b"".join(response.streaming_content).startswith(b"%PDF"))
+        self.assertTrue(all(default_storage.exists(barcode_path(variant.barcode)) for variant in self.variants))
+
+    def test_generate_barcode(self):
+        with self.assertNumQueries(1):
+            response = self.client.post(f"/stock/generate-barcode/{self.variants[0].id}/")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b"".join(response.streaming_content).startswith(b"\x89PNG"))
+
+    def test_employee_retrieve_and_update(self):
+        employee = self.employees[0]
+        with self.assertNumQueries(1):
+            response = self.client.get(f"/stock/employees/{employee.id}/")
+        self.assertEqual(response.data['email'], employee.email)
+        with self.assertNumQueries(5):
+            response = self.client.put(f"/stock/employees/{employee.id}/", {
+                'first_name': "Renamed", 'email': employee.email, 'phone_number': str(employee.phone_number), 'job_title': employee.job_title,
+            }, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_memo_pdf(self):
+        # The first download renders the current version, later ones read it
+        with self.assertNumQueries(3):
+            response = self.client.get(f"/stock/memo/{self.memos[0].id}/pdf/")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b"".join(response.streaming_content).startswith(b"%PDF"))
+        with self.assertNumQueries(2):
+            response = self.client.get(f"/stock/memo/{self.memos[0].id}/pdf/")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b"".join(response.streaming_content).startswith(b"%PDF"))
+
+    def test_scan_lookup(self):
+        codes = [variant.barcode for variant in self.variants]
+        # The first lookup loads the barcode map, or adds the codes it does not hold yet
+        self.client.post("/stock/scan-lookup/", {'codes': codes}, format='json')
+        with self.assertNumQueries(1):
+            response = self.client.post("/stock/scan-lookup/", {'codes': codes}, format='json')
+        self.assertEqual([result['product_variant'] for result in response.data], [variant.id for variant in self.variants])
+
+    def test_inventory_at(self):
+        with self.assertNumQueries(2):
+            response = self.client.get("/stock/inventory-at/")
+        self.assertEqual(response.status_code, 200)
+
+
+class StockLedgerTests(CatalogTestCase):
+    variant_count = 2
+
+    def move(self, product_variant, quantity, moment):
+        item = movement(product_variant, StockMovement.RECEIPT if quantity > 0 else StockMovement.ADJUSTMENT, quantity)
+        item.created_at = moment
+        record([item])
+
+    def test_inventory_at_replays_movements_after_the_latest_snapshot(self):
+        now = timezone.now()
+        self.move(self.variants[0], 5, now - timedelta(days=3))
+        self.move(self.variants[1], 1, now - timedelta(days=3))
+        take_snapshot(now - timedelta(days=2))
+        self.move(self.variants[0], -2, now - timedelta(days=1))
+
+        self.assertEqual(inventory_at(now - timedelta(days=4)), (None, {}))
+        self.assertEqual(inventory_at(now - timedelta(days=2, hours=1)), (None, {self.variants[0].id: [5, 500.0], self.variants[1].id: [1, 200.0]}))
+
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        response = client.get("/stock/inventory-at/", {'product_variant': self.variants[0].id})
+        self.assertEqual(response.data['snapshot_at'], now - timedelta(days=2))
+        self.assertEqual(response.data['items'], [{'product_variant': self.variants[0].id, 'code': "R0", 'quantity': 3, 'value': 300.0}])
+
+    def test_variant_edits_move_the_ledger_and_the_projection(self):
+        before = stock_state(self.variant)
+        self.variant.quantity = 4
+        self.variant.save()
+        record_change(self.variant, before, StockMovement.ADJUSTMENT, "variant:edit", self.admin)
+
+        self.assertEqual(list(StockMovement.objects.values_list('quantity', 'reference')), [(3, "variant:edit")])
+        stock = Stock.objects.get(product_variant=self.variant)
+        self.assertEqual((stock.on_hand, stock.available), (4, 4))
+
+
+class ScanningTests(CatalogTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.session = StockTakeSession.objects.create(name="Shelf A", created_by=cls.admin)
+
+    def test_deleted_variant_is_dropped_from_the_barcode_map(self):
+        barcode = self.variant.barcode
+        self.assertEqual(resolve_codes([barcode]), {barcode: self.variant.id})
+        ProductVariant.objects.filter(pk=self.variant.pk).delete()
+        self.assertNotIn(barcode, _barcodes)
+
+    def test_scan_of_variant_deleted_by_another_process_is_unknown(self):
+        barcode = self.variant.barcode
+        resolve_codes([barcode])
+        ProductVariant.objects.filter(pk=self.variant.pk).delete()
+        # Still mapped in a process that did not see the delete
+        _barcodes[barcode] = self.variant.id
+
+        self.assertEqual(record_scans(self.session, [barcode], user=self.admin), (1, 1))
+        self.assertIsNone(self.session.scans.get().product_variant_id)
+        self.assertNotIn(barcode, _barcodes)
+
+
+@override_settings(QC_LEASE_SECONDS=60)
+class QCQueueTests(CatalogTestCase):
+    variant_count = 3
+    in_stock = False
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.employees = create_employees(2)
+        assign_quality_checks(cls.admin, None, variant_ids=[variant.id for variant in cls.variants])
+        cls.qc_ids = list(QualityCheck.objects.order_by('id').values_list('id', flat=True))
+
+    def test_checks_are_claimed_once_and_requeued_when_the_lease_expires(self):
+        now = timezone.now()
+        self.assertEqual(claim_quality_checks(self.employees[0], 2, now=now), self.qc_ids[:2])
+        self.assertEqual(claim_quality_checks(self.employees[1], 2, now=now), self.qc_ids[2:])
+        self.assertEqual(claim_quality_checks(self.employees[1], 1, now=now), [])
+        self.assertEqual(
+            set(ProductVariant.objects.values_list('qc_employee_id', 'qc_status')),
+            {(self.employees[0].id, ProductVariant.INPROCESS), (self.employees[1].id, ProductVariant.INPROCESS)},
+        )
+
+        later = now + timedelta(seconds=61)
+        self.assertEqual(renew_leases(self.employees[0], self.qc_ids[:2], now=later), 0)
+        self.assertEqual(requeue_expired_leases(now=later), 3)
+
+        self.assertEqual(set(ProductVariant.objects.values_list('qc_employee_id', 'qc_status')), {(None, ProductVariant.PENDING)})
+        # Back at their place in the queue, the oldest first
+        self.assertEqual(claim_quality_checks(self.employees[1], 3, now=later), self.qc_ids)
+
+
+class QCRollupTests(CatalogTestCase):
+    variant_count = 3
+    in_stock = False
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.employee = create_employees(1)[0]
+        assign_quality_checks(cls.admin, cls.employee, variant_ids=[variant.id for variant in cls.variants])
+        cls.qc_ids = list(QualityCheck.objects.order_by('id').values_list('id', flat=True))
+
+    def rollup(self):
+        return [
+            (row.date, row.assigned_employee_id, row.product_brand_id, row.product_type_id, row.decided, row.approved,
+             row.rejected, round(row.queue_seconds, 6), round(row.inprocess_seconds, 6))
+            for row in QCDailyRollup.objects.order_by('date', 'assigned_employee_id', 'product_brand', 'product_type')
+        ]
+
+    def test_live_rollup_matches_a_rebuild_after_re_decisions(self):
+        decide_quality_checks(self.qc_ids, QualityCheck.REJECTED, user=self.admin, defect_notes="Scratched")
+        decide_quality_checks(self.qc_ids[:1], QualityCheck.APPROVED, user=self.admin)
+        decide_quality_checks(self.qc_ids[1:2], QualityCheck.REJECTED, user=self.admin, defect_notes="Chipped")
+        live = self.rollup()
+
+        call_command('rebuild_qc_rollup', stdout=io.StringIO())
+
+        self.assertEqual([row[4:7] for row in live], [(3, 1, 2)])
+        self.assertEqual(self.rollup(), live)
+
+    def test_breakdown_per_inspector(self):
+        decide_quality_checks(self.qc_ids[:2], QualityCheck.APPROVED, user=self.admin)
+        decide_quality_checks(self.qc_ids[2:], QualityCheck.REJECTED, user=self.admin, defect_notes="Scratched")
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        today = timezone.localdate().isoformat()
+
+        response = client.get("/stock/quality-checks/analytics/", {'start_date': today, 'end_date': today, 'group_by': 'employee'})
+
+        self.assertEqual(response.status_code, 200)
+        [result] = response.data['results']
+        self.assertEqual(
+            (result['key'], result['name'], result['decided'], result['approved'], result['rejected'], result['reject_rate'], result['throughput_per_day']),
+            (self.employee.id, "Inspector 0", 3, 2, 1, 33.33, 3.0),
+        )
+
+
+class MemoTotalsTests(CatalogTestCase):
+    variant_count = 3
+    in_stock = False
+
+    def test_sql_totals_and_qc_flags_match_the_memo_lines(self):
+        memo = create_memo([variant.id for variant in self.variants], user=self.admin, client_name="Client")
+        assign_quality_checks(self.admin, None, memo_detail_ids=[memo.memo_detail.get(product_variant=self.variants[0]).id])
+        client = APIClient()
+        client.force_authenticate(self.admin)
+
+        response = client.get(f"/stock/memo/{memo.id}/")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['total_pieces'], response.data['total_weight'], response.data['total_amount']), (3, 7.5, 600.0))
+        self.assertEqual(sorted((detail['price'], detail['QC']) for detail in response.data['memo_detail']), [(100.0, True), (200.0, False), (300.0, False)])
+        # The same as the Python fallback over an instance loaded without the annotations
+        fallback = MemoSerializer(Memo.objects.get(pk=memo.pk)).data
+        for field in ('total_pieces', 'total_weight', 'total_amount'):
+            self.assertEqual(response.data[field], fallback[field])
+        self.assertCountEqual(response.data['memo_detail'], fallback['memo_detail'])
+
+
+class MemoCreationTests(CatalogTestCase):
+    variant_count = 2
+    in_stock = False
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def sheet(self, *rows):
+        workbook = Workbook()
+        for row in rows:
+            workbook.active.append(row)
+        upload = io.BytesIO()
+        workbook.save(upload)
+        upload.seek(0)
+        upload.name = "memo.xlsx"
+        return upload
+
+    def test_each_memo_gets_its_own_jangad_number(self):
+        memos = [create_memo([variant.id for variant in self.variants], user=self.admin, client_name=f"Client {i}") for i in range(2)]
+
+        for memo in memos:
+            memo.refresh_from_db()
+            self.assertEqual(memo.jangad_number, JANGAD_FORMAT.format(memo.pk))
+            self.assertCountEqual(memo.memo_detail.values_list('product_variant_id', flat=True), [variant.id for variant in self.variants])
+        self.assertNotEqual(memos[0].jangad_number, memos[1].jangad_number)
+
+    def test_import_resolves_ids_and_codes_in_sheet_order(self):
+        upload = self.sheet(['product_variant', 'product_code', 'carat'], [None, "R1", 18], [self.variants[0].id, None, None], [None, None, None])
+
+        response = self.client.post("/stock/memo/import/", {'file': upload, 'client_name': "Supplier"}, format='multipart')
+
+        self.assertEqual(response.status_code, 201)
+        memo = Memo.objects.get(pk=response.data['id'])
+        self.assertEqual(memo.jangad_number, JANGAD_FORMAT.format(memo.pk))
+        self.assertEqual(list(memo.memo_detail.order_by('id').values_list('product_variant_id', flat=True)), [self.variants[1].id, self.variants[0].id])
+
+    def test_import_with_unresolved_rows_creates_nothing(self):
+        upload = self.sheet(['product_code', 'carat'], ["R0", 18], ["R9", 18], ["R1", "eighteen"])
+
+        response = self.client.post("/stock/memo/import/", {'file': upload, 'client_name': "Supplier"}, format='multipart')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['rows'], ["Row 3: no variant of product R9 with carat 18.", "Row 4: invalid carat for product R1."])
+        self.assertFalse(Memo.objects.exists())
+
+
+class StockProjectionTests(CatalogTestCase):
+    variant_count = 2
+    variant_quantity = 3
+    in_stock = False
+
+    def stock(self):
+        return list(Stock.objects.order_by('product_variant_id').values_list('product_variant_id', 'on_hand', 'reserved', 'qc_pending', 'available'))
+
+    def test_live_projection_matches_a_rebuild(self):
+        assign_quality_checks(self.admin, create_employees(1)[0], variant_ids=[variant.id for variant in self.variants])
+        approved, rejected = QualityCheck.objects.order_by('id').values_list('id', flat=True)
+        decide_quality_checks([approved], QualityCheck.APPROVED, user=self.admin)
+        decide_quality_checks([rejected], QualityCheck.REJECTED, user=self.admin, defect_notes="Scratched")
+        order = Order.objects.create(user=self.buyer, total_price=100.0, is_approved=True)
+        OrderItem.objects.create(order=order, product_variant=self.variants[0], quantity=1)
+        reserve_items([(self.variants[0].id, 1)])
+        live = self.stock()
+
+        call_command('rebuild_stock', stdout=io.StringIO())
+
+        self.assertEqual(live, [(self.variants[0].id, 3, 1, 0, 2), (self.variants[1].id, 0, 0, 0, 0)])
+        self.assertEqual(self.stock(), live)
+
+
+@override_settings(STOCK_VELOCITY_DAYS=30, LOW_STOCK_COVER_DAYS=14, DEAD_STOCK_DAYS=90, DEFAULT_FROM_EMAIL="stock@example.com")
+class StockHealthTests(CatalogTestCase):
+    variant_count = 3
+    variant_quantity = 5
+
+    def test_newly_low_and_dead_stock_is_emailed_once(self):
+        # 15 sold in 30 days leaves 10 days of cover
+        order = Order.objects.create(user=self.buyer, total_price=1500.0)
+        Selling.objects.create(order=order, product_variant=self.variants[0], quantity=15)
+        ProductVariant.objects.filter(pk=self.variants[1].pk).update(created_at=timezone.now() - timedelta(days=100))
+
+        self.assertEqual(analyze_stock_health(), 1)
+
+        self.assertEqual(
+            list(StockHealth.objects.order_by('product_variant_id').values_list('product_variant_id', 'is_low_stock', 'is_dead_stock')),
+            [(self.variants[0].id, True, False), (self.variants[1].id, False, True), (self.variants[2].id, False, False)],
+        )
+        self.assertEqual(mail.outbox[0].to, [self.admin.email])
+        self.assertEqual(mail.outbox[0].subject, "Stock alerts: 1 low, 1 not moving")
+        self.assertIn("R0", mail.outbox[0].body)
+        self.assertIn("R1", mail.outbox[0].body)
+        self.assertNotIn("R2", mail.outbox[0].body)
+
+        # Still flagged, nothing new to report
+        self.assertEqual(analyze_stock_health(), 0)
+        self.assertEqual(len(mail.outbox), 1)
+
+
+class MemoPDFTests(TemporaryMediaMixin, CatalogTestCase):
+    in_stock = False
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        self.memo = create_memo([self.variant.id], user=self.admin, client_name="Client")
+
+    def test_previous_version_is_deleted(self):
+        ensure_memo_pdf(self.memo)
+        previous = self.memo.pdf_file.name
+        Memo.objects.filter(pk=self.memo.pk).update(client_name="Renamed")
+        self.memo.refresh_from_db()
+
+        self.assertTrue(ensure_memo_pdf(self.memo))
+        self.assertNotEqual(self.memo.pdf_file.name, previous)
+        self.assertFalse(default_storage.exists(previous))
+
+    def test_batch_is_rendered_by_the_worker(self):
+        day = self.memo.created_at.date().isoformat()
+        with mock.patch('stocks.views.render_memo_batch.delay') as delay:
+            response = self.client.get("/stock/memo/pdf/", {'date': day})
+            self.assertEqual(response.status_code, 202)
+            self.assertEqual(response.data['total'], 1)
+            # Polling while it renders does not start another render
+            self.assertEqual(self.client.get("/stock/memo/pdf/", {'date': day}).status_code, 202)
+        delay.assert_called_once_with([self.memo.id], mock.ANY)
+
+        ensure_memo_pdf(self.memo)
+        response = self.client.get("/stock/memo/pdf/", {'date': day})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertTrue(b"".join(response.streaming_content).startswith(b"%PDF"))
+
+    @override_settings(CELERY_TASK_ALWAYS_EAGER=True)
+    def test_batch_task_renders_without_a_process_pool(self):
+        create_memo([self.variant.id], user=self.admin, client_name="Other client")
+        day = self.memo.created_at.date().isoformat()
+        # What starting processes in a prefork Celery worker ends with
+        with mock.patch('backend.utils.ProcessPoolExecutor', side_effect=AssertionError("daemonic processes are not allowed to have children")):
+            with mock.patch('stocks.memo_pdf.ensure_memo_pdf', side_effect=OSError("No space left on device")) as ensure:
+                self.assertEqual(self.client.get("/stock/memo/pdf/", {'date': day}).status_code, 202)
+                # The failed run cleared its progress, the next poll starts another one
+                self.assertEqual(self.client.get("/stock/memo/pdf/", {'date': day}).status_code, 202)
+            self.assertEqual(ensure.call_count, 2)
+
+            self.assertEqual(self.client.get("/stock/memo/pdf/", {'date': day}).status_code, 202)
+            response = self.client.get("/stock/memo/pdf/", {'date': day})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(PdfReader(io.BytesIO(b"".join(response.streaming_content))).pages), 2)
@@ -1,16 +1,32 @@
 from django.urls import path
-from .views import MemoAPIView, MemoDetailAPIView, GenerateBarcodeAPIView, EmployeeListCreateAPIView, EmployeeRetrieveUpdateDeleteAPIView, QualityCheckListAPIView, QualityCheckCreateAPIView, AssignToStock, AssignToPurchase, ProductVariantsInStock
+from .views import MemoAPIView, MemoImportAPIView, MemoDetailAPIView, MemoPDFAPIView, MemoBatchPDFAPIView, GenerateBarcodeAPIView, BarcodeLabelsAPIView, EmployeeListCreateAPIView, EmployeeRetrieveUpdateDeleteAPIView, QualityCheckListAPIView, QualityCheckCreateAPIView, QualityCheckBatchAssignAPIView, QualityCheckBatchDecisionAPIView, QualityCheckQueueAPIView, QualityCheckAnalyticsAPIView, QualityCheckClaimAPIView, QualityCheckRenewAPIView, AssignToStock, AssignToPurchase, ProductVariantsInStock, InventoryAtAPIView, ScanLookupAPIView, StockTakeSessionAPIView, StockTakeScanAPIView, StockTakeReportAPIView, StockTakeCloseAPIView
 
 urlpatterns = [
     path('', ProductVariantsInStock.as_view(), name='product-variants-in-stock'),
     path('memo/', MemoAPIView.as_view(), name='memo-list'),
+    path('memo/import/', MemoImportAPIView.as_view(), name='memo-import'),
+    path('memo/pdf/', MemoBatchPDFAPIView.as_view(), name='memo-batch-pdf'),
     path('memo/<int:memo_id>/', MemoAPIView.as_view(), name='memo-detail'),
     path('memo/<int:memo_id>/details/', MemoDetailAPIView.as_view(), name='memo-details'),
+    path('memo/<int:memo_id>/pdf/', MemoPDFAPIView.as_view(), name='memo-pdf'),
     path('generate-barcode/<int:id>/', GenerateBarcodeAPIView.as_view(), name='generate-barcode'),
+    path('barcode-labels/', BarcodeLabelsAPIView.as_view(), name='barcode-labels'),
     path('employees/', EmployeeListCreateAPIView.as_view(), name='employee-list-create'),
     path('employees/<int:id>/', EmployeeRetrieveUpdateDeleteAPIView.as_view(), name='employee-retrieve-update-delete'),
     path('quality-checks/', QualityCheckListAPIView.as_view(), name='quality-check-list'),
     path('quality-checks/assign/', QualityCheckCreateAPIView.as_view(), name='quality-check-assign'),
+    path('quality-checks/batch-assign/', QualityCheckBatchAssignAPIView.as_view(), name='quality-check-batch-assign'),
+    path('quality-checks/analytics/', QualityCheckAnalyticsAPIView.as_view(), name='quality-check-analytics'),
+    path('quality-checks/queue/', QualityCheckQueueAPIView.as_view(), name='quality-check-queue'),
+    path('quality-checks/queue/claim/', QualityCheckClaimAPIView.as_view(), name='quality-check-claim'),
+    path('quality-checks/queue/renew/', QualityCheckRenewAPIView.as_view(), name='quality-check-renew'),
+    path('quality-checks/batch-decide/', QualityCheckBatchDecisionAPIView.as_view(), name='quality-check-batch-decide'),
     path('assign-to-stock/', AssignToStock.as_view(), name='assign-to-stock'),
     path('assign-to-purchase/', AssignToPurchase.as_view(), name='assign-to-purchase'),
+    path('inventory-at/', InventoryAtAPIView.as_view(), name='inventory-at'),
+    path('scan-lookup/', ScanLookupAPIView.as_view(), name='scan-lookup'),
+    path('stock-takes/', StockTakeSessionAPIView.as_view(), name='stock-take-list'),
+    path('stock-takes/<int:session_id>/scans/', StockTakeScanAPIView.as_view(), name='stock-take-scans'),
+    path('stock-takes/<int:session_id>/report/', StockTakeReportAPIView.as_view(), name='stock-take-report'),
+    path('stock-takes/<int:session_id>/close/', StockTakeCloseAPIView.as_view(), name='stock-take-close'),
 ]
@@ -1,17 +1,36 @@
 from rest_framework import generics, permissions, status
-from .models import Memo, MemoDetail, QualityCheck
-from .serializers import MemoSerializer, MemoDetailSerializer, EmployeeSerializer, QualityCheckSerializer, ProductVariantSerializer
+from .models import Memo, MemoDetail, QualityCheck, StockTakeSession
+from .ledger import inventory_at
+from .analytics import QC_GROUP_FIELDS, qc_breakdown
+from .labels import barcode_payload, ensure_barcode, label_sheets, label_text
+from .listing import ListingUnavailable, listing_page, preferred_encoding
+from .memo_pdf import BATCH_PROGRESS_TIMEOUT, batch_progress_key, ensure_memo_pdf, merged_memo_pdf, stale_memo_ids
+from .memos import MemoImportError, create_memo, read_memo_sheet
+from .quality import ALREADY_APPROVED, APPROVED, DECISIONS, NO_VARIANT, NOT_FOUND, REJECTED, assign_quality_checks, decide_quality_checks
+from .qc_queue import claim_quality_checks, queue_metrics, renew_leases
+from .scanning import clean_codes, reconcile, record_scans, resolve_codes
+from .tasks import generate_memo_pdf, render_memo_batch
+from .serializers import MemoSerializer, MemoDetailSerializer, EmployeeSerializer, QualityCheckSerializer, StockTakeSessionSerializer
 from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from django.shortcuts import get_object_or_404
 from product.models import ProductVariant, Product, Employee
-from django.http import FileResponse
-from barcode.writer import ImageWriter
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.http import FileResponse, HttpResponse
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags
+from django.utils.dateparse import parse_date, parse_datetime
+from datetime import datetime, time, timedelta
+from openpyxl.utils.exceptions import InvalidFileException
 from users.models import User
-import barcode
-import io
-import json
+import zipfile
 
 
 class MemoAPIView(APIView):
@@ -20,31 +39,44 @@ class MemoAPIView(APIView):
     def post(self, request):
         serializer = MemoSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save(
+            memo = serializer.save(
                 created_by = self.request.user,
                 updated_by = self.request.user
             )
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+            # Reloaded with its totals and lines in three queries instead of a few per line
+            memo = Memo.objects.with_totals().with_details().get(pk=memo.pk)
+            return Response(MemoSerializer(memo).data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     def get(self, request, memo_id=None):
+        memos = Memo.objects.with_totals().with_details()
         if memo_id:
-            memo = Memo.objects.prefetch_related('memo_detail').get(id=memo_id)
+            memo = get_object_or_404(memos, id=memo_id)
             serializer = MemoSerializer(memo)
             return Response(serializer.data)
-        
-        memos = Memo.objects.prefetch_related('memo_detail').all()
-        serializer = MemoSerializer(memos, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+
+        # Pagination setup
+        paginator = PageNumberPagination()
+        paginator.page_size = settings.PAGE_LIMIT
+
+        # Totals and QC flags are computed by the page queries, not per memo
+        paginated_memos = paginator.paginate_queryset(memos.order_by('-id'), request)
+        serializer = MemoSerializer(paginated_memos, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
     def put(self, request, memo_id):
         memo = Memo.objects.get(id=memo_id)
         serializer = MemoSerializer(memo, data=request.data, partial=True)
         if serializer.is_valid():
-            serializer.save(
+            memo = serializer.save(
                 updated_by = self.request.user
             )
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            # The printed memo is a new version
+            transaction.on_commit(lambda: generate_memo_pdf.delay(memo.pk))
+
+            # Reloaded like the POST response, not a query per line
+            memo = Memo.objects.with_totals().with_details().get(pk=memo.pk)
+            return Response(MemoSerializer(memo).data, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     def delete(self, request, memo_id):
@@ -53,6 +85,37 @@ class MemoAPIView(APIView):
         return Response({"message": "Memo deleted successfully"}, status=status.HTTP_204_NO_CONTENT)
 
 
+class MemoImportAPIView(APIView):
+    """
+    Creates a memo from a supplier spreadsheet (.xlsx `file`, one row per
+    piece) with the memo fields as form data. Nothing is saved unless every
+    row resolves to a variant.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def post(self, request):
+        file = request.FILES.get('file', None)
+        if not file:
+            return Response({"error": "An .xlsx file is required."}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Only the memo fields, the lines come from the sheet
+        serializer = MemoSerializer(data=request.data, partial=True)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            product_variant_ids = read_memo_sheet(file)
+        except MemoImportError as e:
+            return Response({"error": "The sheet could not be imported.", "rows": e.errors}, status=status.HTTP_400_BAD_REQUEST)
+        except (InvalidFileException, zipfile.BadZipFile, KeyError):
+            return Response({"error": "The file is not a valid .xlsx spreadsheet."}, status=status.HTTP_400_BAD_REQUEST)
+
+        # The sheet is fully read before the transaction opens
+        memo = create_memo(product_variant_ids, user=self.request.user, **serializer.validated_data)
+        memo = Memo.objects.with_totals().with_details().get(pk=memo.pk)
+        return Response(MemoSerializer(memo).data, status=status.HTTP_201_CREATED)
+
+
 class MemoDetailAPIView(generics.ListAPIView):
     permission_classes = [permissions.IsAdminUser]
     serializer_class = MemoDetailSerializer
@@ -62,38 +125,117 @@ class MemoDetailAPIView(generics.ListAPIView):
         memo = get_object_or_404(Memo, id=memo_id)
         
         # Filter MemoDetail objects by the specified memo
-        memo_details = MemoDetail.objects.filter(memo=memo)
+        memo_details = MemoDetail.objects.with_qc().select_related('product_variant').filter(memo=memo).order_by('id')
         serializer = self.get_serializer(memo_details, many=True)
         
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
+class MemoPDFAPIView(APIView):
+    """The printable memo (jangad) with its lines and totals."""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, memo_id):
+        memo = get_object_or_404(Memo, id=memo_id)
+
+        # Render only if the worker has not stored the current version yet
+        ensure_memo_pdf(memo)
+        return FileResponse(memo.pdf_file.open('rb'), as_attachment=True, filename=f"memo_{memo.jangad_number or memo.pk}.pdf")
+
+
+class MemoBatchPDFAPIView(APIView):
+    """
+    Every memo created on `date` (YYYY-MM-DD) in one PDF. While some of their
+    PDFs are outdated, a worker renders them and the response is 202 with the progress.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        date = request.query_params.get('date', None)
+        if not date:
+            return Response({"error": "date is required."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            date_obj = datetime.strptime(date, '%Y-%m-%d').date()
+        except ValueError:
+            return Response({"error": "Invalid date format. Please use YYYY-MM-DD."}, status=status.HTTP_400_BAD_REQUEST)
+
+        memos = list(Memo.objects.filter(created_at__date=date_obj).order_by('id'))
+        if not memos:
+            return Response({"error": "No memos were created on this date."}, status=status.HTTP_404_NOT_FOUND)
+
+        # Outdated PDFs are rendered by a worker, the client polls until they are all stored
+        stale = stale_memo_ids(memos)
+        if stale:
+            progress_key = batch_progress_key(stale)
+            progress = {'status': 'rendering', 'done': 0, 'total': len(stale)}
+            previous = cache.get(progress_key)
+            if previous is None:
+                # Only the first of concurrent requests starts the render
+                if cache.add(progress_key, progress, timeout=BATCH_PROGRESS_TIMEOUT):
+                    render_memo_batch.delay(stale, progress_key)
+            elif previous['status'] == 'ready':
+                # The last run finished but left some of these memos outdated
+                cache.set(progress_key, progress, timeout=BATCH_PROGRESS_TIMEOUT)
+                render_memo_batch.delay(stale, progress_key)
+            else:
+                progress = previous
+            response = Response(
+                dict(progress, message="Memo PDFs are being rendered, try again shortly."),
+                status=status.HTTP_202_ACCEPTED,
+            )
+            response['Retry-After'] = '10'
+            return response
+
+        return FileResponse(merged_memo_pdf(memos), as_attachment=True, filename=f"memos_{date_obj.isoformat()}.pdf", content_type='application/pdf')
+
+
 class GenerateBarcodeAPIView(APIView):
     permission_classes = [permissions.IsAdminUser]
 
     def post(self, request, id):
         # Fetch the product variant using the given ID
-        product_variant = get_object_or_404(ProductVariant, pk=id, status=ProductVariant.ACTIVE)
+        product_variant = get_object_or_404(ProductVariant.objects.select_related('product'), pk=id, product__status=Product.ACTIVE)
 
-        # Construct the data as a dictionary for JSON formatting
-        barcode_data = {
-            "Code": product_variant.product_color.product.code,
-        }
+        # Rendered once per content, later requests read the cached image
+        path = ensure_barcode(barcode_payload(product_variant))
 
-        # Convert the dictionary to a JSON string
-        barcode_data_json = json.dumps(barcode_data, separators=(',', ':'))
+        # Return the barcode image as a response
+        return FileResponse(default_storage.open(path, 'rb'), as_attachment=True, filename=f"{product_variant.product.code}-barcode.png", content_type='image/png')
 
-        # Generate the barcode with JSON data
-        barcode_class = barcode.get_barcode_class('code128')
-        barcode_instance = barcode_class(barcode_data_json, writer=ImageWriter())
 
-        # Customize the writer to remove the text
-        buffer = io.BytesIO()
-        barcode_instance.write(buffer, options={'write_text': False})
-        buffer.seek(0)
+class BarcodeLabelsAPIView(APIView):
+    """
+    Printable A4 sheets of barcode labels, one label per entry of
+    `product_variant_ids` (repeat an ID for more copies) or per line of `memo_id`.
+    """
+    permission_classes = [permissions.IsAdminUser]
 
-        # Return the barcode image as a response
-        return FileResponse(buffer, as_attachment=True, filename=f"{product_variant.product_color.product.code}-barcode.png", content_type='image/png')
+    def post(self, request):
+        memo_id = request.data.get('memo_id', None)
+        product_variant_ids = request.data.get('product_variant_ids', None)
+
+        if memo_id:
+            memo = get_object_or_404(Memo, pk=memo_id)
+            variant_ids = list(MemoDetail.objects.filter(memo=memo).order_by('id').values_list('product_variant_id', flat=True))
+            filename = f"{memo.jangad_number}-labels.pdf"
+        elif isinstance(product_variant_ids, list) and product_variant_ids:
+            try:
+                variant_ids = [int(variant_id) for variant_id in product_variant_ids]
+            except (TypeError, ValueError):
+                return Response({"error": "product_variant_ids must be a list of IDs."}, status=status.HTTP_400_BAD_REQUEST)
+            filename = "barcode-labels.pdf"
+        else:
+            return Response({"error": "Either memo_id or product_variant_ids is required."}, status=status.HTTP_400_BAD_REQUEST)
+
+        variants = ProductVariant.objects.select_related('product').in_bulk(variant_ids)
+        missing = sorted(set(variant_ids) - set(variants))
+        if missing:
+            return Response({"error": f"Product variants not found: {missing}"}, status=status.HTTP_400_BAD_REQUEST)
+        if not variant_ids:
+            return Response({"error": "The memo has no lines."}, status=status.HTTP_400_BAD_REQUEST)
+
+        labels = [(barcode_payload(variants[variant_id]), label_text(variants[variant_id])) for variant_id in variant_ids]
+        return FileResponse(label_sheets(labels), as_attachment=True, filename=filename, content_type='application/pdf')
 
 
 class EmployeeListCreateAPIView(APIView):
@@ -169,69 +311,176 @@ class QualityCheckCreateAPIView(APIView):
         except (Employee.DoesNotExist, User.DoesNotExist):
             return Response({"error": "Invalid employee or sender."}, status=status.HTTP_404_NOT_FOUND)
 
-        qc_records = []
-
         if memo_id:
-            memo_details = MemoDetail.objects.filter(memo_id=memo_id)
-            for detail in memo_details:
-                qc = QualityCheck(
-                    memo_detail_id=detail.id,
-                    sender=sender,
-                    assigned_employee=assigned_employee,
-                    qc_status = QualityCheck.INPROCESS,
-                )
-                qc_records.append(qc)
-                detail.qc_employee = assigned_employee
-                detail.save()
-            Memo.objects.filter(id=memo_id).update(qc_employee=assigned_employee)
-
+            qc_records, outcomes = assign_quality_checks(sender, assigned_employee, memo_ids=[memo_id])
         elif memo_detail_id:
-            try:
-                memo_detail = MemoDetail.objects.get(id=memo_detail_id)
-                qc = QualityCheck(
-                    memo_detail_id=memo_detail.id,
-                    sender=sender,
-                    assigned_employee=assigned_employee,
-                    qc_status = QualityCheck.INPROCESS
-                )
-                qc_records.append(qc)
-                memo_detail.qc_employee = assigned_employee
-                memo_detail.save()
-            except MemoDetail.DoesNotExist:
+            qc_records, outcomes = assign_quality_checks(sender, assigned_employee, memo_detail_ids=[memo_detail_id])
+            if not qc_records:
                 return Response({"error": "MemoDetail not found."}, status=status.HTTP_404_NOT_FOUND)
-
         elif variant_id:
-            try:
-                product_variant = ProductVariant.objects.get(id=variant_id)
-                qc = QualityCheck(
-                    product_variant=product_variant,
-                    sender=sender,
-                    assigned_employee=assigned_employee,
-                    qc_status = QualityCheck.INPROCESS
-                )
-                qc_records.append(qc)
-                product_variant.qc_employee = assigned_employee
-                product_variant.qc_status = QualityCheck.INPROCESS
-                product_variant.save()
-            except:
+            qc_records, outcomes = assign_quality_checks(sender, assigned_employee, variant_ids=[variant_id])
+            if not qc_records:
                 return Response({"error": "Product variant not found."}, status=status.HTTP_404_NOT_FOUND)
         else:
             return Response({"error": "Either memo_id or memo_detail_id is required."}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Bulk create records
-        QualityCheck.objects.bulk_create(qc_records)
-
+        qc_records = QualityCheck.objects.with_details().filter(id__in=[record.id for record in qc_records]).order_by('id')
         serializer = QualityCheckSerializer(qc_records, many=True)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
+class QualityCheckBatchAssignAPIView(APIView):
+    """Assigns the lines of `memo_ids`, the `memo_detail_ids` and the `variant_ids` to one QC employee."""
+    permission_classes = [permissions.IsAdminUser]
+
+    def post(self, request):
+        assigned_employee_id = request.data.get("assigned_employee_id", None)
+        if not assigned_employee_id:
+            return Response({"error": "Assigned employee is required."}, status=status.HTTP_400_BAD_REQUEST)
+        assigned_employee = get_object_or_404(Employee, id=assigned_employee_id)
+
+        try:
+            ids = {
+                key: [int(pk) for pk in request.data.get(key, None) or []]
+                for key in ('memo_ids', 'memo_detail_ids', 'variant_ids')
+            }
+        except (TypeError, ValueError):
+            return Response({"error": "memo_ids, memo_detail_ids and variant_ids must be lists of IDs."}, status=status.HTTP_400_BAD_REQUEST)
+        if not any(ids.values()):
+            return Response({"error": "Either memo_ids, memo_detail_ids or variant_ids is required."}, status=status.HTTP_400_BAD_REQUEST)
+
+        qc_records, outcomes = assign_quality_checks(self.request.user, assigned_employee, **ids)
+        return Response({"assigned": len(qc_records), "results": outcomes}, status=status.HTTP_200_OK)
+
+
+class QualityCheckBatchDecisionAPIView(APIView):
+    """Approves into stock or rejects (with `defect_notes`) every QC record of `qc_ids` at once."""
+    permission_classes = [permissions.IsAdminUser]
+
+    def post(self, request):
+        decision = request.data.get("decision", None)
+        if decision not in DECISIONS:
+            return Response({"error": f"decision must be one of {', '.join(DECISIONS)}."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            qc_ids = [int(pk) for pk in request.data.get("qc_ids", None) or []]
+        except (TypeError, ValueError):
+            return Response({"error": "qc_ids must be a list of IDs."}, status=status.HTTP_400_BAD_REQUEST)
+        if not qc_ids:
+            return Response({"error": "qc_ids is required."}, status=status.HTTP_400_BAD_REQUEST)
+
+        results = decide_quality_checks(qc_ids, decision, user=self.request.user, defect_notes=request.data.get("defect_notes", ""))
+        decided = sum(1 for result in results if result['outcome'] in (APPROVED, REJECTED))
+        return Response({"decided": decided, "results": results}, status=status.HTTP_200_OK)
+
+
 class QualityCheckListAPIView(APIView):
     permission_classes = [permissions.IsAdminUser]
 
     def get(self, request):
-        qc_records = QualityCheck.objects.all()
+        # Senders, inspectors and memo lines are loaded per page, not per record
+        qc_records = QualityCheck.objects.with_details().order_by('-id')
+        qc_status = request.query_params.get('qc_status', None)
+        if qc_status:
+            qc_records = qc_records.filter(qc_status=qc_status)
+
+        # Pagination setup
+        paginator = PageNumberPagination()
+        paginator.page_size = settings.PAGE_LIMIT
+
+        paginated_records = paginator.paginate_queryset(qc_records, request)
+        serializer = QualityCheckSerializer(paginated_records, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+
+class QualityCheckAnalyticsAPIView(APIView):
+    """
+    QC throughput, reject rate and queue and inspection times between
+    start_date and end_date, grouped by employee, product_brand or product_type.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        start_date = request.query_params.get('start_date', None)
+        end_date = request.query_params.get('end_date', None)
+        group_by = request.query_params.get('group_by', 'employee')
+
+        if not start_date or not end_date:
+            return Response({"error": "Both start_date and end_date are required."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            start_date_obj = datetime.strptime(start_date, '%Y-%m-%d').date()
+            end_date_obj = datetime.strptime(end_date, '%Y-%m-%d').date()
+        except ValueError:
+            return Response({"error": "Invalid date format. Please use YYYY-MM-DD."}, status=status.HTTP_400_BAD_REQUEST)
+        if end_date_obj < start_date_obj:
+            return Response({"error": "end_date must not be before start_date."}, status=status.HTTP_400_BAD_REQUEST)
+        if group_by not in QC_GROUP_FIELDS:
+            return Response({"error": f"group_by must be one of {', '.join(QC_GROUP_FIELDS)}."}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(qc_breakdown(start_date_obj, end_date_obj, group_by), status=status.HTTP_200_OK)
+
+
+class QualityCheckQueueAPIView(APIView):
+    """
+    Pull-based QC queue. GET reports its depth, age and leases, POST queues the
+    lines of `memo_ids`, the `memo_detail_ids` and the `variant_ids` for the
+    inspectors to claim.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(queue_metrics(), status=status.HTTP_200_OK)
+
+    def post(self, request):
+        try:
+            ids = {
+                key: [int(pk) for pk in request.data.get(key, None) or []]
+                for key in ('memo_ids', 'memo_detail_ids', 'variant_ids')
+            }
+        except (TypeError, ValueError):
+            return Response({"error": "memo_ids, memo_detail_ids and variant_ids must be lists of IDs."}, status=status.HTTP_400_BAD_REQUEST)
+        if not any(ids.values()):
+            return Response({"error": "Either memo_ids, memo_detail_ids or variant_ids is required."}, status=status.HTTP_400_BAD_REQUEST)
+
+        qc_records, outcomes = assign_quality_checks(self.request.user, None, **ids)
+        return Response({"queued": len(qc_records), "results": outcomes}, status=status.HTTP_201_CREATED)
+
+
+class QualityCheckClaimAPIView(APIView):
+    """Hands the oldest `count` queued checks to the inspector `employee_id` under a lease."""
+    permission_classes = [permissions.IsAdminUser]
+
+    def post(self, request):
+        employee_id = request.data.get("employee_id", None)
+        if not employee_id:
+            return Response({"error": "employee_id is required."}, status=status.HTTP_400_BAD_REQUEST)
+        employee = get_object_or_404(Employee, id=employee_id)
+
+        try:
+            count = int(request.data.get("count", 1))
+        except (TypeError, ValueError):
+            return Response({"error": "count must be a number."}, status=status.HTTP_400_BAD_REQUEST)
+        if not 1 <= count <= settings.QC_CLAIM_MAX:
+            return Response({"error": f"count must be between 1 and {settings.QC_CLAIM_MAX}."}, status=status.HTTP_400_BAD_REQUEST)
+
+        claimed_ids = claim_quality_checks(employee, count)
+        qc_records = QualityCheck.objects.with_details().filter(id__in=claimed_ids).order_by('created_at', 'id')
         serializer = QualityCheckSerializer(qc_records, many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+class QualityCheckRenewAPIView(APIView):
+    """Extends the leases inspector `employee_id` holds on `qc_ids` while they are still being checked."""
+    permission_classes = [permissions.IsAdminUser]
+
+    def post(self, request):
+        employee = get_object_or_404(Employee, id=request.data.get("employee_id", None) or 0)
+        try:
+            qc_ids = [int(pk) for pk in request.data.get("qc_ids", None) or []]
+        except (TypeError, ValueError):
+            return Response({"error": "qc_ids must be a list of IDs."}, status=status.HTTP_400_BAD_REQUEST)
+
+        renewed = renew_leases(employee, qc_ids)
+        return Response({"renewed": renewed, "lost": len(set(qc_ids)) - renewed}, status=status.HTTP_200_OK)
     
 class AssignToStock(APIView):
     """
@@ -246,42 +495,19 @@ class AssignToStock(APIView):
         if not qc_id:
             return Response({"error": "QC ID is required."}, status=status.HTTP_400_BAD_REQUEST)
 
-        try:
-            # Fetch the QualityCheck instance
-            quality_check = QualityCheck.objects.get(id=qc_id)
-            if quality_check.qc_status == ProductVariant.APPROVED:
-                return Response({"error": "Already Approved with this QC."}, status=status.HTTP_400_BAD_REQUEST)
-
-            try:
-                product_variant = quality_check.memo_detail.product_variant
-                quality_check.memo_detail.qc_status = ProductVariant.APPROVED
-                quality_check.memo_detail.save()
-            except:
-                product_variant = quality_check.product_variant
-
-            if not product_variant:
-                return Response({"error": "No Product Variant associated with this QC."}, status=status.HTTP_400_BAD_REQUEST)
-
-            # Update the `is_stock` field of the ProductVariant
-            product_variant.is_stock = True
-            product_variant.updated_by = self.request.user
-            product_variant.qc_status = ProductVariant.APPROVED
-            product_variant.save()
-            quality_check.qc_status = ProductVariant.APPROVED
-            quality_check.save()
-
-            # Delete the QC List
-            # quality_check.delete()
-
-            return Response(
-                {"message": f"Product Variant {product_variant.product.code} marked as stock."},
-                status=status.HTTP_200_OK
-            )
-
-        except QualityCheck.DoesNotExist:
+        # Update the `is_stock` field of the ProductVariant, the approved units are received into stock
+        result = decide_quality_checks([qc_id], QualityCheck.APPROVED, user=self.request.user)[0]
+        if result['outcome'] == NOT_FOUND:
             return Response({"error": "QualityCheck not found."}, status=status.HTTP_404_NOT_FOUND)
-        except Exception as e:
-            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        if result['outcome'] == ALREADY_APPROVED:
+            return Response({"error": "Already Approved with this QC."}, status=status.HTTP_400_BAD_REQUEST)
+        if result['outcome'] == NO_VARIANT:
+            return Response({"error": "No Product Variant associated with this QC."}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(
+            {"message": f"Product Variant {result['product_code']} marked as stock."},
+            status=status.HTTP_200_OK
+        )
 
 class AssignToPurchase(APIView):
     permission_classes = [permissions.IsAdminUser]
@@ -293,50 +519,215 @@ class AssignToPurchase(APIView):
         if not qc_id:
             return Response({"error": "QC ID is required."}, status=status.HTTP_400_BAD_REQUEST)
 
+        # Update the ProductVariant notes and QC flag, rejected variants leave stock
+        result = decide_quality_checks([qc_id], QualityCheck.REJECTED, user=self.request.user, defect_notes=defect_notes)[0]
+        if result['outcome'] == NOT_FOUND:
+            return Response({"error": "QualityCheck not found."}, status=status.HTTP_404_NOT_FOUND)
+        if result['outcome'] == ALREADY_APPROVED:
+            return Response({"error": "Already Approved with this QC."}, status=status.HTTP_400_BAD_REQUEST)
+        if result['outcome'] == NO_VARIANT:
+            return Response({"error": "ProductVariant not found."}, status=status.HTTP_404_NOT_FOUND)
+
+        return Response(
+            {"message": "ProductVariant updated successfully.", "product_variant_id": result['product_variant']},
+            status=status.HTTP_200_OK,
+        )
+
+class ProductVariantsInStock(APIView):
+    """
+    Public listing of the variants in stock, PAGE_LIMIT per `?page=`. Pages are
+    pre-rendered and pre-compressed in the cache and re-rendered in the
+    background when stock changes, so proxies may keep them for
+    STOCK_LISTING_MAX_AGE seconds.
+    """
+    permission_classes = [permissions.AllowAny]
+    # The same for every caller, credentials are not read so the response never varies on them
+    authentication_classes = []
+    renderer_classes = [JSONRenderer]
+
+    def get(self, request):
+        try:
+            page = int(request.query_params.get('page', 1))
+        except (TypeError, ValueError):
+            page = 0
         try:
-            # Fetch the QualityCheck instance
-            quality_check = QualityCheck.objects.get(id=qc_id)
-            if quality_check.qc_status == ProductVariant.APPROVED:
-                return Response({"error": "Already Approved with this QC."}, status=status.HTTP_400_BAD_REQUEST)
-            
+            entry = listing_page(page) if page >= 1 else None
+        except ListingUnavailable as e:
+            response = Response({"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            response['Retry-After'] = '1'
+            return response
+        if entry is None:
+            return Response({"error": "Invalid page."}, status=status.HTTP_404_NOT_FOUND)
+
+        encoding = preferred_encoding(request.META.get('HTTP_ACCEPT_ENCODING'))
+        # Pages rendered by a request while the published one was missing are not compressed
+        if encoding not in entry:
+            encoding = 'identity'
+        # Each encoding is a different representation and gets its own strong ETag
+        etag = f'"{entry["etag"]}"' if encoding == 'identity' else f'"{entry["etag"]}-{encoding}"'
+
+        if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = HttpResponse(entry[encoding], content_type='application/json')
+            if encoding != 'identity':
+                response['Content-Encoding'] = encoding
+        response['ETag'] = etag
+        patch_vary_headers(response, ['Accept-Encoding'])
+        patch_cache_control(response, public=True, max_age=settings.STOCK_LISTING_MAX_AGE)
+        return response
+
+
+class InventoryAtAPIView(APIView):
+    """
+    Units and value held per variant at a point in time (`?at=` ISO datetime,
+    or a date for the end of that day), optionally for `?product_variant=` IDs.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        at = request.query_params.get('at', None)
+        if not at:
+            moment = timezone.now()
+        else:
             try:
-                product_variant = quality_check.memo_detail.product_variant
-                quality_check.memo_detail.qc_status = ProductVariant.REJECTED
-                quality_check.memo_detail.save()
-            except:
-                product_variant = quality_check.product_variant
-
-            if not product_variant:
-                return Response({"error": "ProductVariant not found."}, status=status.HTTP_404_NOT_FOUND)
-
-            # Update the ProductVariant notes and QC flag
-            product_variant.notes = defect_notes
-            product_variant.is_stock = False
-            product_variant.save()
-
-            product_variant.is_stock = True
-            product_variant.updated_by = self.request.user
-            product_variant.qc_status = ProductVariant.REJECTED
-            product_variant.save()
-            quality_check.qc_status = ProductVariant.REJECTED
-            quality_check.save()
-
-            return Response(
-                {"message": "ProductVariant updated successfully.", "product_variant_id": product_variant.id},
-                status=status.HTTP_200_OK,
-            )
+                day = parse_date(at)
+            except ValueError:
+                day = None
+            if day:
+                moment = timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min)) - timedelta(microseconds=1)
+            else:
+                moment = parse_datetime(at)
+                if moment is None:
+                    return Response({"error": "Invalid date format. Use YYYY-MM-DD or an ISO datetime."}, status=status.HTTP_400_BAD_REQUEST)
+                if timezone.is_naive(moment):
+                    moment = timezone.make_aware(moment)
+
+        product_variant_ids = None
+        if request.query_params.get('product_variant'):
+            try:
+                product_variant_ids = [int(pk) for pk in request.query_params.get('product_variant').split(',')]
+            except ValueError:
+                return Response({"error": "product_variant must be a comma separated list of IDs."}, status=status.HTTP_400_BAD_REQUEST)
+
+        snapshot_at, balances = inventory_at(moment, product_variant_ids)
+        codes = dict(ProductVariant.objects.filter(id__in=balances.keys()).values_list('id', 'product__code'))
+        items = [
+            {'product_variant': product_variant_id, 'code': codes.get(product_variant_id), 'quantity': quantity, 'value': round(value, 2)}
+            for product_variant_id, (quantity, value) in sorted(balances.items())
+            if quantity or value
+        ]
+        return Response({
+            'at': moment,
+            'snapshot_at': snapshot_at,
+            'total_quantity': sum(item['quantity'] for item in items),
+            'total_value': round(sum(item['value'] for item in items), 2),
+            'items': items,
+        }, status=status.HTTP_200_OK)
+
+
+class ScanLookupAPIView(APIView):
+    """Resolves scanned barcodes to variants, `?code=` for one scan or a POSTed `codes` list for a batch."""
+    permission_classes = [permissions.IsAdminUser]
 
-        except QualityCheck.DoesNotExist:
-            return Response({"error": "QualityCheck not found."}, status=status.HTTP_404_NOT_FOUND)
+    def lookup(self, codes):
+        resolved = resolve_codes(codes)
+        variants = ProductVariant.objects.select_related('product').in_bulk({variant_id for variant_id in resolved.values() if variant_id})
+        results = []
+        for code in codes:
+            product_variant = variants.get(resolved[code])
+            results.append({
+                'code': code,
+                'product_variant': product_variant.id if product_variant else None,
+                'product_code': product_variant.product.code if product_variant else None,
+                'carat': product_variant.carat if product_variant else None,
+                'is_stock': product_variant.is_stock if product_variant else None,
+            })
+        return results
+
+    def get(self, request):
+        codes = clean_codes([request.query_params.get('code', None)])
+        if not codes:
+            return Response({"error": "code is required."}, status=status.HTTP_400_BAD_REQUEST)
+        result = self.lookup(codes)[0]
+        if result['product_variant'] is None:
+            return Response({"error": "No product variant has this barcode."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(result, status=status.HTTP_200_OK)
+
+    def post(self, request):
+        codes = request.data.get('codes', None)
+        if not isinstance(codes, list):
+            return Response({"error": "codes must be a list."}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(self.lookup(clean_codes(codes)), status=status.HTTP_200_OK)
 
-class ProductVariantsInStock(APIView):
-    permission_classes = [permissions.AllowAny]  # Adjust permissions as needed
+
+class StockTakeSessionAPIView(APIView):
+    permission_classes = [permissions.IsAdminUser]
 
     def get(self, request):
-        # Filter product variants with is_stock=True
-        in_stock_variants = ProductVariant.objects.filter(is_stock=True)
+        sessions = StockTakeSession.objects.order_by('-id')
+
+        # Pagination setup
+        paginator = PageNumberPagination()
+        paginator.page_size = settings.PAGE_LIMIT
 
-        # Serialize the data
-        serializer = ProductVariantSerializer(in_stock_variants, many=True)
+        paginated_sessions = paginator.paginate_queryset(sessions, request)
+        serializer = StockTakeSessionSerializer(paginated_sessions, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    def post(self, request):
+        serializer = StockTakeSessionSerializer(data=request.data)
+        if serializer.is_valid():
+            serializer.save(
+                created_by = self.request.user,
+                updated_by = self.request.user
+            )
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class StockTakeScanAPIView(APIView):
+    """Adds a batch of scanned `codes` to an open stock take."""
+    permission_classes = [permissions.IsAdminUser]
+
+    def post(self, request, session_id):
+        session = get_object_or_404(StockTakeSession, pk=session_id)
+        if session.status != StockTakeSession.OPEN:
+            return Response({"error": "This stock take is closed."}, status=status.HTTP_400_BAD_REQUEST)
+
+        codes = request.data.get('codes', None)
+        if not isinstance(codes, list) or not codes:
+            return Response({"error": "codes must be a non-empty list."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(codes) > settings.STOCK_TAKE_BATCH_LIMIT:
+            return Response({"error": f"At most {settings.STOCK_TAKE_BATCH_LIMIT} codes per batch."}, status=status.HTTP_400_BAD_REQUEST)
+
+        scanned, unknown = record_scans(session, codes, user=self.request.user)
+        return Response({'scanned': scanned, 'unknown': unknown}, status=status.HTTP_201_CREATED)
+
+
+class StockTakeReportAPIView(APIView):
+    """Found, missing and unexpected variants of a stock take, against the stock as it is now."""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, session_id):
+        session = get_object_or_404(StockTakeSession, pk=session_id)
+        return Response(reconcile(session), status=status.HTTP_200_OK)
+
+
+class StockTakeCloseAPIView(APIView):
+    """Closes a stock take, no more scans are accepted and its counts are kept."""
+    permission_classes = [permissions.IsAdminUser]
 
-        return Response(serializer.data, status=status.HTTP_200_OK)
\ No newline at end of file
+    def post(self, request, session_id):
+        with transaction.atomic():
+            session = get_object_or_404(StockTakeSession.objects.select_for_update(), pk=session_id)
+            if session.status != StockTakeSession.OPEN:
+                return Response({"error": "This stock take is already closed."}, status=status.HTTP_400_BAD_REQUEST)
+
+            report = reconcile(session)
+            session.status = StockTakeSession.CLOSED
+            session.closed_at = timezone.now()
+            session.summary = {key: value for key, value in report.items() if not isinstance(value, list)}
+            session.updated_by = self.request.user
+            session.save()
+        return Response(report, status=status.HTTP_200_OK)